@@ -0,0 +1,318 @@
+# aggregates.py
+"""
+Persistent per-recipe and per-user counters in outputs/aggregates/counters.sqlite:
+views, likes, attempts, rating_sum, rating_count, engagement (all
+interactions), first_seen and last_seen (epoch seconds), keyed by recipe_id
+and by user_id, plus the interaction history itself (interaction_id,
+recipe_id, user_id, type, rating, ts_epoch) indexed by (user_id, ts_epoch)
+for per-user lookups (see query_api.py).
+
+The store remembers how far into outputs/csv/interactions.csv it has read.
+Each refresh() only reads the rows appended since then (transform keeps
+earlier rows in order, and incremental exports append), aggregates them and
+upserts the deltas, so its cost depends on the new events, not on the
+history. The store also keeps a SHA-256 of the bytes it has applied and
+rebuilds from scratch when the file no longer starts with them, so any
+rewritten history (a full-refresh export that inserted documents or changed
+a rating) is caught. --rebuild forces that.
+
+That check does not re-read the history: the transform, which writes the
+whole file anyway, records the SHA-256 of the file up to the store's offset
+and of the whole file (mark_digests(), in outputs/aggregates/
+interactions.marks.json, tied to the file's size and mtime). A refresh
+compares against those. Only a file the transform did not write (or that
+changed after it) is re-hashed in full to check it.
+
+analytics.py and insights.py read their recipe/user metrics from here
+instead of scanning interactions.
+"""
+import os
+import json
+import hashlib
+import sqlite3
+import argparse
+import numpy as np
+import pandas as pd
+import id_dictionary
+import metrics
+
+CSV_DIR = os.path.join("outputs", "csv")
+STORE_PATH = os.path.join("outputs", "aggregates", "counters.sqlite")
+SCHEMA_VERSION = "2"
+CHUNK_SIZE = 1_000_000
+HASH_BLOCK = 1 << 20
+MARKS_NAME = "interactions.marks.json"
+LOCK_TIMEOUT = 600  # seconds a refresh waits for another one to finish
+
+COUNTERS = ["views", "likes", "attempts", "rating_sum", "rating_count", "engagement"]
+TYPE_COUNTERS = {"view": "views", "like": "likes", "attempt": "attempts"}
+KEYS = {"recipe": "recipe_id", "user": "user_id"}
+HISTORY_COLUMNS = ["interaction_id", "recipe_id", "user_id", "type", "rating", "ts_epoch"]
+
+
+def connect(path=STORE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Transactions are explicit (see refresh); statements outside one autocommit
+    conn = sqlite3.connect(path, timeout=LOCK_TIMEOUT, isolation_level=None)
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    for table, key in KEYS.items():
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table}_counters (
+                {key} TEXT PRIMARY KEY,
+                views INTEGER NOT NULL DEFAULT 0,
+                likes INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                rating_sum REAL NOT NULL DEFAULT 0,
+                rating_count INTEGER NOT NULL DEFAULT 0,
+                engagement INTEGER NOT NULL DEFAULT 0,
+                first_seen INTEGER,
+                last_seen INTEGER
+            )""")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history (
+            interaction_id TEXT,
+            recipe_id TEXT,
+            user_id TEXT,
+            type TEXT,
+            rating REAL,
+            ts_epoch INTEGER
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS history_user ON history (user_id, ts_epoch)")
+    return conn
+
+
+def _meta(conn):
+    return dict(conn.execute("SELECT key, value FROM meta"))
+
+
+def _hash_range(f, digest, start, end):
+    """Adds bytes [start, end) of `f` to `digest`; False when the file is shorter."""
+    f.seek(start)
+    remaining = end - start
+    while remaining:
+        block = f.read(min(HASH_BLOCK, remaining))
+        if not block:
+            return False
+        digest.update(block)
+        remaining -= len(block)
+    return True
+
+
+def _applied(meta, source):
+    """The stored offset into `source`, or None when the store holds nothing usable for it."""
+    if meta.get("schema") != SCHEMA_VERSION or meta.get("source") != os.path.abspath(source):
+        return None
+    return int(meta.get("offset", 0))
+
+
+def _marks_path(path):
+    return os.path.join(os.path.dirname(path), MARKS_NAME)
+
+
+def mark_digests(csv_dir=CSV_DIR, path=STORE_PATH):
+    """
+    Records the SHA-256 of interactions.csv up to the store's offset and of
+    the whole file, so the next refresh can check the history is unchanged
+    without reading it. Called by the transform right after it writes the file.
+    """
+    source = os.path.join(csv_dir, "interactions.csv")
+    offset = None
+    if os.path.exists(path):
+        conn = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        try:
+            offset = _applied(_meta(conn), source)
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+    st = os.stat(source)
+    marks, digest = {}, hashlib.sha256()
+    with open(source, "rb") as f:
+        if offset is not None and offset <= st.st_size:
+            _hash_range(f, digest, 0, offset)
+            marks[str(offset)] = digest.hexdigest()
+        _hash_range(f, digest, f.tell(), st.st_size)
+        marks[str(st.st_size)] = digest.hexdigest()
+    record = {"source": os.path.abspath(source), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "marks": marks}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(_marks_path(path), "w", encoding="utf-8") as out:
+        json.dump(record, out)
+
+
+def _load_marks(f, path):
+    """The digests mark_digests() recorded for `f`, if they still describe it ({offset: sha256})."""
+    try:
+        with open(_marks_path(path), encoding="utf-8") as marks_file:
+            record = json.load(marks_file)
+    except (OSError, ValueError):
+        return {}
+    st = os.fstat(f.fileno())
+    if (record.get("source"), record.get("size"), record.get("mtime_ns")) != \
+            (os.path.abspath(f.name), st.st_size, st.st_mtime_ns):
+        return {}
+    return record.get("marks", {})
+
+
+def _prefix_unchanged(meta, f, marks):
+    """Whether the first `offset` bytes of `f` are still the ones already applied."""
+    offset = _applied(meta, f.name)
+    if offset is None:
+        return False
+    if str(offset) in marks:
+        return marks[str(offset)] == meta.get("prefix_sha256")
+    # Not written by the transform (or changed since): hash the prefix itself
+    digest = hashlib.sha256()
+    return _hash_range(f, digest, 0, offset) and digest.hexdigest() == meta.get("prefix_sha256")
+
+
+# ---------------------------------------------------
+# DELTAS
+# ---------------------------------------------------
+
+def _columns(chunk):
+    """The per-row counter increments of a chunk of interaction rows, with their reductions."""
+    kind = chunk["type"].str.lower()
+    rating = pd.to_numeric(chunk["rating"], errors="coerce")
+    if "ts_epoch" in chunk.columns:
+        seen = pd.to_numeric(chunk["ts_epoch"], errors="coerce").to_numpy(dtype="float64")
+    else:
+        seen = np.full(len(chunk), np.nan)
+    return {
+        **{column: ((kind == t).to_numpy(dtype="int64"), "sum") for t, column in TYPE_COUNTERS.items()},
+        "rating_sum": (rating.fillna(0).to_numpy(dtype="float64"), "sum"),
+        "rating_count": (rating.notna().to_numpy(dtype="int64"), "sum"),
+        "engagement": (np.ones(len(chunk), dtype="int64"), "sum"),
+        "first_seen": (seen, "min"),
+        "last_seen": (seen, "max"),
+    }
+
+
+def _upsert(conn, table, key, delta):
+    def cell(v):
+        return None if pd.isna(v) else int(v)
+    rows = [(k, int(r.views), int(r.likes), int(r.attempts), float(r.rating_sum),
+             int(r.rating_count), int(r.engagement), cell(r.first_seen), cell(r.last_seen))
+            for k, r in zip(delta.index, delta.itertuples(index=False))]
+    conn.executemany(f"""
+        INSERT INTO {table}_counters ({key}, views, likes, attempts, rating_sum, rating_count,
+                                      engagement, first_seen, last_seen)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT({key}) DO UPDATE SET
+            views = views + excluded.views,
+            likes = likes + excluded.likes,
+            attempts = attempts + excluded.attempts,
+            rating_sum = rating_sum + excluded.rating_sum,
+            rating_count = rating_count + excluded.rating_count,
+            engagement = engagement + excluded.engagement,
+            first_seen = MIN(COALESCE(first_seen, excluded.first_seen), COALESCE(excluded.first_seen, first_seen)),
+            last_seen = MAX(COALESCE(last_seen, excluded.last_seen), COALESCE(excluded.last_seen, last_seen))
+        """, rows)
+
+
+def _append_history(conn, chunk):
+    rating = pd.to_numeric(chunk["rating"], errors="coerce")
+    seen = pd.to_numeric(chunk.get("ts_epoch", pd.Series(index=chunk.index, dtype=str)), errors="coerce")
+    rows = zip(chunk["interaction_id"], chunk["recipe_id"], chunk["user_id"], chunk["type"],
+               rating.astype(object).where(rating.notna(), None),
+               seen.astype("Int64").astype(object).where(seen.notna(), None))
+    conn.executemany("INSERT INTO history VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+
+def refresh(csv_dir=CSV_DIR, path=STORE_PATH, rebuild=False, chunk_size=CHUNK_SIZE):
+    """
+    Applies the interactions appended to interactions.csv since the last
+    refresh (everything after a rebuild). Returns the number of rows applied.
+    """
+    source = os.path.join(csv_dir, "interactions.csv")
+    conn = connect(path)
+    try:
+        with metrics.span("aggregates.refresh") as span, open(source, "rb") as f:
+            # Taken before the offset is read: concurrent refreshes (a transform
+            # and the query server) run one after the other instead of both
+            # applying the same rows
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                header_line = f.readline()
+                header = header_line.decode("utf-8").strip().split(",")
+                meta, marks = _meta(conn), _load_marks(f, path)
+                if not rebuild and _prefix_unchanged(meta, f, marks):
+                    start = int(meta["offset"])
+                else:
+                    for table in KEYS:
+                        conn.execute(f"DELETE FROM {table}_counters")
+                    conn.execute("DELETE FROM history")
+                    conn.execute("DELETE FROM meta")
+                    start = len(header_line)
+                    span.tags["rebuilt"] = True
+
+                dictionaries = {table: id_dictionary.load(table) for table in KEYS}
+                f.seek(start)
+                for chunk in pd.read_csv(f, names=header, header=None, dtype=str,
+                                         keep_default_na=False, chunksize=chunk_size):
+                    # Counted per recipe_code/user_code where the transform wrote them
+                    columns = _columns(chunk)
+                    for table, key in KEYS.items():
+                        delta = id_dictionary.reduce_by(chunk, table, columns, dictionaries[table])
+                        _upsert(conn, table, key, delta)
+                    _append_history(conn, chunk)
+                    span.rows += len(chunk)
+                # Exactly the bytes the parser consumed, even if the file grew meanwhile
+                end = f.tell()
+                prefix = marks.get(str(end))
+                if prefix is None:
+                    digest = hashlib.sha256()
+                    _hash_range(f, digest, 0, end)
+                    prefix = digest.hexdigest()
+                state = {
+                    "schema": SCHEMA_VERSION,
+                    "source": os.path.abspath(source),
+                    "offset": str(end),
+                    "prefix_sha256": prefix,
+                }
+                conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", state.items())
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return span.rows
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------
+# READS
+# ---------------------------------------------------
+
+def load(table, path=STORE_PATH):
+    """
+    The `table` ("recipe" or "user") counters as a frame indexed by id, sorted,
+    with the columns of analytics.build_metrics() plus first_seen/last_seen.
+    """
+    key = KEYS[table]
+    conn = connect(path)
+    try:
+        frame = pd.read_sql_query(f"SELECT * FROM {table}_counters ORDER BY {key}", conn, index_col=key)
+    finally:
+        conn.close()
+    frame.index = frame.index.astype(str)
+    frame["avg_rating"] = frame["rating_sum"] / frame["rating_count"].replace(0, np.nan)
+    return frame
+
+
+def load_metrics(csv_dir=CSV_DIR, path=STORE_PATH):
+    """Brings the store up to date, then returns (recipe_metrics, user_metrics)."""
+    refresh(csv_dir, path)
+    return load("recipe", path), load("user", path)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Apply new interactions to the recipe/user counter store.")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the store from the full history")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    applied = refresh(rebuild=args.rebuild)
+    recipes, users = load("recipe"), load("user")
+    print(f"Applied {applied} interactions; store holds {len(recipes)} recipes and {len(users)} users ({STORE_PATH})")
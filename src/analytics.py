@@ -1,130 +1,36 @@
-# # analytics.py
-# """
-# Loads outputs/csv/*.csv and computes insights:
-#  - Most common ingredients
-#  - Average preparation time
-#  - Difficulty distribution
-#  - Correlation between prep time and likes
-#  - Most frequently viewed recipes
-#  - Ingredients associated with high engagement
-#  - Top liked recipes
-#  - Average rating per recipe (if ratings exist)
-#  - Views per minute (views/total_minutes)
-#  - Users with most attempts
-# Saves insights to outputs/analytics/insights.md and charts in outputs/analytics/charts/
-# """
-# import os, pandas as pd
-# import matplotlib.pyplot as plt
-
-# CSV_DIR = os.path.join("outputs","csv")
-# OUT_DIR = os.path.join("outputs","analytics")
-# CHART_DIR = os.path.join(OUT_DIR,"charts")
-# os.makedirs(CHART_DIR, exist_ok=True)
-
-# def load():
-#     recipes = pd.read_csv(os.path.join(CSV_DIR,"recipe.csv"))
-#     ingredients = pd.read_csv(os.path.join(CSV_DIR,"ingredients.csv"))
-#     steps = pd.read_csv(os.path.join(CSV_DIR,"steps.csv"))
-#     interactions = pd.read_csv(os.path.join(CSV_DIR,"interactions.csv"))
-#     return recipes, ingredients, steps, interactions
-
-# def insights():
-#     recipes, ingredients, steps, interactions = load()
-#     md = []
-#     # 1. Most common ingredients
-#     top_ings = ingredients['name'].value_counts().head(10)
-#     md.append("## 1. Most common ingredients\n")
-#     md.append(top_ings.to_markdown() + "\n")
-
-#     # Plot
-#     ax = top_ings.sort_values().plot.barh(title="Top Ingredients (count)")
-#     fig = ax.get_figure(); fig.tight_layout()
-#     fig.savefig(os.path.join(CHART_DIR,"top_ingredients.png"))
-#     plt.close(fig)
-
-#     # 2. Average preparation time
-#     avg_prep = recipes['prep_minutes'].dropna().astype(float).mean()
-#     md.append(f"## 2. Average preparation time (minutes)\n\n{avg_prep:.2f}\n")
-
-#     # 3. Difficulty distribution
-#     diff_dist = recipes['difficulty'].value_counts()
-#     md.append("## 3. Difficulty distribution\n")
-#     md.append(diff_dist.to_markdown() + "\n")
-#     ax = diff_dist.plot.pie(autopct="%1.1f%%", title="Difficulty Distribution")
-#     ax.get_figure().savefig(os.path.join(CHART_DIR,"difficulty_dist.png"))
-#     plt.close()
-
-#     # 4. Correlation between prep time and likes
-#     likes = interactions[interactions['type']=="like"].groupby('recipe_id').size().rename("likes")
-#     prep = recipes.set_index('recipe_id')['prep_minutes'].astype(float)
-#     df_corr = pd.concat([likes, prep], axis=1).dropna()
-#     corr = df_corr['likes'].corr(df_corr['prep_minutes']) if not df_corr.empty else None
-#     md.append("## 4. Correlation between prep time and likes\n\n")
-#     md.append(f"Correlation (Pearson) = {corr}\n\n")
-
-#     # 5. Most frequently viewed recipes
-#     views = interactions[interactions['type']=="view"].groupby('recipe_id').size().sort_values(ascending=False).head(10)
-#     md.append("## 5. Most frequently viewed recipes\n")
-#     md.append(views.to_markdown() + "\n")
-
-#     # 6. Ingredients associated with high engagement (likes/views)
-#     engagement = interactions.groupby('recipe_id').size().rename("engagement")
-#     recipe_eng = recipes.set_index('recipe_id').join(engagement, how='left').fillna(0)
-#     # explode ingredients and compute avg engagement per ingredient
-#     ing = ingredients.copy()
-#     ing_eng = ing.merge(recipe_eng[['engagement']], left_on='recipe_id', right_index=True)
-#     ing_score = ing_eng.groupby('name')['engagement'].mean().sort_values(ascending=False).head(10)
-#     md.append("## 6. Ingredients associated with high engagement (avg engagement per recipe containing ingredient)\n")
-#     md.append(ing_score.to_markdown() + "\n")
-
-#     # 7. Top liked recipes
-#     top_liked = likes.sort_values(ascending=False).head(10)
-#     md.append("## 7. Top liked recipes\n")
-#     md.append(top_liked.to_markdown() + "\n")
-
-#     # 8. Average rating per recipe
-#     if 'rating' in interactions.columns:
-#         ratings = interactions.dropna(subset=['rating']).groupby('recipe_id')['rating'].mean().sort_values(ascending=False).head(10)
-#         md.append("## 8. Average rating per recipe (top 10)\n")
-#         if not ratings.empty:
-#             md.append(ratings.to_markdown() + "\n")
-#         else:
-#             md.append("No rating data available\n")
-#     else:
-#         md.append("## 8. Average rating per recipe (top 10)\nNo rating column in interactions.\n")
-
-#     # 9. Views per minute (views / total_minutes)
-#     recs = recipes.set_index('recipe_id')
-#     vpm = views.rename("views").to_frame().join(recs[['total_minutes']], how='left')
-#     vpm['views_per_min'] = vpm['views'] / vpm['total_minutes'].replace({0: None})
-#     md.append("## 9. Views per minute (per recipe)\n")
-#     md.append(vpm.sort_values("views_per_min", ascending=False).head(10).to_markdown() + "\n")
-
-#     # 10. Users with most attempts
-#     attempts = interactions[interactions['type']=="attempt"].groupby('user_id').size().sort_values(ascending=False).head(10)
-#     md.append("## 10. Users with most attempts\n")
-#     md.append(attempts.to_markdown() + "\n")
-
-#     # write insights
-#     with open(os.path.join(OUT_DIR,"insights.md"), "w", encoding="utf-8") as f:
-#         f.write("\n".join(md))
-#     print("Insights written to", os.path.join(OUT_DIR,"insights.md"))
-
-# if __name__ == "__main__":
-#     insights()
-
+# analytics.py
+"""
+Loads the transformed tables and generates the analytics charts in
+outputs/analytics/charts/ plus the insights report (see insights.py).
+"""
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # charts are only ever saved to PNG, never shown
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import json
+import time
+import hashlib
+import inspect
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import aggregates
+import columnar
+import id_dictionary
+import ingredient_index
+import insights
+import metrics
+import rollups
+import similarity
 
 # ---------------------------------------------------
 # PREMIUM CHART STYLE SETUP
 # ---------------------------------------------------
 
-plt.style.use("ggplot")
+BASE_STYLE = "ggplot"
 
-plt.rcParams.update({
+STYLE = {
     "figure.dpi": 180,
     "axes.facecolor": "white",
     "axes.edgecolor": "#333333",
@@ -135,7 +41,10 @@ plt.rcParams.update({
     "axes.titleweight": "bold",
     "axes.titlepad": 15,
     "font.size": 10,
-})
+}
+
+plt.style.use(BASE_STYLE)
+plt.rcParams.update(STYLE)
 
 # Premium color palette
 COLORS = {
@@ -160,24 +69,105 @@ os.makedirs(OUTPUT_CHARTS_DIR, exist_ok=True)
 # LOAD DATA
 # ---------------------------------------------------
 
+def load_table(name):
+    # Typed Parquet copy when it is present and current, otherwise the CSV
+    df = columnar.read_table(name)
+    if df is None:
+        df = pd.read_csv(f"outputs/csv/{name}.csv")
+    return df
+
+
 def load_data():
-    recipes = pd.read_csv("outputs/csv/recipe.csv")
-    ingredients = pd.read_csv("outputs/csv/ingredients.csv")
-    interactions = pd.read_csv("outputs/csv/interactions.csv")
-    steps = pd.read_csv("outputs/csv/steps.csv")
+    with metrics.span("load_data") as span:
+        recipes = load_table("recipe")
+        ingredients = load_table("ingredients")
+        interactions = load_table("interactions")
+        steps = load_table("steps")
+        span.rows = len(recipes) + len(ingredients) + len(interactions) + len(steps)
     return recipes, ingredients, interactions, steps
 
 
 # ---------------------------------------------------
-# 1️⃣ Likes vs Views
+# SHARED METRICS (one pass over interactions)
 # ---------------------------------------------------
 
-def chart_likes_vs_views(interactions):
+METRIC_COLUMNS = ["views", "likes", "attempts", "rating_sum", "rating_count", "engagement"]
+
+
+def build_metrics(interactions):
+    """
+    Aggregates interactions once into per-recipe and per-user metric frames
+    (views, likes, attempts, rating_sum, rating_count, engagement, avg_rating).
+
+    With the integer codes the transform writes (see id_dictionary.py) each
+    metric is an np.bincount over recipe_code/user_code; otherwise the raw
+    rows are grouped once by (recipe_id, user_id) and the recipe and user
+    frames reduced from that much smaller result.
+    """
+    with metrics.span("build_metrics") as span:
+        span.rows = len(interactions)
+        if id_dictionary.has_codes(interactions, "recipe") and id_dictionary.has_codes(interactions, "user"):
+            return _build_metrics_by_code(interactions)
+        return _build_metrics(interactions)
+
+
+def _metric_flags(interactions):
+    if id_dictionary.has_codes(interactions, "type"):
+        # Compare small ints instead of strings
+        types = id_dictionary.load("type")
+        kind = interactions["type_code"].to_numpy()
+        views, likes, attempts = (kind == types.lookup(t) for t in ("view", "like", "attempt"))
+    else:
+        kind = interactions["type"]
+        views, likes, attempts = (kind == t for t in ("view", "like", "attempt"))
+    if "rating" in interactions.columns:
+        rating = pd.to_numeric(interactions["rating"], errors="coerce")
+    else:
+        rating = pd.Series(np.nan, index=interactions.index)
+    return {
+        "views": np.asarray(views, dtype="int64"),
+        "likes": np.asarray(likes, dtype="int64"),
+        "attempts": np.asarray(attempts, dtype="int64"),
+        "rating_sum": rating.fillna(0).to_numpy(dtype="float64"),
+        "rating_count": rating.notna().to_numpy(dtype="int64"),
+        "engagement": np.ones(len(interactions), dtype="int64"),
+    }
+
+
+def _finish_metrics(frame):
+    frame.index = frame.index.astype(str)
+    frame = frame.sort_index()
+    frame["avg_rating"] = frame["rating_sum"] / frame["rating_count"].replace(0, np.nan)
+    return frame
+
+
+def _build_metrics_by_code(interactions):
+    columns = {name: (values, "sum") for name, values in _metric_flags(interactions).items()}
+    return tuple(_finish_metrics(id_dictionary.reduce_by(interactions, kind, columns)[METRIC_COLUMNS])
+                 for kind in ("recipe", "user"))
+
+
+def _build_metrics(interactions):
+    flags = pd.DataFrame({
+        "recipe_id": interactions["recipe_id"],
+        "user_id": interactions["user_id"],
+        **_metric_flags(interactions),
+    })
+    pairs = flags.groupby(["recipe_id", "user_id"], observed=True, sort=False)[METRIC_COLUMNS].sum()
+
+    def reduce(level):
+        return _finish_metrics(pairs.groupby(level=level, observed=True)[METRIC_COLUMNS].sum())
+
+    return reduce("recipe_id"), reduce("user_id")
 
-    views = interactions[interactions["type"] == "view"].groupby("recipe_id").size()
-    likes = interactions[interactions["type"] == "like"].groupby("recipe_id").size()
 
-    df = pd.DataFrame({"views": views, "likes": likes}).fillna(0)
+# ---------------------------------------------------
+# 1️⃣ Likes vs Views
+# ---------------------------------------------------
+
+def chart_likes_vs_views(recipe_metrics):
+
+    df = recipe_metrics[(recipe_metrics["views"] > 0) | (recipe_metrics["likes"] > 0)]
 
     plt.figure(figsize=(7,5))
     plt.scatter(df["views"], df["likes"], color=COLORS["primary"], s=50, alpha=0.7, edgecolor="#1f4e79")
@@ -193,8 +183,8 @@ def chart_likes_vs_views(interactions):
 # 2️⃣ Engagement Score Bar Chart
 # ---------------------------------------------------
 
-def chart_engagement_score(interactions):
-    engagement = interactions.groupby("recipe_id").size()
+def chart_engagement_score(recipe_metrics):
+    engagement = recipe_metrics["engagement"]
 
     plt.figure(figsize=(10,5))
     engagement.sort_values(ascending=False).plot(
@@ -213,13 +203,9 @@ def chart_engagement_score(interactions):
 # 3️⃣ Prep Time vs Likes Scatter Plot
 # ---------------------------------------------------
 
-def chart_prep_time_vs_likes(recipes, interactions):
-
-    likes = interactions[interactions["type"] == "like"].groupby("recipe_id").size()
-    likes = likes.rename("likes")
+def chart_prep_time_vs_likes(recipes, recipe_metrics):
 
-    merged = recipes.merge(likes, left_on="recipe_id", right_index=True, how="left")
-    merged["likes"] = merged["likes"].fillna(0)
+    merged = recipes.assign(likes=id_dictionary.join(recipes, "recipe", recipe_metrics["likes"], fill=0))
 
     plt.figure(figsize=(7,5))
     plt.scatter(
@@ -243,12 +229,12 @@ def chart_prep_time_vs_likes(recipes, interactions):
 # 4️⃣ Ingredient Popularity Heatmap
 # ---------------------------------------------------
 
-def chart_ingredient_heatmap(ingredients):
-    freq = ingredients["name"].value_counts()
+def chart_ingredient_heatmap(frequency):
+    # frequency: recipes per canonical ingredient (IngredientIndex.frequency)
 
     plt.figure(figsize=(12,2))
-    plt.imshow([freq.values], cmap="viridis", aspect="auto")
-    plt.xticks(range(len(freq.index)), freq.index, rotation=90)
+    plt.imshow([frequency.values], cmap="viridis", aspect="auto")
+    plt.xticks(range(len(frequency.index)), frequency.index, rotation=90)
     plt.yticks([])
 
     plt.title("Ingredient Popularity Heatmap")
@@ -287,18 +273,16 @@ def chart_tags_distribution(recipes):
 # 6️⃣ Difficulty vs Average Rating
 # ---------------------------------------------------
 
-def chart_difficulty_vs_rating(recipes, interactions):
+def chart_difficulty_vs_rating(recipes, recipe_metrics):
 
-    if "rating" not in interactions.columns:
-        print("⚠️ No rating column found — skipping rating chart.")
+    if recipe_metrics["rating_count"].sum() == 0:
+        print("⚠️ No ratings found — skipping rating chart.")
         return
 
-    ratings = interactions[interactions["rating"].notna()].groupby("recipe_id")["rating"].mean()
-
-    merged = recipes.merge(ratings, left_on="recipe_id", right_index=True, how="left")
+    merged = recipes.assign(rating=id_dictionary.join(recipes, "recipe", recipe_metrics["avg_rating"]))
 
     plt.figure(figsize=(7,5))
-    merged.groupby("difficulty")["rating"].mean().plot(
+    merged.groupby("difficulty", observed=True)["rating"].mean().plot(
         kind="bar",
         color=COLORS["cyan"]
     )
@@ -314,9 +298,9 @@ def chart_difficulty_vs_rating(recipes, interactions):
 # 7️⃣ Most Active Users
 # ---------------------------------------------------
 
-def chart_most_active_users(interactions):
+def chart_most_active_users(user_metrics):
 
-    user_freq = interactions["user_id"].value_counts()
+    user_freq = user_metrics["engagement"].sort_values(ascending=False)
 
     plt.figure(figsize=(9,5))
     user_freq.plot(kind="bar", color=COLORS["danger"])
@@ -332,14 +316,11 @@ def chart_most_active_users(interactions):
 # 8️⃣ Hourly Interaction Trend
 # ---------------------------------------------------
 
-def chart_hourly_interaction_trend(interactions):
+def chart_hourly_interaction_trend(hourly):
 
-    if "timestamp" not in interactions.columns:
+    if hourly is None or hourly.empty:
         return
 
-    interactions["hour"] = pd.to_datetime(interactions["timestamp"]).dt.hour
-    hourly = interactions.groupby("hour").size()
-
     plt.figure(figsize=(9,5))
     hourly.plot(kind="line", color=COLORS["primary"], linewidth=2)
     plt.title("Hourly Interaction Trend")
@@ -354,12 +335,11 @@ def chart_hourly_interaction_trend(interactions):
 # 9️⃣ Attempts vs Likes (Stacked)
 # ---------------------------------------------------
 
-def chart_attempts_vs_likes(interactions):
-
-    attempts = interactions[interactions["type"] == "attempt"].groupby("recipe_id").size()
-    likes = interactions[interactions["type"] == "like"].groupby("recipe_id").size()
+def chart_attempts_vs_likes(recipe_metrics):
 
-    df = pd.DataFrame({"attempts": attempts, "likes": likes}).fillna(0)
+    df = recipe_metrics.loc[
+        (recipe_metrics["attempts"] > 0) | (recipe_metrics["likes"] > 0), ["attempts", "likes"]
+    ]
 
     df.plot(
         kind="bar",
@@ -379,13 +359,12 @@ def chart_attempts_vs_likes(interactions):
 # 🔟 Recipe Similarity (Heatmap)
 # ---------------------------------------------------
 
-def chart_recipe_similarity(ingredients):
-
-    pivot = ingredients.pivot_table(index="recipe_id", columns="name", aggfunc="size", fill_value=0)
-    similarity = pivot.corr()
+def chart_recipe_similarity(sample):
 
     plt.figure(figsize=(10,8))
-    plt.imshow(similarity, cmap="coolwarm")
+    plt.imshow(sample.values, cmap="coolwarm", vmin=0, vmax=1)
+    plt.xticks(range(len(sample.columns)), sample.columns, rotation=90, fontsize=6)
+    plt.yticks(range(len(sample.index)), sample.index, fontsize=6)
     plt.colorbar()
     plt.title("Recipe Similarity Heatmap")
     plt.savefig(f"{OUTPUT_CHARTS_DIR}/recipe_similarity.png", bbox_inches="tight")
@@ -396,7 +375,7 @@ def chart_recipe_similarity(ingredients):
 # 1️⃣1️⃣ Word Cloud (if installed)
 # ---------------------------------------------------
 
-def chart_ingredient_wordcloud(ingredients):
+def chart_ingredient_wordcloud(frequency):
 
     try:
         from wordcloud import WordCloud
@@ -404,8 +383,7 @@ def chart_ingredient_wordcloud(ingredients):
         print("WordCloud not installed — skipping.")
         return
 
-    text = " ".join(ingredients["name"])
-    wc = WordCloud(background_color="white", colormap="viridis").generate(text)
+    wc = WordCloud(background_color="white", colormap="viridis").generate_from_frequencies(frequency.to_dict())
 
     plt.figure(figsize=(10,6))
     plt.imshow(wc)
@@ -415,27 +393,264 @@ def chart_ingredient_wordcloud(ingredients):
 
 
 # ---------------------------------------------------
-# MAIN
+# 1️⃣2️⃣ Top Ingredients
 # ---------------------------------------------------
 
-def main():
-    recipes, ingredients, interactions, steps = load_data()
+def chart_top_ingredients(frequency):
+
+    top_ings = frequency.head(10)
+
+    plt.figure(figsize=(8,5))
+    top_ings.sort_values().plot(kind="barh", color=COLORS["primary"])
+    plt.title("Top Ingredients (recipes using them)")
+    plt.xlabel("Recipes")
+    plt.grid(axis="x", alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(f"{OUTPUT_CHARTS_DIR}/top_ingredients.png", bbox_inches="tight")
+    plt.close()
+
+
+# ---------------------------------------------------
+# 1️⃣3️⃣ Difficulty Distribution
+# ---------------------------------------------------
+
+def chart_difficulty_distribution(recipes):
+
+    diff_dist = recipes["difficulty"].astype(str).value_counts()
+
+    plt.figure(figsize=(6,6))
+    diff_dist.plot(
+        kind="pie",
+        autopct="%1.1f%%",
+        colors=[COLORS["secondary"], COLORS["tertiary"], COLORS["danger"]],
+    )
+    plt.title("Difficulty Distribution")
+    plt.ylabel("")
+    plt.savefig(f"{OUTPUT_CHARTS_DIR}/difficulty_dist.png", bbox_inches="tight")
+    plt.close()
+
+
+# ---------------------------------------------------
+# 1️⃣4️⃣ Daily Trend (from the daily rollup)
+# ---------------------------------------------------
+
+TYPE_COLORS = {"view": COLORS["primary"], "like": COLORS["danger"], "attempt": COLORS["secondary"]}
+
+
+def chart_daily_trend(daily):
+
+    if daily.empty:
+        return
+
+    plt.figure(figsize=(10,5))
+    for kind in daily.columns:
+        plt.plot(daily.index, daily[kind], label=kind, linewidth=2,
+                 color=TYPE_COLORS.get(kind, COLORS["purple"]))
+    plt.title("Daily Interactions by Type")
+    plt.xlabel("Day")
+    plt.ylabel("Interactions")
+    plt.legend()
+    plt.grid(True, alpha=0.4)
+    plt.gcf().autofmt_xdate()
+    plt.savefig(f"{OUTPUT_CHARTS_DIR}/daily_trend.png", bbox_inches="tight")
+    plt.close()
+
+
+# ---------------------------------------------------
+# 1️⃣5️⃣ Weekly Trend (from the daily rollup)
+# ---------------------------------------------------
 
-    chart_likes_vs_views(interactions)
-    chart_engagement_score(interactions)
-    chart_prep_time_vs_likes(recipes, interactions)
-    chart_ingredient_heatmap(ingredients)
-    chart_tags_distribution(recipes)
-    chart_difficulty_vs_rating(recipes, interactions)
-    chart_most_active_users(interactions)
-    chart_hourly_interaction_trend(interactions)
-    chart_attempts_vs_likes(interactions)
-    chart_recipe_similarity(ingredients)
-    chart_ingredient_wordcloud(ingredients)
+def chart_weekly_trend(weekly):
+
+    if weekly.empty:
+        return
+
+    weekly = weekly.set_axis(weekly.index.strftime("%Y-%m-%d"))
+    ax = weekly.plot(kind="bar", stacked=True, figsize=(9,5),
+                     color=[TYPE_COLORS.get(kind, COLORS["purple"]) for kind in weekly.columns])
+    ax.set_title("Weekly Interactions by Type")
+    ax.set_xlabel("Week starting")
+    ax.set_ylabel("Interactions")
+    ax.grid(axis="y", alpha=0.3)
+    plt.xticks(rotation=45, ha="right")
+    plt.savefig(f"{OUTPUT_CHARTS_DIR}/weekly_trend.png", bbox_inches="tight")
+    plt.close()
+
+
+# ---------------------------------------------------
+# 1️⃣6️⃣ Ingredient Co-occurrence (from the ingredient index)
+# ---------------------------------------------------
+
+def chart_ingredient_cooccurrence(cooccurrence):
+
+    plt.figure(figsize=(9,7))
+    plt.imshow(cooccurrence.values, cmap="viridis", aspect="auto")
+    plt.xticks(range(len(cooccurrence.columns)), cooccurrence.columns, rotation=90)
+    plt.yticks(range(len(cooccurrence.index)), cooccurrence.index)
+
+    plt.title("Ingredient Co-occurrence Heatmap (recipes sharing both)")
+    plt.colorbar(shrink=0.65)
+    plt.tight_layout()
+    plt.savefig(f"{OUTPUT_CHARTS_DIR}/ingredient_cooccurrence.png", bbox_inches="tight")
+    plt.close()
+
+
+# ---------------------------------------------------
+# RENDERING
+# ---------------------------------------------------
+
+def chart_tasks(recipes, ingredients, recipe_metrics, user_metrics, trends, similarity_sample, index=None):
+    """
+    (name, chart function, args) for every chart. Each chart only gets the
+    small aggregated inputs it needs, never the raw interactions table, so the
+    tasks are cheap to ship to worker processes. `trends` is the (hourly,
+    daily) rollup pair from rollups.load(); `index` the ingredient index,
+    loaded from `ingredients` when not given.
+    """
+    index = ingredient_index.ensure_index(ingredients) if index is None else index
+    frequency = index.frequency()
+    recipe_keys = recipes[[c for c in ("recipe_id", "recipe_code") if c in recipes.columns]]
+    hourly, daily = trends
+    return [
+        ("likes_vs_views", chart_likes_vs_views, (recipe_metrics,)),
+        ("engagement_score", chart_engagement_score, (recipe_metrics,)),
+        ("prep_time_vs_likes", chart_prep_time_vs_likes, (recipe_keys.join(recipes["prep_minutes"]), recipe_metrics)),
+        ("ingredient_heatmap", chart_ingredient_heatmap, (frequency,)),
+        ("tags_distribution", chart_tags_distribution, (recipes[["tags"]],)),
+        ("difficulty_vs_rating", chart_difficulty_vs_rating, (recipe_keys.join(recipes["difficulty"]), recipe_metrics)),
+        ("active_users", chart_most_active_users, (user_metrics,)),
+        ("hourly_trend", chart_hourly_interaction_trend, (rollups.hour_of_day(hourly),)),
+        ("attempts_vs_likes", chart_attempts_vs_likes, (recipe_metrics,)),
+        ("recipe_similarity", chart_recipe_similarity, (similarity_sample,)),
+        ("ingredient_wordcloud", chart_ingredient_wordcloud, (frequency,)),
+        ("top_ingredients", chart_top_ingredients, (frequency,)),
+        ("difficulty_dist", chart_difficulty_distribution, (recipes[["difficulty"]],)),
+        ("daily_trend", chart_daily_trend, (rollups.series(daily, "D"),)),
+        ("weekly_trend", chart_weekly_trend, (rollups.series(daily, "W"),)),
+        ("ingredient_cooccurrence", chart_ingredient_cooccurrence, (index.cooccurrence(),)),
+    ]
+
+
+# ---------------------------------------------------
+# CHART CACHE
+# ---------------------------------------------------
+# Each PNG gets a <name>.png.fingerprint sidecar: a hash of the chart's input
+# data, its code and the shared style. A chart is only re-rendered when that
+# hash changes, or when --force is passed.
+
+CHART_CACHE_VERSION = "1"
+
+
+def chart_path(name):
+    return f"{OUTPUT_CHARTS_DIR}/{name}.png"
+
+
+def _hash_value(h, value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        if isinstance(value, pd.DataFrame):
+            meta = [list(value.columns), [str(t) for t in value.dtypes]]
+        else:
+            meta = [value.name, str(value.dtype)]
+        h.update(repr(meta).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    else:
+        h.update(repr(value).encode())
+
+
+def chart_fingerprint(name, func, args):
+    h = hashlib.sha256()
+    h.update(CHART_CACHE_VERSION.encode())
+    h.update(name.encode())
+    h.update(inspect.getsource(func).encode())
+    h.update(json.dumps([BASE_STYLE, STYLE, COLORS, matplotlib.__version__], sort_keys=True).encode())
+    for value in args:
+        _hash_value(h, value)
+    return h.hexdigest()
+
+
+def is_cached(name, fingerprint):
+    sidecar = chart_path(name) + ".fingerprint"
+    if not (os.path.exists(chart_path(name)) and os.path.exists(sidecar)):
+        return False
+    with open(sidecar, encoding="utf-8") as f:
+        return f.read().strip() == fingerprint
+
+
+def save_fingerprint(name, fingerprint):
+    with open(chart_path(name) + ".fingerprint", "w", encoding="utf-8") as f:
+        f.write(fingerprint + "\n")
+
+
+def render_chart(name, func, args):
+    started = time.perf_counter()
+    with metrics.span(func.__name__, chart=name) as span:
+        span.rows = len(args[0]) if hasattr(args[0], "__len__") else 0
+        func(*args)
+    return name, time.perf_counter() - started
+
+
+def render_charts(tasks, workers=1, force=False):
+    """
+    Renders every task whose fingerprint changed, in a process pool when
+    workers > 1. Returns ({name: seconds}, [names skipped as unchanged]).
+    """
+    fingerprints = {name: chart_fingerprint(name, func, args) for name, func, args in tasks}
+    todo = [t for t in tasks if force or not is_cached(t[0], fingerprints[t[0]])]
+    skipped = [name for name, _, _ in tasks if name not in {t[0] for t in todo}]
+
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(render_chart, *task) for task in todo]
+            timings = dict(f.result() for f in futures)
+    else:
+        timings = dict(render_chart(*task) for task in todo)
+
+    for name in timings:
+        save_fingerprint(name, fingerprints[name])
+    return timings, skipped
+
+
+# ---------------------------------------------------
+# MAIN
+# ---------------------------------------------------
+
+def main(workers=1, force=False):
+    # Metrics come from the counter store, which only applies the new
+    # interactions, so the interactions table itself is not loaded here
+    recipes, ingredients = load_table("recipe"), load_table("ingredients")
+    recipe_metrics, user_metrics = aggregates.load_metrics()
+    trends = rollups.load()
+    similarity_sample = similarity.sample_matrix(similarity.ensure_index(ingredients))
+    index = ingredient_index.ensure_index(ingredients)
+
+    started = time.perf_counter()
+    tasks = chart_tasks(recipes, ingredients, recipe_metrics, user_metrics, trends, similarity_sample, index)
+    timings, skipped = render_charts(tasks, workers, force)
+    elapsed = time.perf_counter() - started
+
+    print("\nChart render times:")
+    for name, seconds in sorted(timings.items(), key=lambda kv: -kv[1]):
+        print(f"  {name:<22} {seconds:6.2f}s")
+    print(f"  {'total (wall clock)':<22} {elapsed:6.2f}s with {workers} worker(s)")
+    if skipped:
+        print(f"  unchanged, not re-rendered: {', '.join(skipped)}")
+
+    insights.write_report(insights.compute_insights(recipes, ingredients, recipe_metrics, user_metrics, trends,
+                                                    index=index))
 
     print("\n✅ All premium analytics charts generated successfully!\n")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate analytics charts from outputs/csv.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="render charts in this many processes")
+    parser.add_argument("--force", action="store_true",
+                        help="re-render every chart even if its inputs are unchanged")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(workers=args.workers, force=args.force)
 
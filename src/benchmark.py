@@ -0,0 +1,293 @@
+# benchmark.py
+"""
+Scale benchmarks for every pipeline stage.
+
+For each scale (number of interactions, e.g. 10k 100k 1M 10M) a synthetic
+snapshot is generated in the shape the seed loop writes to Firestore and the
+export dumps back (gen_synthetic_recipe, create_user, gen_interactions), as
+outputs/raw_json/*.jsonl in a scratch working directory. The stages then run
+there and are timed one by one:
+
+ - normalize_recipes, normalize_users, normalize_interactions, columnar
+ - load_context and every validate_* function
+ - load_data, build_metrics, the rollups, the counter store (full build
+   and the incremental refresh with nothing new), the similarity and
+   ingredient indexes and every chart_* function
+
+Each step records wall time, rows processed, rows/sec and the tracemalloc
+peak (Python and numpy allocations). Results are written as JSON; with
+--baseline, steps slower or hungrier than the baseline by more than
+--threshold are flagged as regressions and the exit status is 1.
+"""
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+RESULTS_PATH = os.path.join("outputs", "benchmarks", "benchmark_results.json")
+DEFAULT_SCALES = ["10k", "100k"]
+THRESHOLD = 0.20
+# Differences below these are noise, never regressions
+MIN_SECONDS = 0.05
+MIN_PEAK_MB = 1.0
+
+
+def parse_scale(text):
+    units = {"k": 1_000, "m": 1_000_000}
+    text = text.strip().lower()
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+# ---------------------------------------------------
+# DATASETS
+# ---------------------------------------------------
+
+def generate_dataset(data_dir, interactions, seed=0):
+    """
+    Writes recipes/users/interactions snapshots with `interactions` rows, as
+    the seed loop would have stored them. Users scale with the data
+    (one per 200 interactions, at least 10). Returns the row counts.
+    """
+    import seed_firestore
+
+    random.seed(seed)
+    raw_dir = os.path.join(data_dir, "outputs", "raw_json")
+    os.makedirs(raw_dir, exist_ok=True)
+    user_ids = [f"user_{i:03d}" for i in range(1, max(10, interactions // 200) + 1)]
+    now = datetime.now()
+
+    with open(os.path.join(raw_dir, "users.jsonl"), "w", encoding="utf-8") as f:
+        for i, uid in enumerate(user_ids, 1):
+            f.write(json.dumps({**seed_firestore.create_user(uid, f"User {i}"), "_id": uid}) + "\n")
+
+    written, recipes = 0, 0
+    with open(os.path.join(raw_dir, "recipes.jsonl"), "w", encoding="utf-8") as rf, \
+         open(os.path.join(raw_dir, "interactions.jsonl"), "w", encoding="utf-8") as inf:
+        while written < interactions:
+            recipes += 1
+            r = seed_firestore.gen_synthetic_recipe(recipes)
+            r["total_minutes"] = r["prep_minutes"] + r["cook_minutes"]
+            rf.write(json.dumps({**r, "_id": r["id"]}) + "\n")
+            for doc_id, doc in seed_firestore.gen_interactions(r["id"], user_ids, now):
+                inf.write(json.dumps({**doc, "_id": doc_id}) + "\n")
+                written += 1
+                if written == interactions:
+                    break
+
+    counts = {"recipes": recipes, "users": len(user_ids), "interactions": written, "seed": seed}
+    with open(os.path.join(data_dir, "dataset.json"), "w", encoding="utf-8") as f:
+        json.dump(counts, f)
+    return counts
+
+
+def ensure_dataset(data_dir, interactions, seed=0):
+    # Datasets are reused across runs when --workdir is kept
+    marker = os.path.join(data_dir, "dataset.json")
+    if os.path.exists(marker):
+        with open(marker, encoding="utf-8") as f:
+            counts = json.load(f)
+        if counts.get("interactions") == interactions and counts.get("seed") == seed:
+            return counts
+    return generate_dataset(data_dir, interactions, seed)
+
+
+# ---------------------------------------------------
+# TIMING
+# ---------------------------------------------------
+
+class Recorder:
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.steps = {}
+
+    def measure(self, name, rows, func, *args):
+        if self.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            value = func(*args)
+        finally:
+            seconds = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+            if self.trace_memory:
+                tracemalloc.stop()
+        rows = rows(value) if callable(rows) else rows
+        self.steps[name] = {
+            "seconds": round(seconds, 4),
+            "rows": rows,
+            "rows_per_sec": round(rows / seconds, 1) if seconds else None,
+            "peak_mb": None if peak is None else round(peak / 2**20, 2),
+        }
+        print(f"  {name:<34} {seconds:8.3f}s  {rows:>10,} rows"
+              + ("" if peak is None else f"  {peak / 2**20:9.1f} MB peak"))
+        return value
+
+
+def run_stages(counts, trace_memory=True, transform_workers=1):
+    """Runs every stage in the current directory, which holds outputs/raw_json."""
+    for d in (os.path.join("outputs", "csv"), os.path.join("outputs", "analytics", "charts")):
+        os.makedirs(d, exist_ok=True)
+    import transform_to_csv
+    import aggregates
+    import columnar
+    import validator
+    import analytics
+    import rollups
+    import similarity
+    import ingredient_index
+    from utils import snapshot_path
+
+    rec = Recorder(trace_memory)
+    raw_dir = os.path.join("outputs", "raw_json")
+
+    # ----- TRANSFORM -----
+    rec.measure("normalize_recipes", counts["recipes"],
+                transform_to_csv.normalize_recipes, snapshot_path(raw_dir, "recipes"))
+    rec.measure("normalize_users", counts["users"],
+                transform_to_csv.normalize_users, snapshot_path(raw_dir, "users"))
+    rec.measure("normalize_interactions", counts["interactions"],
+                transform_to_csv.normalize_interactions, snapshot_path(raw_dir, "interactions"))
+    if transform_workers > 1:
+        # Same output, sharded over processes; the sequential run above stays the baseline
+        rec.measure(f"normalize_interactions.workers_{transform_workers}", counts["interactions"],
+                    lambda: transform_to_csv.normalize_interactions(snapshot_path(raw_dir, "interactions"),
+                                                                    workers=transform_workers))
+    if columnar.available():
+        rec.measure("columnar.write_all", counts["interactions"], columnar.write_all)
+
+    # ----- VALIDATE -----
+    ctx = rec.measure("load_context", counts["interactions"], validator.load_context)
+    run = validator.ValidationRun()
+    for table in validator.RULES:
+        validate = getattr(validator, f"validate_{table}")
+        rec.measure(f"validate_{table}", lambda result: result[1]["rows"], validate, ctx, run)
+    run.close()
+
+    # ----- ANALYTICS -----
+    recipes, ingredients, interactions, steps = rec.measure(
+        "load_data", lambda tables: sum(len(t) for t in tables), analytics.load_data)
+    recipe_metrics, user_metrics = rec.measure(
+        "build_metrics", len(interactions), analytics.build_metrics, interactions)
+    trends = rec.measure("rollups.write_all", len(interactions), rollups.write_all)
+    rec.measure("aggregates.rebuild", len(interactions), aggregates.refresh, aggregates.CSV_DIR,
+                aggregates.STORE_PATH, True)
+    recipe_metrics, user_metrics = rec.measure(
+        "aggregates.load_metrics", lambda frames: sum(len(f) for f in frames), aggregates.load_metrics)
+    index = rec.measure("similarity.build_index", len(ingredients), similarity.build_index, ingredients)
+    sample = similarity.sample_matrix(index)
+    ingredients_index = rec.measure("ingredient_index.build_index", len(ingredients),
+                                    ingredient_index.build_index, ingredients)
+
+    # Chart functions are called directly, bypassing the render cache
+    tasks = analytics.chart_tasks(recipes, ingredients, recipe_metrics, user_metrics, trends, sample,
+                                  ingredients_index)
+    for name, func, args in tasks:
+        rows = len(args[0]) if hasattr(args[0], "__len__") else 0
+        rec.measure(func.__name__, rows, func, *args)
+    return rec.steps
+
+
+# ---------------------------------------------------
+# RESULTS
+# ---------------------------------------------------
+
+def environment():
+    import numpy
+    import pandas
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "pandas": pandas.__version__,
+    }
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Returns a list of (scale, step, metric, baseline value, new value) regressions."""
+    regressions = []
+    for scale, section in results["scales"].items():
+        base_steps = baseline.get("scales", {}).get(scale, {}).get("steps", {})
+        for step, new in section["steps"].items():
+            old = base_steps.get(step)
+            if old is None:
+                continue
+            for metric, floor in (("seconds", MIN_SECONDS), ("peak_mb", MIN_PEAK_MB)):
+                a, b = old.get(metric), new.get(metric)
+                if a is None or b is None:
+                    continue
+                if b > a * (1 + threshold) and b - a > floor:
+                    regressions.append((scale, step, metric, a, b))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage at several data scales.")
+    parser.add_argument("--scales", nargs="+", default=DEFAULT_SCALES,
+                        help="interaction counts to benchmark, e.g. 10k 100k 1M 10M")
+    parser.add_argument("--workdir", default=None,
+                        help="where datasets are generated and kept (default: a temporary directory)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the generated data")
+    parser.add_argument("--out", default=RESULTS_PATH, help="where to write the results JSON")
+    parser.add_argument("--baseline", default=None,
+                        help="results JSON to compare against; regressions exit with status 1")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="relative slowdown / memory growth counted as a regression")
+    parser.add_argument("--transform-workers", type=int, default=1,
+                        help="also time normalize_interactions sharded over this many processes")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip tracemalloc (faster, but no peak memory)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    out_path = os.path.abspath(args.out)
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="recipe-bench-")
+
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "environment": environment(),
+        "trace_memory": not args.no_memory,
+        "scales": {},
+    }
+    home = os.getcwd()
+    for label in args.scales:
+        n = parse_scale(label)
+        data_dir = os.path.join(workdir, label)
+        print(f"\n=== {label} interactions ({data_dir}) ===")
+        started = time.perf_counter()
+        counts = ensure_dataset(data_dir, n, args.seed)
+        print(f"  dataset: {counts['recipes']:,} recipes, {counts['users']:,} users, "
+              f"{counts['interactions']:,} interactions ({time.perf_counter() - started:.1f}s)")
+        os.chdir(data_dir)
+        try:
+            steps = run_stages(counts, trace_memory=not args.no_memory, transform_workers=args.transform_workers)
+        finally:
+            os.chdir(home)
+        results["scales"][label] = {"dataset": counts, "steps": steps}
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print("\nResults written to", out_path)
+
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for scale, step, metric, old, new in regressions:
+                print(f"  [{scale}] {step} {metric}: {old} -> {new}")
+            sys.exit(1)
+        print(f"\n✅ No regressions over {args.threshold:.0%} against {baseline_path}")
@@ -4,8 +4,18 @@ import glob
 OUTPUT_PATHS = [
     "../outputs/raw_json/*.json",
     "../outputs/csv/*.csv",
+    "../outputs/csv/interactions.shards/*.csv",
+    "../outputs/columnar/*.parquet",
+    "../outputs/rollups/*.csv",
+    "../outputs/aggregates/*.sqlite",
+    "../outputs/aggregates/*.json",
+    "../outputs/quarantine/*.csv",
+    "../outputs/quarantine/interactions.shards/*.csv",
     "../outputs/analytics/charts/*.png",
-    "../outputs/validation_report.json"
+    "../outputs/validation_report.json",
+    "../outputs/pipeline_state.json",
+    "../outputs/pipeline_metrics.jsonl",
+    "../outputs/profiles/*.prof"
 ]
 
 def cleanup():
@@ -0,0 +1,204 @@
+# columnar.py
+"""
+Typed columnar copies of the transform CSVs:
+ - outputs/columnar/recipe.parquet
+ - outputs/columnar/ingredients.parquet
+ - outputs/columnar/steps.parquet
+ - outputs/columnar/interactions.parquet
+ - outputs/columnar/users.parquet
+
+Every table has an explicit schema: ids and other low-cardinality strings are
+dictionary-encoded (they load as pandas categoricals), numbers are typed and
+timestamps are parsed once here instead of on every analytics run. CSVs are
+converted in streaming batches, so memory stays flat for large tables.
+
+Numeric and timestamp columns are read as text and converted leniently: a
+cell that does not parse (a blank count, "12.5" minutes is truncated, an
+offset-suffixed timestamp is converted to UTC) becomes null instead of
+failing the batch. A table that still cannot be written is skipped with a
+warning; the Parquet copy never aborts the transform.
+
+Requires pyarrow; without it the CSVs remain the only output.
+"""
+import os
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+CSV_DIR = os.path.join("outputs", "csv")
+COLUMNAR_DIR = os.path.join("outputs", "columnar")
+
+if pa is not None:
+    # pyarrow's CSV reader only dictionary-encodes with int32 indices
+    _DICT = pa.dictionary(pa.int32(), pa.string())
+
+    SCHEMAS = {
+        "recipe": pa.schema([
+            ("recipe_id", pa.string()),
+            ("title", pa.string()),
+            ("description", pa.string()),
+            ("servings", pa.int32()),
+            ("prep_minutes", pa.int32()),
+            ("cook_minutes", pa.int32()),
+            ("total_minutes", pa.int32()),
+            ("difficulty", _DICT),
+            ("tags", pa.string()),
+            ("recipe_code", pa.int32()),
+        ]),
+        "ingredients": pa.schema([
+            ("ingredient_id", pa.string()),
+            ("recipe_id", _DICT),
+            ("name", _DICT),
+            ("quantity", pa.float64()),
+            ("unit", _DICT),
+            ("notes", pa.string()),
+            ("recipe_code", pa.int32()),
+        ]),
+        "steps": pa.schema([
+            ("step_id", pa.string()),
+            ("recipe_id", _DICT),
+            ("step_number", pa.int32()),
+            ("instruction", pa.string()),
+            ("recipe_code", pa.int32()),
+        ]),
+        "interactions": pa.schema([
+            ("interaction_id", pa.string()),
+            ("recipe_id", _DICT),
+            ("type", _DICT),
+            ("user_id", _DICT),
+            ("timestamp", pa.timestamp("us")),
+            ("rating", pa.float32()),
+            ("difficulty_used", _DICT),
+            ("ts_epoch", pa.int64()),
+            ("recipe_code", pa.int32()),
+            ("user_code", pa.int32()),
+            ("type_code", pa.int32()),
+        ]),
+        "users": pa.schema([
+            ("user_id", pa.string()),
+            ("name", pa.string()),
+            ("joined_at", pa.timestamp("us")),
+            ("user_code", pa.int32()),
+        ]),
+    }
+else:
+    SCHEMAS = {}
+
+
+def available():
+    return pa is not None
+
+
+def table_path(name):
+    return os.path.join(COLUMNAR_DIR, f"{name}.parquet")
+
+
+def _lenient(field):
+    # Columns whose text is converted per batch rather than by the CSV reader
+    return pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_timestamp(field.type)
+
+
+def _convert(column, to_type):
+    try:
+        return column.cast(to_type)
+    except pa.ArrowInvalid:
+        pass
+    # Some cell in the batch does not parse strictly
+    values = column.to_pandas()
+    if pa.types.is_timestamp(to_type):
+        parsed = pd.to_datetime(values, utc=True, errors="coerce", format="ISO8601").dt.tz_convert(None)
+        return pa.array(parsed.astype("datetime64[us]"), type=to_type, from_pandas=True)
+    parsed = pd.to_numeric(values, errors="coerce").astype("float64")
+    return pa.array(parsed, from_pandas=True).cast(to_type, safe=False)
+
+
+def _typed_batch(batch, schema):
+    columns = [
+        _convert(batch.column(i), field.type) if _lenient(field) else batch.column(i)
+        for i, field in enumerate(schema)
+    ]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def write_table(name, csv_dir=CSV_DIR, block_size=1 << 22):
+    schema = SCHEMAS[name]
+    read_types = {field.name: pa.string() if _lenient(field) else field.type for field in schema}
+    csv_path = os.path.join(csv_dir, f"{name}.csv")
+    out_path = table_path(name)
+    tmp_path = out_path + ".tmp"
+    os.makedirs(COLUMNAR_DIR, exist_ok=True)
+
+    reader = pa_csv.open_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        convert_options=pa_csv.ConvertOptions(column_types=read_types, strings_can_be_null=True),
+    )
+    rows = 0
+    try:
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for batch in reader:
+                writer.write_batch(_typed_batch(batch, schema))
+                rows += batch.num_rows
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, out_path)
+    return rows
+
+
+def write_all(csv_dir=CSV_DIR):
+    if not available():
+        print("pyarrow not installed — skipping columnar output.")
+        return
+    for name in SCHEMAS:
+        try:
+            rows = write_table(name, csv_dir)
+        except (pa.ArrowException, OSError, ValueError) as e:
+            # read_table() ignores the stale copy (older than its CSV), so readers fall back to the CSV
+            print(f"Warning: skipping {table_path(name)}: {e}")
+            continue
+        print(f"Wrote {table_path(name)} ({rows} rows)")
+
+
+def from_strings(name, df):
+    """
+    The typed frame read_table() would return, built from `df` holding the
+    table's CSV text in memory (e.g. handed over by the transform), or None
+    without pyarrow.
+    """
+    if not available():
+        return None
+    schema = SCHEMAS[name]
+    columns = []
+    for field in schema:
+        text = df[field.name]
+        # As the CSV reader: an empty cell is null
+        column = pa.array(text.to_numpy(dtype=object), type=pa.string(), mask=(text == "").to_numpy())
+        if _lenient(field):
+            column = _convert(column, field.type)
+        elif pa.types.is_dictionary(field.type):
+            column = column.dictionary_encode()
+        columns.append(column)
+    return pa.Table.from_arrays(columns, schema=schema).to_pandas()
+
+
+def read_table(name, csv_dir=CSV_DIR):
+    """
+    Returns the Parquet copy of `name` as a DataFrame, or None when pyarrow is
+    missing or the Parquet file is absent or older than its CSV.
+    """
+    if not available():
+        return None
+    path = table_path(name)
+    csv_path = os.path.join(csv_dir, f"{name}.csv")
+    if not os.path.exists(path):
+        return None
+    if os.path.exists(csv_path) and os.path.getmtime(csv_path) > os.path.getmtime(path):
+        return None
+    return pq.read_table(path).to_pandas()
@@ -1,20 +1,120 @@
 # src/count_docs.py
-from google.cloud import firestore
+"""
+Quick collection stats for the Firestore pipeline.
+
+By default every number comes from a server-side COUNT aggregation, so
+nothing but the counts crosses the wire:
+ - documents per collection
+ - interactions per type
+
+--per-recipe adds one count query per recipe (recipe ids are listed without
+reading the documents). --profile opts into a full projected scan of the
+interactions collection for numbers counts cannot give (distinct users,
+unexpected types, rating coverage).
+"""
+import json
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from utils import get_firestore_client
 
 # Make sure these environment variables are set BEFORE running this script:
 # export FIRESTORE_EMULATOR_HOST="127.0.0.1:8080"
 # export GOOGLE_CLOUD_PROJECT="local-firestore"
+# (or FIRESTORE_BACKEND=memory / file:<path> for the local stand-in)
+
+COLLECTIONS = ["recipes", "users", "interactions"]
+INTERACTION_TYPES = ["view", "like", "attempt"]
+
+def aggregate_count(query):
+    result = query.count(alias="n").get()
+    return result[0][0].value
 
 def count_collection(client, name):
-    docs = list(client.collection(name).stream())
-    return len(docs)
+    return aggregate_count(client.collection(name))
 
-if __name__ == "__main__":
-    client = firestore.Client()
+def count_by_type(client, types=INTERACTION_TYPES):
+    col = client.collection("interactions")
+    return {t: aggregate_count(col.where("type", "==", t)) for t in types}
+
+def count_by_recipe(client, workers=8):
+    col = client.collection("interactions")
+    recipe_ids = [ref.id for ref in client.collection("recipes").list_documents()]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        counts = pool.map(lambda rid: aggregate_count(col.where("recipe_id", "==", rid)), recipe_ids)
+        return dict(zip(recipe_ids, counts))
+
+def profile_interactions(client):
+    # Full scan, but only the fields we need are sent back
+    types, users, recipes = Counter(), set(), set()
+    rated = 0
+    query = client.collection("interactions").select(["type", "user_id", "recipe_id", "rating"])
+    for doc in query.stream():
+        d = doc.to_dict()
+        types[d.get("type")] += 1
+        users.add(d.get("user_id"))
+        recipes.add(d.get("recipe_id"))
+        if d.get("rating") is not None:
+            rated += 1
+    return {
+        "types": dict(types),
+        "unexpected_types": sorted(str(t) for t in types if t not in INTERACTION_TYPES),
+        "distinct_users": len(users),
+        "distinct_recipes": len(recipes),
+        "rated_interactions": rated,
+    }
 
-    for col in ["recipes", "users", "interactions"]:
+def collection_stats(client, per_recipe=False, profile=False):
+    # A failing query is reported in stats["errors"] and the other numbers still come back
+    stats, errors = {}, {}
+
+    def attempt(key, compute):
         try:
-            count = count_collection(client, col)
-            print(f"{col}: {count} documents")
+            stats[key] = compute()
         except Exception as e:
-            print(f"Error reading {col}: {e}")
+            errors[key] = str(e)
+            print(f"Error reading {key}: {e}")
+
+    for col in COLLECTIONS:
+        attempt(col, lambda: count_collection(client, col))
+    attempt("interactions_by_type", lambda: count_by_type(client))
+    if per_recipe:
+        attempt("interactions_by_recipe", lambda: count_by_recipe(client))
+    if profile:
+        attempt("profile", lambda: profile_interactions(client))
+    if errors:
+        stats["errors"] = errors
+    return stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fast document counts for the pipeline collections.")
+    parser.add_argument("--per-recipe", action="store_true",
+                        help="also count interactions per recipe (one count query per recipe)")
+    parser.add_argument("--profile", action="store_true",
+                        help="full projected scan of interactions for distinct users and types")
+    parser.add_argument("--json", action="store_true", help="print the stats as JSON")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    client = get_firestore_client()
+
+    started = time.perf_counter()
+    stats = collection_stats(client, per_recipe=args.per_recipe, profile=args.profile)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        for col in COLLECTIONS:
+            if col in stats:
+                print(f"{col}: {stats[col]} documents")
+        for t, n in stats.get("interactions_by_type", {}).items():
+            print(f"  interactions[{t}]: {n}")
+        for rid, n in sorted(stats.get("interactions_by_recipe", {}).items(), key=lambda kv: -kv[1]):
+            print(f"  interactions[recipe_id={rid}]: {n}")
+        if "profile" in stats:
+            for key, value in stats["profile"].items():
+                print(f"  {key}: {value}")
+    print(f"({elapsed_ms:.0f} ms)")
@@ -1,27 +1,370 @@
 # export_firestore.py
 """
 Reads all documents from collections: recipes, users, interactions
-and dumps them into outputs/raw_json/<collection>.json
+and streams them into outputs/raw_json/<collection>.jsonl
+
+Collections are paged through with cursors and every document is written
+as soon as it arrives, so memory stays flat regardless of collection size.
+Pass --format json for the legacy single JSON array.
+
+With --incremental, append-only collections (see INCREMENTAL_FIELDS) are
+only queried for documents at or after their persisted high-water mark
+minus a lookback window, and new documents are appended to the existing
+snapshot. Documents already exported inside the window are skipped, and
+ones older than the previous mark are reported as late arrivals. Events
+arriving later than the lookback window, or lacking the watermark field,
+are only picked up by a full refresh (--full-refresh, or automatically
+when no state or snapshot exists yet).
+
+With --workers N, collections are exported concurrently and each one is
+split into --partitions document-id key ranges that are read in parallel
+and concatenated, in key order, into a single snapshot. With --incremental
+the watermark query of an append-only collection is split the same way, so
+interactions (the largest collection) is read in parallel either way.
 """
-import os, json
-from google.cloud import firestore
-from utils import get_firestore_client, write_json_file
+import os, json, shutil, argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from utils import get_firestore_client, read_json_file, write_json_file
+import metrics
 
 client = get_firestore_client()
 
-def dump_collection(name):
-    docs = []
+RAW_DIR = os.path.join("outputs", "raw_json")
+STATE_PATH = os.path.join(RAW_DIR, "_export_state.json")
+COLLECTIONS = ["recipes", "users", "interactions"]
+PAGE_SIZE = 1000
+
+# Document ids are split on two-character prefixes of this alphabet; interaction
+# ids are uuid4 hex so the ranges come out evenly sized. Ids outside it are still
+# exported, they just land in the first or last range.
+KEY_ALPHABET = "0123456789abcdef"
+
+# Append-only collections and the ISO timestamp field used as their watermark
+INCREMENTAL_FIELDS = {"interactions": "timestamp"}
+LOOKBACK_HOURS = 24
+
+def _cutoff(value, lookback):
+    return (datetime.fromisoformat(value) - lookback).isoformat()
+
+class WatermarkTracker:
+    """
+    Tracks the highest watermark value seen, plus the ids of documents inside
+    the lookback window below it so a re-read of the window can be de-duplicated.
+    """
+
+    def __init__(self, lookback, watermark=None, recent=None):
+        self.lookback = lookback
+        self.watermark = watermark
+        self.recent = dict(recent or {})
+        self._prune_at = max(1024, 2 * len(self.recent))
+
+    def observe(self, doc_id, value):
+        if not isinstance(value, str):
+            return
+        if self.watermark is None or value > self.watermark:
+            self.watermark = value
+        self.recent[doc_id] = value
+        if len(self.recent) >= self._prune_at:
+            self._prune()
+            self._prune_at = max(1024, 2 * len(self.recent))
+
+    def _prune(self):
+        if self.watermark is None:
+            return
+        since = _cutoff(self.watermark, self.lookback)
+        self.recent = {k: v for k, v in self.recent.items() if v >= since}
+
+    def merge(self, other):
+        if other.watermark is not None and (self.watermark is None or other.watermark > self.watermark):
+            self.watermark = other.watermark
+        self.recent.update(other.recent)
+
+    def state(self):
+        self._prune()
+        return {"watermark": self.watermark, "recent": self.recent}
+
+def load_state():
+    return read_json_file(STATE_PATH) if os.path.exists(STATE_PATH) else {}
+
+def key_ranges(partitions, alphabet=KEY_ALPHABET):
+    # Contiguous [start, end) document-id ranges covering the whole key space
+    size = len(alphabet)
+    bounds = set()
+    for i in range(1, partitions):
+        k = i * size * size // partitions
+        bounds.add(alphabet[k // size] + alphabet[k % size])
+    edges = [None] + sorted(bounds) + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+def iter_documents(query, page_size=PAGE_SIZE, order_field=None, start=None, end=None):
+    # Cursor-based pagination: only one page is held in memory at a time
+    if order_field:
+        query = query.order_by(order_field)
+    query = query.order_by("__name__")
+    if start is not None:
+        query = query.start_at({"__name__": start})
+    if end is not None:
+        query = query.end_before({"__name__": end})
+    last = None
+    while True:
+        page = query.limit(page_size)
+        if last is not None:
+            page = page.start_after(last)
+        docs = list(page.stream())
+        yield from docs
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+def _to_record(doc):
+    d = doc.to_dict()
+    d["_id"] = doc.id
+    return d
+
+def dump_collection(name, page_size=PAGE_SIZE, fmt="jsonl", tracker=None):
+    out_path = os.path.join(RAW_DIR, f"{name}.{fmt}")
+    tmp_path = out_path + ".tmp"
+    os.makedirs(RAW_DIR, exist_ok=True)
+    field = INCREMENTAL_FIELDS.get(name)
+    count = 0
+    with metrics.span("dump_collection", collection=name) as span, \
+         open(tmp_path, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            f.write("[")
+        for doc in iter_documents(client.collection(name), page_size):
+            d = _to_record(doc)
+            line = json.dumps(d, ensure_ascii=False)
+            if fmt == "json":
+                f.write(("," if count else "") + "\n  " + line)
+            else:
+                f.write(line + "\n")
+            if tracker is not None:
+                tracker.observe(doc.id, d.get(field))
+            count += 1
+        if fmt == "json":
+            f.write("\n]\n")
+        span.rows = count
+    # Only replace the previous snapshot once this one is complete
+    os.replace(tmp_path, out_path)
+    print(f"Dumped {count} docs from {name} to {out_path}")
+    return out_path
+
+def _dump_range(name, start, end, path, page_size, lookback):
+    field = INCREMENTAL_FIELDS.get(name)
+    tracker = WatermarkTracker(lookback)
+    count = 0
+    with metrics.span("dump_range", collection=name, start=start, end=end) as span, \
+         open(path, "w", encoding="utf-8") as f:
+        for doc in iter_documents(client.collection(name), page_size, start=start, end=end):
+            d = _to_record(doc)
+            f.write(json.dumps(d, ensure_ascii=False) + "\n")
+            tracker.observe(doc.id, d.get(field))
+            count += 1
+        span.rows = count
+    return count, tracker
+
+def dump_partitioned(name, pool, partitions, page_size=PAGE_SIZE, lookback=None):
+    """
+    Submits one read per key range of `name` to `pool`. Returns (out_path, parts);
+    pass both to finish_partitioned() to merge the parts into one .jsonl snapshot.
+    """
+    out_path = os.path.join(RAW_DIR, f"{name}.jsonl")
+    os.makedirs(RAW_DIR, exist_ok=True)
+    lookback = lookback or timedelta(hours=LOOKBACK_HOURS)
+    parts = []
+    for i, (start, end) in enumerate(key_ranges(partitions)):
+        part_path = f"{out_path}.part{i:03d}"
+        parts.append((part_path, pool.submit(_dump_range, name, start, end, part_path, page_size, lookback)))
+    return out_path, parts
+
+def finish_partitioned(name, out_path, parts, lookback=None):
+    # Waits for every range, then concatenates the parts in key order
+    tracker = WatermarkTracker(lookback or timedelta(hours=LOOKBACK_HOURS))
+    total = 0
+    tmp_path = out_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as out:
+            for part_path, future in parts:
+                count, part_tracker = future.result()
+                total += count
+                tracker.merge(part_tracker)
+                with open(part_path, "rb") as f:
+                    shutil.copyfileobj(f, out)
+    finally:
+        for part_path, _ in parts:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+    os.replace(tmp_path, out_path)
+    print(f"Dumped {total} docs from {name} to {out_path} ({len(parts)} partitions)")
+    return tracker
+
+def _discard_partitioned(parts):
+    # Waits for every range of an export that will not be finished, then removes its parts
+    for part_path, future in parts:
+        future.exception()
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+def _incremental_query(name, since, start=None, end=None):
     col = client.collection(name)
-    for doc in col.stream():
-        d = doc.to_dict()
-        d["_id"] = doc.id
-        docs.append(d)
-    out_path = os.path.join("outputs", "raw_json", f"{name}.json")
-    write_json_file(out_path, docs)
-    print(f"Dumped {len(docs)} docs from {name} to {out_path}")
+    query = col.where(INCREMENTAL_FIELDS[name], ">=", since)
+    # Key ranges as document-id filters: the watermark field already orders the results
+    if start is not None:
+        query = query.where("__name__", ">=", col.document(start))
+    if end is not None:
+        query = query.where("__name__", "<", col.document(end))
+    return query
+
+def _dump_incremental_range(name, since, previous, seen, path, lookback, page_size, mode="w",
+                            start=None, end=None):
+    # Writes the documents of one key range past the watermark that are not in `seen`
+    field = INCREMENTAL_FIELDS[name]
+    tracker = WatermarkTracker(lookback)
+    new = late = 0
+    with metrics.span("dump_incremental", collection=name, start=start, end=end) as span, \
+         open(path, mode, encoding="utf-8") as f:
+        for doc in iter_documents(_incremental_query(name, since, start, end), page_size, order_field=field):
+            if doc.id in seen:
+                continue
+            d = _to_record(doc)
+            f.write(json.dumps(d, ensure_ascii=False) + "\n")
+            if d.get(field) <= previous:
+                late += 1
+            else:
+                new += 1
+            tracker.observe(doc.id, d.get(field))
+        span.rows = new + late
+    return new, late, tracker
+
+def dump_incremental(name, state, lookback, page_size=PAGE_SIZE, pool=None, partitions=1):
+    """
+    Appends the documents of `name` past the stored watermark (re-reading the
+    lookback window below it) to its .jsonl snapshot. With a `pool` and
+    partitions > 1 the watermark query is split into document-id key ranges
+    read in parallel; their documents are appended in key-range order, each
+    range ordered by the watermark field.
+    """
+    field = INCREMENTAL_FIELDS[name]
+    out_path = os.path.join(RAW_DIR, f"{name}.jsonl")
+    entry = state.get(name) or {}
+    if not entry.get("watermark") or not os.path.exists(out_path):
+        print(f"No watermark for {name} yet, running a full refresh")
+        if pool is not None and partitions > 1:
+            tracker = finish_partitioned(name, *dump_partitioned(name, pool, partitions, page_size, lookback),
+                                         lookback)
+        else:
+            tracker = WatermarkTracker(lookback)
+            dump_collection(name, page_size, "jsonl", tracker)
+        state[name] = {"field": field, **tracker.state()}
+        return out_path
+
+    previous = entry["watermark"]
+    tracker = WatermarkTracker(lookback, previous, entry.get("recent"))
+    seen = set(tracker.recent)
+    since = _cutoff(previous, lookback)
+
+    if pool is None or partitions <= 1:
+        new, late, appended = _dump_incremental_range(name, since, previous, seen, out_path, lookback,
+                                                      page_size, mode="a")
+        tracker.merge(appended)
+    else:
+        parts = []
+        for i, (start, end) in enumerate(key_ranges(partitions)):
+            part_path = f"{out_path}.part{i:03d}"
+            parts.append((part_path, pool.submit(_dump_incremental_range, name, since, previous, seen,
+                                                 part_path, lookback, page_size, "w", start, end)))
+        new = late = 0
+        try:
+            # Every range must succeed before anything is appended to the snapshot
+            results = [future.result() for _, future in parts]
+            with open(out_path, "ab") as out:
+                for (part_path, _), (part_new, part_late, appended) in zip(parts, results):
+                    new, late = new + part_new, late + part_late
+                    tracker.merge(appended)
+                    with open(part_path, "rb") as f:
+                        shutil.copyfileobj(f, out)
+        finally:
+            for part_path, _ in parts:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+    state[name] = {"field": field, **tracker.state()}
+    print(f"Appended {new + late} docs from {name} to {out_path} "
+          f"({late} late arrivals since {since}, watermark now {tracker.watermark})")
     return out_path
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export Firestore collections to outputs/raw_json.")
+    parser.add_argument("--format", choices=["jsonl", "json"], default="jsonl",
+                        help="jsonl writes one document per line; json writes a single array")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE,
+                        help="documents fetched per paginated query")
+    parser.add_argument("--incremental", action="store_true",
+                        help="append only documents past the stored watermark for append-only collections")
+    parser.add_argument("--full-refresh", action="store_true",
+                        help="re-export everything and reset the stored watermarks")
+    parser.add_argument("--lookback-hours", type=float, default=LOOKBACK_HOURS,
+                        help="window below the watermark re-read to catch late-arriving events")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="threads used to export collections and key ranges in parallel")
+    parser.add_argument("--partitions", type=int, default=None,
+                        help="key ranges each collection is split into (default: --workers)")
+    args = parser.parse_args()
+    if (args.incremental or args.workers > 1) and args.format != "jsonl":
+        parser.error("--incremental and --workers require --format jsonl")
+    return args
+
+def export(fmt="jsonl", page_size=PAGE_SIZE, incremental=False, full_refresh=False,
+           lookback_hours=LOOKBACK_HOURS, workers=1, partitions=None):
+    lookback = timedelta(hours=lookback_hours)
+    state = {} if full_refresh else load_state()
+    incremental_cols = [c for c in COLLECTIONS
+                        if incremental and not full_refresh and c in INCREMENTAL_FIELDS]
+
+    if workers > 1:
+        full_cols = [c for c in COLLECTIONS if c not in incremental_cols]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = [(c, *dump_partitioned(c, pool, partitions or workers, page_size, lookback))
+                       for c in full_cols]
+            try:
+                for c in incremental_cols:
+                    dump_incremental(c, state, lookback, page_size, pool, partitions or workers)
+                while pending:
+                    c, out_path, parts = pending.pop(0)
+                    tracker = finish_partitioned(c, out_path, parts, lookback)
+                    if c in INCREMENTAL_FIELDS:
+                        state[c] = {"field": INCREMENTAL_FIELDS[c], **tracker.state()}
+            finally:
+                # After a failure, drop the parts of the collections not finished yet
+                for _, _, parts in pending:
+                    _discard_partitioned(parts)
+        write_json_file(STATE_PATH, state)
+        return state
+
+    for c in COLLECTIONS:
+        if c in incremental_cols:
+            dump_incremental(c, state, lookback, page_size)
+        elif c in INCREMENTAL_FIELDS and fmt == "jsonl":
+            tracker = WatermarkTracker(lookback)
+            dump_collection(c, page_size, fmt, tracker)
+            state[c] = {"field": INCREMENTAL_FIELDS[c], **tracker.state()}
+        else:
+            dump_collection(c, page_size=page_size, fmt=fmt)
+            state.pop(c, None)
+        write_json_file(STATE_PATH, state)
+    return state
+
 if __name__ == "__main__":
-    os.makedirs("outputs/raw_json", exist_ok=True)
-    for c in ["recipes", "users", "interactions"]:
-        dump_collection(c)
+    args = parse_args()
+    export(
+        fmt=args.format,
+        page_size=args.page_size,
+        incremental=args.incremental,
+        full_refresh=args.full_refresh,
+        lookback_hours=args.lookback_hours,
+        workers=args.workers,
+        partitions=args.partitions,
+    )
+    if hasattr(client, "stats"):
+        stats = client.stats()
+        print(f"Local backend: {stats['rpcs']} round trips, {stats['simulated_latency_s']}s simulated latency")
@@ -0,0 +1,467 @@
+# firestore_local.py
+"""
+A local stand-in for google.cloud.firestore.Client, covering the calls this
+project makes:
+
+ - client.collection(name).document(id).set(data) / .get()
+ - collection.list_documents(), client.batch().set(...) / .commit()
+ - queries: where (also on "__name__", against document references or
+   ids), order_by, limit, select, start_at / start_after /
+   end_at / end_before (snapshots, {"__name__": ...} dicts or value lists),
+   stream() / get() and count(alias).get()
+
+Documents live in a process-wide LocalStore. With a path the store is also
+an append-only JSON-lines log, replayed on start, so separate processes
+(seed, then export) see the same data.
+
+Every call that would be a round trip to Firestore goes through
+LocalClient._rpc(), which counts it and sleeps for the simulated latency,
+so client-side cost and network cost can be measured separately (stats()).
+
+Select it with FIRESTORE_BACKEND=memory or FIRESTORE_BACKEND=file:<path>
+(see utils.get_firestore_client) and FIRESTORE_LATENCY_MS=<ms>.
+"""
+import os
+import copy
+import json
+import time
+import uuid
+import bisect
+import threading
+from functools import cmp_to_key
+
+ASCENDING = "ASCENDING"
+DESCENDING = "DESCENDING"
+NAME = "__name__"
+
+
+# ---------------------------------------------------
+# STORE
+# ---------------------------------------------------
+
+class LocalStore:
+    """{collection: {doc_id: data}}, optionally persisted to a JSON-lines log."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.collections = {}
+        self._sorted_ids = {}
+        self.lock = threading.RLock()
+        self._log = None
+        if path:
+            if os.path.exists(path):
+                self._replay(path)
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._log = open(path, "a", encoding="utf-8")
+
+    def _replay(self, path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                docs = self.collections.setdefault(entry["c"], {})
+                if entry.get("d") is None:
+                    docs.pop(entry["id"], None)
+                else:
+                    docs[entry["id"]] = entry["d"]
+
+    def apply(self, ops):
+        """Applies [(collection, doc_id, data or None to delete, merge)] atomically."""
+        with self.lock:
+            lines = []
+            for collection, doc_id, data, merge in ops:
+                docs = self.collections.setdefault(collection, {})
+                if data is None:
+                    docs.pop(doc_id, None)
+                else:
+                    if merge and doc_id in docs:
+                        data = {**docs[doc_id], **data}
+                    docs[doc_id] = copy.deepcopy(data)
+                self._sorted_ids.pop(collection, None)
+                if self._log is not None:
+                    lines.append(json.dumps({"c": collection, "id": doc_id, "d": docs.get(doc_id)},
+                                            ensure_ascii=False, default=str))
+            if lines:
+                self._log.write("\n".join(lines) + "\n")
+                self._log.flush()
+
+    def read(self, collection, doc_id):
+        with self.lock:
+            return self.collections.get(collection, {}).get(doc_id)
+
+    def sorted_ids(self, collection):
+        with self.lock:
+            ids = self._sorted_ids.get(collection)
+            if ids is None:
+                ids = self._sorted_ids[collection] = sorted(self.collections.get(collection, {}))
+            return ids
+
+    def documents(self, collection):
+        with self.lock:
+            return list(self.collections.get(collection, {}).items())
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+
+# ---------------------------------------------------
+# DOCUMENTS
+# ---------------------------------------------------
+
+def _field(data, path):
+    value = data
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            raise KeyError(path)
+        value = value[part]
+    return value
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, fields=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+        self._fields = fields
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        if self._fields is None:
+            return copy.deepcopy(self._data)
+        return {f: copy.deepcopy(self._data[f]) for f in self._fields if f in self._data}
+
+    def get(self, field_path):
+        return copy.deepcopy(_field(self._data or {}, field_path))
+
+
+class DocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self.id = doc_id
+        self.parent = CollectionReference(client, collection)
+        self.path = f"{collection}/{doc_id}"
+
+    def set(self, document_data, merge=False):
+        self._client._rpc()
+        self._client._store.apply([(self.parent.id, self.id, document_data, merge)])
+
+    def get(self):
+        self._client._rpc()
+        return DocumentSnapshot(self, self._client._store.read(self.parent.id, self.id))
+
+    def delete(self):
+        self._client._rpc()
+        self._client._store.apply([(self.parent.id, self.id, None, False)])
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, document_data, merge=False):
+        self._ops.append((reference.parent.id, reference.id, document_data, merge))
+
+    def delete(self, reference):
+        self._ops.append((reference.parent.id, reference.id, None, False))
+
+    def __len__(self):
+        return len(self._ops)
+
+    def commit(self):
+        self._client._rpc()
+        self._client._store.apply(self._ops)
+        ops, self._ops = self._ops, []
+        return ops
+
+
+# ---------------------------------------------------
+# QUERIES
+# ---------------------------------------------------
+
+def _type_rank(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    return 4
+
+
+def _compare(a, b):
+    # Firestore orders values of different types by type first
+    ra, rb = _type_rank(a), _type_rank(b)
+    if ra != rb:
+        return -1 if ra < rb else 1
+    if ra == 4:
+        a, b = str(a), str(b)
+    return (a > b) - (a < b)
+
+
+def _matches(value, op, target):
+    if op == "==":
+        return _compare(value, target) == 0
+    if op == "!=":
+        return _compare(value, target) != 0
+    if op == "in":
+        return any(_compare(value, t) == 0 for t in target)
+    if op == "not-in":
+        return all(_compare(value, t) != 0 for t in target)
+    if op == "array-contains":
+        return isinstance(value, list) and target in value
+    if op == "array-contains-any":
+        return isinstance(value, list) and any(t in value for t in target)
+    # Range filters only match values of the same type
+    if _type_rank(value) != _type_rank(target):
+        return False
+    c = _compare(value, target)
+    return {"<": c < 0, "<=": c <= 0, ">": c > 0, ">=": c >= 0}[op]
+
+
+def _name_value(value):
+    # Filters on document ids take references (as Firestore requires), ids or paths
+    if isinstance(value, (list, tuple)):
+        return [_name_value(v) for v in value]
+    if isinstance(value, DocumentReference):
+        return value.id
+    return value.rsplit("/", 1)[-1] if isinstance(value, str) else value
+
+
+class AggregationResult:
+    def __init__(self, alias, value):
+        self.alias, self.value = alias, value
+
+
+class AggregationQuery:
+    def __init__(self, query, alias):
+        self._query, self._alias = query, alias or "field_1"
+
+    def get(self):
+        self._query._client._rpc()
+        return [[AggregationResult(self._alias, sum(1 for _ in self._query._run()))]]
+
+
+class Query:
+    def __init__(self, client, collection, filters=(), orders=(), limit=None,
+                 start=None, end=None, projection=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start = start
+        self._end = end
+        self._projection = projection
+
+    def _copy(self, **changes):
+        fields = dict(filters=self._filters, orders=self._orders, limit=self._limit,
+                      start=self._start, end=self._end, projection=self._projection)
+        fields.update(changes)
+        return Query(self._client, self._collection, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self._copy(projection=list(field_paths))
+
+    def start_at(self, document_fields_or_snapshot):
+        return self._copy(start=(document_fields_or_snapshot, False))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start=(document_fields_or_snapshot, True))
+
+    def end_at(self, document_fields_or_snapshot):
+        return self._copy(end=(document_fields_or_snapshot, False))
+
+    def end_before(self, document_fields_or_snapshot):
+        return self._copy(end=(document_fields_or_snapshot, True))
+
+    def count(self, alias=None):
+        return AggregationQuery(self, alias)
+
+    def stream(self, transaction=None):
+        self._client._rpc()
+        return iter(self._run())
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction))
+
+    # ----- evaluation -----
+
+    def _order_fields(self):
+        orders = list(self._orders)
+        if not any(f == NAME for f, _ in orders):
+            # Results are always tie-broken by document id
+            direction = orders[-1][1] if orders else ASCENDING
+            orders.append((NAME, direction))
+        return orders
+
+    def _cursor_values(self, cursor, orders):
+        if isinstance(cursor, DocumentSnapshot):
+            values = [cursor.id if f == NAME else cursor._data.get(f) for f, _ in orders]
+        elif isinstance(cursor, dict):
+            values = [cursor[f] for f, _ in orders if f in cursor]
+        else:
+            values = list(cursor)
+        # Cursors on document ids may also be given as references or full paths
+        return [v.id if isinstance(v, DocumentReference) else
+                v.rsplit("/", 1)[-1] if f == NAME and isinstance(v, str) else v
+                for v, (f, _) in zip(values, orders)]
+
+    def _compare_to_cursor(self, key, values, orders):
+        for k, v, (_, direction) in zip(key, values, orders):
+            c = _compare(k, v)
+            if c:
+                return c if direction == ASCENDING else -c
+        return 0
+
+    def _run(self):
+        orders = self._order_fields()
+        store = self._client._store
+
+        if not self._filters and orders == [(NAME, ASCENDING)]:
+            # Key-ordered scans (cursor pagination, key ranges) bisect the
+            # sorted id list instead of sorting the collection
+            ids = store.sorted_ids(self._collection)
+            lo, hi = 0, len(ids)
+            if self._start is not None:
+                value = self._cursor_values(self._start[0], orders)[0]
+                lo = (bisect.bisect_right if self._start[1] else bisect.bisect_left)(ids, value)
+            if self._end is not None:
+                value = self._cursor_values(self._end[0], orders)[0]
+                hi = (bisect.bisect_left if self._end[1] else bisect.bisect_right)(ids, value)
+            if self._limit is not None:
+                hi = min(hi, lo + self._limit)
+            for doc_id in ids[lo:hi]:
+                data = store.read(self._collection, doc_id)
+                if data is not None:
+                    yield self._snapshot(doc_id, data)
+            return
+
+        rows = []
+        for doc_id, data in store.documents(self._collection):
+            try:
+                if not all(_matches(doc_id, op, _name_value(v)) if f == NAME else _matches(_field(data, f), op, v)
+                           for f, op, v in self._filters):
+                    continue
+                key = [doc_id if f == NAME else _field(data, f) for f, _ in orders]
+            except KeyError:
+                # Documents missing a filtered or ordered field never match
+                continue
+            rows.append((key, doc_id, data))
+
+        def by_key(a, b):
+            return self._compare_to_cursor(a[0], b[0], orders)
+        rows.sort(key=cmp_to_key(by_key))
+
+        start = self._start and (self._cursor_values(self._start[0], orders), self._start[1])
+        end = self._end and (self._cursor_values(self._end[0], orders), self._end[1])
+        emitted = 0
+        for key, doc_id, data in rows:
+            if start:
+                c = self._compare_to_cursor(key, start[0], orders)
+                if c < 0 or (c == 0 and start[1]):
+                    continue
+            if end:
+                c = self._compare_to_cursor(key, end[0], orders)
+                if c > 0 or (c == 0 and end[1]):
+                    break
+            if self._limit is not None and emitted >= self._limit:
+                break
+            emitted += 1
+            yield self._snapshot(doc_id, data)
+
+    def _snapshot(self, doc_id, data):
+        ref = DocumentReference(self._client, self._collection, doc_id)
+        return DocumentSnapshot(ref, data, self._projection)
+
+
+class CollectionReference(Query):
+    def __init__(self, client, collection):
+        super().__init__(client, collection)
+        self.id = collection
+
+    def document(self, document_id=None):
+        return DocumentReference(self._client, self.id, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        ref = self.document(document_id)
+        ref.set(document_data)
+        return time.time(), ref
+
+    def list_documents(self, page_size=None):
+        self._client._rpc()
+        return [DocumentReference(self._client, self.id, doc_id)
+                for doc_id in list(self._client._store.sorted_ids(self.id))]
+
+
+# ---------------------------------------------------
+# CLIENT
+# ---------------------------------------------------
+
+class LocalClient:
+    """
+    Drop-in for firestore.Client on top of a LocalStore. `latency_ms` is
+    slept on every simulated round trip (outside the store lock, so
+    concurrent callers overlap like real requests do).
+    """
+
+    def __init__(self, store=None, latency_ms=0.0, project="local"):
+        self._store = store if store is not None else LocalStore()
+        self.project = project
+        self.latency = latency_ms / 1000.0
+        self._lock = threading.Lock()
+        self._rpcs = 0
+
+    def _rpc(self):
+        with self._lock:
+            self._rpcs += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, collection_path):
+        return CollectionReference(self, collection_path)
+
+    def document(self, document_path):
+        collection, doc_id = document_path.rsplit("/", 1)
+        return DocumentReference(self, collection, doc_id)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def stats(self):
+        """Round trips made so far and the simulated network time they stand for."""
+        with self._lock:
+            return {"rpcs": self._rpcs, "simulated_latency_s": round(self._rpcs * self.latency, 3)}
+
+    def close(self):
+        self._store.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def shared_store(path=None):
+    """One store per path (None = in-memory) per process, shared by every client."""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = LocalStore(path)
+        return _stores[path]
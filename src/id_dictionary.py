@@ -0,0 +1,167 @@
+# id_dictionary.py
+"""
+Persistent ID dictionaries giving recipes, users and interaction types stable,
+dense integer codes (0, 1, 2, ... in order of first appearance):
+ - outputs/ids/recipe.csv
+ - outputs/ids/user.csv
+ - outputs/ids/type.csv
+
+The row number of an id is its code. Files are only ever appended to, so a
+code never changes once assigned, and the transform writes the codes next to
+the string ids (recipe_code, user_code, type_code). Interactions referencing
+a recipe or user that is not in the dictionary get -1.
+
+With the codes, per-recipe/per-user aggregation is np.bincount over an int
+array and joins between tables are array indexing (see reduce_by and join);
+rows without a code fall back to grouping by the string id.
+"""
+import os
+import csv
+import numpy as np
+import pandas as pd
+
+IDS_DIR = os.path.join("outputs", "ids")
+KINDS = ("recipe", "user", "type")
+MISSING = -1
+
+
+class IdDictionary:
+    def __init__(self, kind, ids_dir=IDS_DIR):
+        self.kind = kind
+        self.path = os.path.join(ids_dir, f"{kind}.csv")
+        self.ids = []
+        if os.path.exists(self.path):
+            self.ids = pd.read_csv(self.path, dtype=str, keep_default_na=False)["id"].tolist()
+        self.codes_by_id = {value: code for code, value in enumerate(self.ids)}
+        self.saved = len(self.ids)
+        self._index = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def code(self, value):
+        """The code of `value`, assigning the next one if it is new (MISSING for no id)."""
+        if value is None or value == "":
+            return MISSING
+        value = str(value)
+        code = self.codes_by_id.get(value)
+        if code is None:
+            code = self.codes_by_id[value] = len(self.ids)
+            self.ids.append(value)
+            self._index = None
+        return code
+
+    def lookup(self, value):
+        """The code of `value` without assigning one: MISSING when unknown."""
+        if value is None:
+            return MISSING
+        return self.codes_by_id.get(str(value), MISSING)
+
+    def index(self):
+        if self._index is None:
+            self._index = pd.Index(self.ids, dtype=object)
+        return self._index
+
+    def codes(self, values):
+        """Vectorized lookup() of an array of ids."""
+        return self.index().get_indexer(pd.Index(values).astype(str))
+
+    def decode(self, codes):
+        return np.asarray(self.ids, dtype=object)[np.asarray(codes, dtype=np.int64)]
+
+    def save(self):
+        """Appends the ids assigned since the dictionary was loaded."""
+        if self.saved == len(self.ids):
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(["id"])
+            writer.writerows([value] for value in self.ids[self.saved:])
+        self.saved = len(self.ids)
+
+
+def load(kind, ids_dir=IDS_DIR):
+    return IdDictionary(kind, ids_dir)
+
+
+def has_codes(frame, kind):
+    return f"{kind}_code" in frame.columns
+
+
+def _codes(frame, kind):
+    return pd.to_numeric(frame[f"{kind}_code"], errors="coerce").fillna(MISSING).to_numpy(dtype=np.int64)
+
+
+# ---------------------------------------------------
+# AGGREGATION AND JOINS
+# ---------------------------------------------------
+
+_REDUCERS = {"min": np.fmin, "max": np.fmax}
+
+
+def reduce_by(frame, kind, columns, dictionary=None):
+    """
+    Reduces `columns` ({name: (array, "sum" | "min" | "max")}) per `kind` id
+    of the rows of `frame`. Rows with a code are reduced with np.bincount /
+    ufunc.at over the dense codes, the others by grouping their string id.
+    Returns a frame indexed by the string ids that occur.
+    """
+    key = f"{kind}_id"
+    if not has_codes(frame, kind):
+        return _reduce_by_id(frame[key].to_numpy(), columns, np.ones(len(frame), dtype=bool), key)
+    dictionary = load(kind) if dictionary is None else dictionary
+    codes = _codes(frame, kind)
+    known = (codes >= 0) & (codes < len(dictionary))
+    size = len(dictionary)
+    known_codes = codes[known]
+    present = np.flatnonzero(np.bincount(known_codes, minlength=size))
+
+    out = {}
+    for name, (values, how) in columns.items():
+        values = np.asarray(values)[known]
+        if how == "sum":
+            total = np.bincount(known_codes, weights=values, minlength=size)
+            out[name] = total[present].astype(values.dtype if values.dtype.kind in "iu" else np.float64)
+        else:
+            acc = np.full(size, np.nan)
+            _REDUCERS[how].at(acc, known_codes, values.astype(np.float64))
+            out[name] = acc[present]
+    result = pd.DataFrame(out, index=pd.Index(dictionary.decode(present), name=key))
+    if known.all():
+        return result
+    rest = _reduce_by_id(frame[key].to_numpy(), columns, ~known, key)
+    combined = pd.concat([result, rest]).groupby(level=0).agg({n: how for n, (_, how) in columns.items()})
+    return combined.rename_axis(key)
+
+
+def _reduce_by_id(ids, columns, mask, key):
+    ids = pd.Series(ids[mask])
+    keep = ids.notna() & (ids.astype(str) != "")
+    parts = pd.DataFrame({name: np.asarray(values)[mask] for name, (values, _) in columns.items()})[keep.to_numpy()]
+    grouped = parts.groupby(ids[keep].astype(str).to_numpy())
+    result = grouped.agg({name: how for name, (_, how) in columns.items()})
+    return result.rename_axis(key)
+
+
+def join(frame, kind, values, fill=np.nan, dictionary=None):
+    """
+    `values` (a Series indexed by string id) for every row of `frame`: array
+    indexing on the `kind`_code column when present, otherwise by id.
+    """
+    if not has_codes(frame, kind):
+        return frame[f"{kind}_id"].astype(str).map(values).fillna(fill).to_numpy()
+    dictionary = load(kind) if dictionary is None else dictionary
+    dense = np.full(len(dictionary) + 1, fill, dtype=np.float64)  # spare slot for rows without a code
+    codes = dictionary.codes(values.index)
+    dense[codes[codes >= 0]] = values.to_numpy(dtype=np.float64)[codes >= 0]
+    row_codes = _codes(frame, kind)
+    unknown = (row_codes < 0) | (row_codes >= len(dictionary))
+    row_codes[unknown] = len(dictionary)
+    joined = dense[row_codes]
+    if unknown.any():
+        ids = frame[f"{kind}_id"].to_numpy()[unknown]
+        joined[unknown] = pd.Series(ids).astype(str).map(values).fillna(fill).to_numpy(dtype=np.float64)
+    return joined
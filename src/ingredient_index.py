@@ -0,0 +1,228 @@
+# ingredient_index.py
+"""
+Inverted index over the ingredients table, kept in
+outputs/analytics/ingredient_index.npz:
+
+ - names are canonicalized (case, whitespace, plurals: "Eggs" -> "egg",
+   "Tomatoes" -> "tomato", "berries" -> "berry")
+ - quantity/unit are converted to canonical units (g, ml, pcs), vectorized
+   over the distinct unit strings; unknown units keep quantity NaN
+ - one sorted posting list of recipes per canonical ingredient (CSR arrays),
+   with the canonical quantity each recipe uses
+
+Queries are set operations on the posting lists instead of merges over the
+ingredients table:
+
+    index = ensure_index(ingredients)
+    index.all_of("eggs", "onion")       # recipes containing both
+    index.any_of("milk", "butter")      # recipes containing either
+    index.frequency()                   # recipes per ingredient
+    index.cooccurrence(top=20)          # recipes sharing each pair
+    index.engagement(recipe_metrics["engagement"])
+
+Like similarity.ensure_index(), the index is rebuilt only when the
+ingredients change.
+"""
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+OUT_DIR = os.path.join("outputs", "analytics")
+INDEX_PATH = os.path.join(OUT_DIR, "ingredient_index.npz")
+
+# unit -> (canonical unit, factor)
+UNITS = {
+    **{u: ("g", 1.0) for u in ("g", "gram", "grams", "gr")},
+    **{u: ("g", 1000.0) for u in ("kg", "kilogram", "kilograms")},
+    **{u: ("g", 0.001) for u in ("mg", "milligram", "milligrams")},
+    **{u: ("g", 28.3495) for u in ("oz", "ounce", "ounces")},
+    **{u: ("g", 453.592) for u in ("lb", "lbs", "pound", "pounds")},
+    **{u: ("ml", 1.0) for u in ("ml", "milliliter", "milliliters", "millilitre", "millilitres")},
+    **{u: ("ml", 1000.0) for u in ("l", "liter", "liters", "litre", "litres")},
+    **{u: ("ml", 4.92892) for u in ("tsp", "teaspoon", "teaspoons")},
+    **{u: ("ml", 14.7868) for u in ("tbsp", "tablespoon", "tablespoons")},
+    **{u: ("ml", 236.588) for u in ("cup", "cups")},
+    **{u: ("ml", 29.5735) for u in ("fl oz", "floz")},
+    **{u: ("pcs", 1.0) for u in ("pcs", "pc", "piece", "pieces", "whole", "small", "medium", "large",
+                                  "clove", "cloves", "slice", "slices", "")},
+}
+
+# Words the plural rules below would mangle
+SINGULAR_AS_IS = {"asparagus", "couscous", "hummus", "molasses", "swiss", "bass", "grass", "citrus", "lemongrass"}
+IRREGULAR = {"leaves": "leaf", "loaves": "loaf", "halves": "half", "knives": "knife", "geese": "goose"}
+
+
+def _singular(word):
+    if word in SINGULAR_AS_IS or word in IRREGULAR.values():
+        return word
+    if word in IRREGULAR:
+        return IRREGULAR[word]
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("oes") or word.endswith(("ches", "shes", "sses", "xes", "zes")):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")) and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def canonical_names(names):
+    """Canonical form of a Series of ingredient names; the rules run once per distinct name."""
+    names = pd.Series(names).astype(str)
+    distinct = pd.Series(names.unique())
+    cleaned = distinct.str.lower().str.strip().str.replace(r"\s+", " ", regex=True)
+    # Only the last word is made singular: "green beans" -> "green bean"
+    canonical = cleaned.map(lambda n: " ".join(n.split(" ")[:-1] + [_singular(n.split(" ")[-1])]))
+    return names.map(pd.Series(canonical.to_numpy(), index=distinct.to_numpy())).to_numpy()
+
+
+def canonical_quantities(quantity, unit):
+    """(quantity, unit) in canonical units: grams, millilitres or pieces. Unknown units give NaN/""."""
+    keys = pd.Series(unit).fillna("").astype(str).str.lower().str.strip().str.rstrip(".")
+    distinct = keys.unique()
+    table = pd.DataFrame([UNITS.get(k, ("", np.nan)) for k in distinct], index=distinct, columns=["unit", "factor"])
+    found = table.reindex(keys.to_numpy())
+    amount = pd.to_numeric(pd.Series(quantity), errors="coerce").to_numpy(dtype=np.float64)
+    return amount * found["factor"].to_numpy(dtype=np.float64), found["unit"].to_numpy()
+
+
+class IngredientIndex:
+    def __init__(self, names, units, recipe_ids, ptr, postings, quantities):
+        self.names = pd.Index(names)               # canonical names, sorted
+        self.units = np.asarray(units)             # most common canonical unit per name
+        self.recipe_ids = np.asarray(recipe_ids, dtype=object)
+        self.ptr = ptr                             # postings[ptr[i]:ptr[i + 1]] -> recipes of names[i]
+        self.postings = postings                   # recipe positions, sorted within each list
+        self.quantities = quantities               # canonical quantity per posting (NaN if unknown)
+
+    # ----- posting lists -----
+
+    def _code(self, name):
+        return self.names.get_indexer([canonical_names([name])[0]])[0]
+
+    def _posting(self, name):
+        code = self._code(name)
+        if code < 0:
+            return np.empty(0, dtype=self.postings.dtype)
+        return self.postings[self.ptr[code]:self.ptr[code + 1]]
+
+    def recipes(self, name):
+        return self.recipe_ids[self._posting(name)]
+
+    def all_of(self, *names):
+        """Recipes containing every one of `names`, smallest posting lists intersected first."""
+        lists = sorted((self._posting(n) for n in names), key=len)
+        if not lists:
+            return self.recipe_ids[:0]
+        hits = lists[0]
+        for posting in lists[1:]:
+            hits = np.intersect1d(hits, posting, assume_unique=True)
+        return self.recipe_ids[hits]
+
+    def any_of(self, *names):
+        hits = np.unique(np.concatenate([self._posting(n) for n in names] or [np.empty(0, dtype=np.int64)]))
+        return self.recipe_ids[hits]
+
+    def quantity(self, name):
+        """Canonical quantity of `name` per recipe that uses it, with its unit as the Series name."""
+        code = self._code(name)
+        if code < 0:
+            return pd.Series(dtype=np.float64)
+        window = slice(self.ptr[code], self.ptr[code + 1])
+        return pd.Series(self.quantities[window], index=self.recipe_ids[self.postings[window]],
+                         name=self.units[code])
+
+    # ----- aggregates -----
+
+    def frequency(self):
+        """Number of recipes per ingredient, most common first."""
+        counts = pd.Series(np.diff(self.ptr), index=self.names, name="recipes")
+        return counts.sort_values(ascending=False, kind="stable").rename_axis("name")
+
+    def cooccurrence(self, top=20):
+        """Recipes shared by every pair of the `top` most common ingredients."""
+        names = self.frequency().head(top).index
+        codes = self.names.get_indexer(names)
+        member = np.zeros((len(self.recipe_ids), len(codes)), dtype=np.int32)
+        for column, code in enumerate(codes):
+            member[self.postings[self.ptr[code]:self.ptr[code + 1]], column] = 1
+        return pd.DataFrame(member.T @ member, index=names, columns=names)
+
+    def engagement(self, values):
+        """Mean of `values` (a Series indexed by recipe_id) over the recipes containing each ingredient."""
+        per_recipe = values.reindex(self.recipe_ids).to_numpy(dtype=np.float64)[self.postings]
+        known = ~np.isnan(per_recipe)
+        starts = self.ptr[:-1]
+        nonempty = np.diff(self.ptr) > 0
+        totals = np.zeros(len(self.names))
+        counts = np.zeros(len(self.names))
+        totals[nonempty] = np.add.reduceat(np.where(known, per_recipe, 0.0), starts[nonempty])
+        counts[nonempty] = np.add.reduceat(known.astype(np.float64), starts[nonempty])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.Series(totals / counts, index=self.names, name="engagement").rename_axis("name").dropna()
+
+    # ----- persistence -----
+
+    def save(self, path=INDEX_PATH, fingerprint=""):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, names=np.asarray(self.names, dtype=str), units=self.units.astype(str),
+                 recipe_ids=self.recipe_ids.astype(str), ptr=self.ptr, postings=self.postings,
+                 quantities=self.quantities, fingerprint=np.asarray(fingerprint))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        with np.load(path) as data:
+            return cls(data["names"].astype(object), data["units"].astype(object), data["recipe_ids"],
+                       data["ptr"], data["postings"], data["quantities"]), str(data["fingerprint"])
+
+
+def build_index(ingredients):
+    rows = ingredients[ingredients["recipe_id"].notna() & ingredients["name"].notna()]
+    names = canonical_names(rows["name"])
+    quantity, unit = canonical_quantities(rows["quantity"] if "quantity" in rows else np.nan,
+                                          rows["unit"] if "unit" in rows else "")
+    entries = pd.DataFrame({"name": names, "recipe_id": rows["recipe_id"].astype(str).to_numpy(),
+                            "quantity": quantity, "unit": unit})
+    # A recipe listing an ingredient twice uses the sum
+    grouped = entries.groupby(["name", "recipe_id"], sort=True)
+    entries = pd.DataFrame({"quantity": grouped["quantity"].sum(min_count=1),
+                            "unit": grouped["unit"].first()}).reset_index()
+
+    name_codes, unique_names = pd.factorize(entries["name"], sort=True)
+    recipe_codes, recipe_ids = pd.factorize(entries["recipe_id"], sort=True)
+    ptr = np.zeros(len(unique_names) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(name_codes, minlength=len(unique_names)), out=ptr[1:])
+
+    # Each ingredient is reported in its most common canonical unit; quantities
+    # given in another one (e.g. ml of something usually weighed) are dropped
+    unit_counts = entries[entries["unit"] != ""].groupby(["name", "unit"]).size()
+    units = (unit_counts.sort_values(ascending=False, kind="stable").reset_index()
+             .drop_duplicates("name").set_index("name")["unit"].reindex(unique_names, fill_value=""))
+    quantities = entries["quantity"].to_numpy(dtype=np.float64, copy=True)
+    quantities[entries["unit"].to_numpy() != units.to_numpy()[name_codes]] = np.nan
+
+    # entries are sorted by (name, recipe_id), so the posting lists come out sorted
+    return IngredientIndex(unique_names.to_numpy(dtype=object), units.to_numpy(dtype=object),
+                           recipe_ids.to_numpy(dtype=object), ptr, recipe_codes.astype(np.int64), quantities)
+
+
+def _fingerprint(ingredients):
+    columns = [c for c in ("recipe_id", "name", "quantity", "unit") if c in ingredients.columns]
+    h = hashlib.sha256(repr(sorted(UNITS.items())).encode())
+    h.update(pd.util.hash_pandas_object(ingredients[columns].astype(str), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def ensure_index(ingredients, path=INDEX_PATH):
+    """Loads the persisted index, rebuilding it only when the ingredients changed."""
+    fingerprint = _fingerprint(ingredients)
+    if os.path.exists(path):
+        index, stored = IngredientIndex.load(path)
+        if stored == fingerprint:
+            return index
+    index = build_index(ingredients)
+    index.save(path, fingerprint)
+    return index
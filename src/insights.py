@@ -0,0 +1,167 @@
+# insights.py
+"""
+Builds the text report from the transformed tables:
+ 1. Most common ingredients
+ 2. Average preparation time
+ 3. Difficulty distribution
+ 4. Correlation between prep time and likes
+ 5. Most frequently viewed recipes
+ 6. Ingredients associated with high engagement
+ 7. Top liked recipes
+ 8. Average rating per recipe
+ 9. Views per minute (views/total_minutes)
+10. Users with most attempts
+11. Interactions by type in the last 7 days       (with rollups)
+12. Most active recipes in the last 24 hours      (with rollups)
+
+Interaction sections are answered from the per-recipe/per-user metric frames
+kept by the counter store (aggregates.py) and, for the time windows, from the
+hourly/daily rollups (rollups.py), so no section re-scans interactions.
+Ingredient sections count recipes per canonical ingredient name from the
+posting lists of the ingredient index (ingredient_index.py).
+Writes outputs/analytics/insights.md and a machine-readable insights.json.
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+import ingredient_index
+import rollups
+
+OUT_DIR = os.path.join("outputs", "analytics")
+TOP_N = 10
+
+
+def _top(series, n=TOP_N):
+    series = series[series > 0] if series.dtype.kind in "iu" else series.dropna()
+    return series.sort_values(ascending=False, kind="stable").head(n)
+
+
+def compute_insights(recipes, ingredients, recipe_metrics, user_metrics, trends=None, top_n=TOP_N, index=None):
+    """
+    Returns an ordered list of (title, value) sections; value is a scalar,
+    Series or DataFrame. `trends` is the optional (hourly, daily) rollup pair;
+    `index` the ingredient index, loaded from `ingredients` when not given.
+    """
+    index = ingredient_index.ensure_index(ingredients) if index is None else index
+    recipes = recipes.set_index(recipes["recipe_id"].astype(str))
+    prep = pd.to_numeric(recipes["prep_minutes"], errors="coerce")
+    total = pd.to_numeric(recipes["total_minutes"], errors="coerce")
+    sections = []
+
+    top_ings = index.frequency().head(top_n)
+    sections.append(("Most common ingredients", top_ings.rename("count")))
+
+    sections.append(("Average preparation time (minutes)", round(float(prep.mean()), 2)))
+
+    difficulty = recipes["difficulty"].astype(str).value_counts()
+    sections.append(("Difficulty distribution", difficulty.rename_axis("difficulty").rename("count")))
+
+    # Only recipes with at least one like, as in the original report
+    likes = recipe_metrics["likes"][recipe_metrics["likes"] > 0]
+    pair = pd.concat([likes, prep], axis=1, join="inner").dropna()
+    corr = pair["likes"].corr(pair["prep_minutes"]) if len(pair) > 1 else None
+    sections.append(("Correlation between prep time and likes",
+                     None if corr is None or np.isnan(corr) else round(float(corr), 4)))
+
+    sections.append(("Most frequently viewed recipes", _top(recipe_metrics["views"], top_n)))
+
+    # Average engagement of the recipes containing each ingredient, reduced
+    # over the ingredient posting lists
+    engagement = recipe_metrics["engagement"].reindex(recipes.index, fill_value=0)
+    ing_score = index.engagement(engagement)
+    sections.append(("Ingredients associated with high engagement (avg engagement per recipe containing ingredient)",
+                     ing_score.sort_values(ascending=False, kind="stable").head(top_n)
+                     .rename_axis("name").rename("engagement")))
+
+    sections.append(("Top liked recipes", _top(recipe_metrics["likes"], top_n)))
+
+    sections.append(("Average rating per recipe (top 10)",
+                     _top(recipe_metrics["avg_rating"], top_n).rename("rating")))
+
+    vpm = recipe_metrics[["views"]].join(total.rename("total_minutes"), how="inner")
+    vpm = vpm[vpm["views"] > 0]
+    vpm["views_per_min"] = vpm["views"] / vpm["total_minutes"].replace(0, np.nan)
+    sections.append(("Views per minute (per recipe)",
+                     vpm.sort_values("views_per_min", ascending=False, kind="stable").head(top_n)))
+
+    sections.append(("Users with most attempts", _top(user_metrics["attempts"], top_n)))
+
+    if trends is not None:
+        hourly, daily = trends
+        week = rollups.last(daily, 7 * rollups.DAY, by=("type",), width=rollups.DAY)
+        sections.append(("Interactions by type in the last 7 days", week.rename("count")))
+        day = rollups.last(hourly, rollups.DAY, by=("recipe_id",))
+        sections.append(("Most active recipes in the last 24 hours", _top(day, top_n).rename("interactions")))
+    return sections
+
+
+# ---------------------------------------------------
+# RENDERING
+# ---------------------------------------------------
+
+def _cell(value):
+    if isinstance(value, (float, np.floating)):
+        return "" if np.isnan(value) else f"{value:g}"
+    return str(value)
+
+
+def markdown_table(value):
+    frame = value.to_frame() if isinstance(value, pd.Series) else value
+    headers = [str(frame.index.name or "")] + [str(c) for c in frame.columns]
+    numeric = [False] + [frame[c].dtype.kind in "iuf" for c in frame.columns]
+    rows = [[_cell(i)] + [_cell(v) for v in row] for i, row in zip(frame.index, frame.itertuples(index=False))]
+    widths = [max([len(h)] + [len(r[k]) for r in rows]) for k, h in enumerate(headers)]
+
+    def line(cells):
+        return "| " + " | ".join(c.rjust(w) if num else c.ljust(w)
+                                 for c, w, num in zip(cells, widths, numeric)) + " |"
+
+    rule = "|" + "|".join((("-" * (w + 1)) + ":") if num else (":" + "-" * (w + 1))
+                          for w, num in zip(widths, numeric)) + "|"
+    return "\n".join([line(headers), rule] + [line(r) for r in rows])
+
+
+def render_markdown(sections):
+    md = []
+    for i, (title, value) in enumerate(sections, 1):
+        md.append(f"## {i}. {title}\n")
+        if isinstance(value, (pd.Series, pd.DataFrame)):
+            md.append((markdown_table(value) if len(value) else "No data available") + "\n")
+        else:
+            md.append(f"{'No data available' if value is None else value}\n")
+    return "\n".join(md)
+
+
+def to_json(sections):
+    out = []
+    for i, (title, value) in enumerate(sections, 1):
+        if isinstance(value, pd.Series):
+            data = {str(k): (None if pd.isna(v) else v.item() if hasattr(v, "item") else v)
+                    for k, v in value.items()}
+        elif isinstance(value, pd.DataFrame):
+            data = json.loads(value.reset_index().to_json(orient="records"))
+        else:
+            data = value
+        out.append({"id": i, "title": title, "data": data})
+    return out
+
+
+def write_report(sections, out_dir=OUT_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    md_path = os.path.join(out_dir, "insights.md")
+    json_path = os.path.join(out_dir, "insights.json")
+    with open(md_path, "w", encoding="utf-8") as f:
+        f.write(render_markdown(sections))
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(to_json(sections), f, indent=2)
+    print("Insights written to", md_path, "and", json_path)
+    return md_path
+
+
+if __name__ == "__main__":
+    import analytics
+    import aggregates
+    recipes, ingredients = analytics.load_table("recipe"), analytics.load_table("ingredients")
+    recipe_metrics, user_metrics = aggregates.load_metrics()
+    write_report(compute_insights(recipes, ingredients, recipe_metrics, user_metrics, rollups.load()))
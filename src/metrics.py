@@ -0,0 +1,286 @@
+# metrics.py
+"""
+Lightweight instrumentation shared by every stage.
+
+    with metrics.span("normalize_interactions") as s:
+        for record in records:
+            ...
+            s.rows += 1
+
+Each span appends one JSON line to outputs/pipeline_metrics.jsonl (next to
+validation_report.json) with its duration, rows and rows/sec, the process
+RSS (current and peak) and, when PIPELINE_TRACEMALLOC=1, the tracemalloc
+peak over the span. tracemalloc is process-wide: while spans run
+concurrently in several threads (the pipeline's parallel stages), a span's
+peak includes the other threads' allocations and is not attributable to
+that span alone. Records carry a run id shared by every process of one
+run (PIPELINE_RUN_ID, inherited by subprocesses), so runs can be trended
+and compared:
+
+    python src/metrics.py            # last runs side by side, regressions marked
+
+PIPELINE_PROFILE=<span name pattern>[,...] additionally runs matching spans
+under cProfile and saves the stats to outputs/profiles/<span>-<run id>.prof.
+PIPELINE_METRICS_PATH overrides the output file; set it empty to disable.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import fnmatch
+import functools
+import argparse
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+METRICS_PATH = os.path.join("outputs", "pipeline_metrics.jsonl")
+PROFILE_DIR = os.path.join("outputs", "profiles")
+REGRESSION_THRESHOLD = 0.20
+
+RUN_ID = os.environ.setdefault("PIPELINE_RUN_ID", datetime.now().strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:6])
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+# Open traced spans of every thread; tracemalloc runs while there is one
+_trace_lock = threading.Lock()
+_traced = []
+_trace_started = False
+
+
+def metrics_path():
+    return os.environ.get("PIPELINE_METRICS_PATH", METRICS_PATH)
+
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return None
+
+
+def _rss_peak_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+def _profile_patterns():
+    value = os.environ.get("PIPELINE_PROFILE", "")
+    return [p.strip() for p in value.split(",") if p.strip()]
+
+
+class Span:
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.rows = 0
+        self.peak_seen = 0
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def write_record(record):
+    path = metrics_path()
+    if not path:
+        return
+    line = (json.dumps(record, default=str) + "\n").encode("utf-8")
+    with _write_lock:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One O_APPEND write per record, so worker processes can share the file
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def _start_tracing():
+    # Callers hold _trace_lock
+    global _trace_started
+    if not _traced and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _trace_started = True
+
+
+def _stop_tracing():
+    # Only once no thread has a traced span open, and only if span() started it
+    global _trace_started
+    if not _traced and _trace_started:
+        tracemalloc.stop()
+        _trace_started = False
+
+
+def _fold_peak():
+    """
+    Credits the peak since the last reset to every open span, then resets it.
+    Every reset goes through here, so no span loses a peak reached while it
+    was open, whichever thread resets.
+    """
+    peak = tracemalloc.get_traced_memory()[1]
+    for open_span in _traced:
+        open_span.peak_seen = max(open_span.peak_seen, peak)
+    tracemalloc.reset_peak()
+
+
+@contextmanager
+def span(name, **tags):
+    """Times the enclosed block as `name`; set or increment `.rows` on the yielded span."""
+    stack = _stack()
+    current = Span(name, tags)
+    trace = os.environ.get("PIPELINE_TRACEMALLOC") == "1"
+    if trace:
+        with _trace_lock:
+            _start_tracing()
+            _fold_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+            _traced.append(current)
+
+    profiler = None
+    if any(fnmatch.fnmatch(name, p) for p in _profile_patterns()) and not getattr(_local, "profiling", False):
+        import cProfile
+        profiler = cProfile.Profile()
+        _local.profiling = True
+        profiler.enable()
+
+    stack.append(current)
+    started_at = datetime.now().isoformat()
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield current
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        stack.pop()
+        record = {
+            "run_id": RUN_ID,
+            "span": name,
+            "parent": stack[-1].name if stack else None,
+            "started_at": started_at,
+            "seconds": round(seconds, 4),
+            "rows": current.rows,
+            "rows_per_sec": round(current.rows / seconds, 1) if seconds and current.rows else None,
+            "rss_mb": _round(_rss_mb()),
+            "rss_peak_mb": _round(_rss_peak_mb()),
+            "status": status,
+            "pid": os.getpid(),
+        }
+
+        if trace:
+            with _trace_lock:
+                _fold_peak()
+                _traced.remove(current)
+                _stop_tracing()
+            record["tracemalloc_peak_mb"] = round((current.peak_seen - traced_start) / 2**20, 2)
+
+        if profiler is not None:
+            profiler.disable()
+            _local.profiling = False
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profile_path = os.path.join(PROFILE_DIR, f"{name}-{RUN_ID}.prof")
+            profiler.dump_stats(profile_path)
+            record["profile"] = profile_path
+
+        record.update(current.tags)
+        write_record(record)
+
+
+def instrument(name=None, rows=None):
+    """Decorator form of span(); `rows(result)` gives the row count of a call."""
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name) as s:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    s.rows = rows(result)
+                return result
+        return wrapper
+    return decorate
+
+
+# ---------------------------------------------------
+# TRENDS
+# ---------------------------------------------------
+
+def load_records(path=None):
+    path = path or metrics_path()
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_totals(records):
+    """{run_id: {span: total seconds}} in first-seen run order."""
+    runs = {}
+    for r in records:
+        spans = runs.setdefault(r["run_id"], {})
+        spans[r["span"]] = spans.get(r["span"], 0.0) + r["seconds"]
+    return runs
+
+
+def regressions(runs, threshold=REGRESSION_THRESHOLD, min_seconds=0.05):
+    """Spans of the latest run slower than the median of the earlier runs by `threshold`."""
+    if len(runs) < 2:
+        return []
+    *previous, latest = runs.values()
+    flagged = []
+    for name, seconds in latest.items():
+        history = sorted(run[name] for run in previous if name in run)
+        if not history:
+            continue
+        median = history[len(history) // 2]
+        if seconds > median * (1 + threshold) and seconds - median > min_seconds:
+            flagged.append((name, median, seconds))
+    return flagged
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Show per-stage cost across recent pipeline runs.")
+    parser.add_argument("--runs", type=int, default=5, help="number of most recent runs to show")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="slowdown against the median of earlier runs flagged as a regression")
+    parser.add_argument("--path", default=None, help=f"metrics file (default {METRICS_PATH})")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    runs = run_totals(load_records(args.path))
+    if not runs:
+        print("No metrics recorded yet.")
+        sys.exit(0)
+    recent = dict(list(runs.items())[-args.runs:])
+    names = sorted({name for spans in recent.values() for name in spans})
+    print(f"{'span':<34}" + "".join(f"{run_id[-13:]:>15}" for run_id in recent))
+    for name in names:
+        print(f"{name:<34}" + "".join(
+            f"{spans[name]:>14.3f}s" if name in spans else f"{'-':>15}" for spans in recent.values()))
+    flagged = regressions(runs, args.threshold)
+    for name, median, seconds in flagged:
+        print(f"❌ {name}: {seconds:.3f}s vs median {median:.3f}s of earlier runs")
+    if not flagged:
+        print("✅ No stage regressed in the latest run")
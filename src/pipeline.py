@@ -0,0 +1,347 @@
+# pipeline.py
+"""
+Runs the whole pipeline as one DAG of stages instead of five scripts by hand:
+
+    seed (--seed) -> export -> transform -+-> validate
+                                          +-> load -+-> metrics ----------+-> charts
+                                                    +-> similarity -------+   insights (metrics,
+                                                    +-> ingredient_index -+     ingredient_index)
+
+ - transform, validate, charts and insights are fingerprinted: a hash of the
+   content of their input files and their own code is kept in
+   outputs/pipeline_state.json, and the stage is skipped while it matches and
+   the outputs it produced last time still exist (--force re-runs them).
+ - transform still writes the CSVs and Parquet copies (the next run's
+   fingerprints and the standalone scripts read them), but also returns the
+   tables it wrote in their CSV string form, so the stages after it do not
+   read them back: validate checks those strings, and load types them in
+   memory (columnar.from_strings). The typed frames have already turned
+   malformed numbers and timestamps into nulls, so validation never uses
+   them. When transform was skipped, validate and load read the files.
+ - load holds the tables once; metrics, similarity, charts and insights all
+   work from those frames instead of re-reading the CSVs.
+   In-memory stages (load, metrics, similarity, ingredient_index) only run
+   when a stage that needs them does.
+ - metrics reads the per-recipe/per-user counters from aggregates.py, which
+   transform brings up to date by applying only the new interactions.
+ - Stages whose dependencies are done run concurrently in a thread pool, so
+   validation overlaps metric building and similarity indexing.
+
+A per-stage timing summary is printed at the end.
+"""
+import os
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils import read_json_file, write_json_file, snapshot_path
+import aggregates
+import analytics
+import columnar
+import ingredient_index
+import insights
+import metrics
+import rollups
+import similarity
+import validator
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.path.join("outputs", "pipeline_state.json")
+RAW_DIR = os.path.join("outputs", "raw_json")
+CSV_DIR = os.path.join("outputs", "csv")
+COLLECTIONS = ["recipes", "users", "interactions"]
+
+# validator table name -> transform output name (CSV / Parquet base name)
+TABLES = {
+    "recipes": "recipe",
+    "ingredients": "ingredients",
+    "steps": "steps",
+    "users": "users",
+    "interactions": "interactions",
+}
+
+
+def code(*modules):
+    return [os.path.join(SRC_DIR, f"{m}.py") for m in modules]
+
+
+def csv_paths():
+    return [os.path.join(CSV_DIR, f"{name}.csv") for name in TABLES.values()]
+
+
+# ---------------------------------------------------
+# STAGES
+# ---------------------------------------------------
+
+class Stage:
+    """
+    One node of the DAG. `func(results)` gets the return values of the stages
+    that already ran, keyed by stage name.
+
+    `inputs` (a function returning file paths) makes the stage fingerprinted;
+    those files must be produced upstream of any lazy stage feeding it, so
+    they are final when the skip decision is made. `lazy` stages hold
+    in-memory results only and run iff a dependent stage runs. Stages with
+    neither always run. `outputs(value)` lists the files a run produced.
+    """
+    def __init__(self, name, func, deps=(), inputs=None, outputs=None, lazy=False):
+        self.name, self.func, self.deps = name, func, tuple(deps)
+        self.inputs, self.outputs, self.lazy = inputs, outputs, lazy
+
+
+class Fingerprints:
+    """Content hashes of files, re-hashed only when a file's size or mtime changed."""
+    def __init__(self, files=None):
+        self.files = files if files is not None else {}
+        self.lock = threading.Lock()
+
+    def file_digest(self, path):
+        if not os.path.exists(path):
+            return "missing"
+        st = os.stat(path)
+        key = [st.st_size, st.st_mtime_ns]
+        with self.lock:
+            cached = self.files.get(path)
+        if cached and cached[:2] == key:
+            return cached[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        with self.lock:
+            self.files[path] = key + [h.hexdigest()]
+        return h.hexdigest()
+
+    def digest(self, paths):
+        h = hashlib.sha256()
+        for path in sorted(paths):
+            h.update(f"{path}\0{self.file_digest(path)}\n".encode())
+        return h.hexdigest()
+
+
+class Pipeline:
+    def __init__(self, stages, force=False, workers=3, state_path=STATE_PATH):
+        self.stages = {s.name: s for s in stages}
+        self.force, self.workers, self.state_path = force, workers, state_path
+        self.state = read_json_file(state_path) if os.path.exists(state_path) else {}
+        self.state.setdefault("stages", {})
+        self.fingerprints = Fingerprints(self.state.setdefault("files", {}))
+        self.lock = threading.Lock()
+        self._wants = {}
+        self.results, self.status, self.timings = {}, {}, {}
+
+    def dependents(self, name):
+        return [s for s in self.stages.values() if name in s.deps]
+
+    def wants(self, stage):
+        """Whether `stage` has to run; decided once, when its dependencies are done."""
+        if stage.name not in self._wants:
+            if stage.lazy:
+                want = any(self.wants(d) for d in self.dependents(stage.name))
+                self._wants[stage.name] = (want, None)
+            elif stage.inputs is None:
+                self._wants[stage.name] = (True, None)
+            else:
+                fingerprint = self.fingerprints.digest(stage.inputs())
+                last = self.state["stages"].get(stage.name, {})
+                unchanged = (last.get("fingerprint") == fingerprint
+                             and all(os.path.exists(p) for p in last.get("outputs", [])))
+                self._wants[stage.name] = (self.force or not unchanged, fingerprint)
+        return self._wants[stage.name][0]
+
+    def execute(self, stage):
+        started = time.perf_counter()
+        with metrics.span(f"stage.{stage.name}"):
+            value = stage.func(self.results)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.results[stage.name] = value
+            fingerprint = self._wants[stage.name][1]
+            if fingerprint is not None:
+                # Optional outputs (e.g. a chart whose library is missing) are not required
+                outputs = [p for p in (stage.outputs(value) if stage.outputs else []) if os.path.exists(p)]
+                self.state["stages"][stage.name] = {"fingerprint": fingerprint, "outputs": outputs}
+                write_json_file(self.state_path, self.state)
+        return elapsed
+
+    def run(self):
+        pending = dict(self.stages)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running = {}
+            while pending or running:
+                ready = [s for s in pending.values() if all(d in self.status for d in s.deps)]
+                for stage in ready:
+                    del pending[stage.name]
+                    if self.wants(stage):
+                        running[pool.submit(self.execute, stage)] = stage.name
+                    else:
+                        self.status[stage.name] = "skipped"
+                if ready and not running:
+                    continue
+                if not running:
+                    raise RuntimeError(f"unsatisfiable dependencies: {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    self.timings[name] = future.result()
+                    self.status[name] = "ran"
+        self.timings["total"] = time.perf_counter() - started
+        return self.results
+
+    def summary(self):
+        lines = ["\nPipeline stages:"]
+        width = max(len(name) for name in self.stages)
+        for name in self.stages:
+            if self.status.get(name) == "ran":
+                lines.append(f"  {name:<{width}} ran      {self.timings[name]:7.2f}s")
+            else:
+                lines.append(f"  {name:<{width}} skipped  (inputs unchanged)")
+        lines.append(f"  {'total (wall clock)':<{width + 9}} {self.timings['total']:7.2f}s")
+        return "\n".join(lines)
+
+
+# ---------------------------------------------------
+# STAGE FUNCTIONS
+# ---------------------------------------------------
+
+def run_transform(results, workers=1):
+    """Writes the transform outputs; returns the tables written, {RULES table name: CSV string frame}."""
+    import transform_to_csv
+    tables = {}
+    tables.update(transform_to_csv.normalize_recipes(snapshot_path(RAW_DIR, "recipes"), collect=True))
+    tables.update(transform_to_csv.normalize_users(snapshot_path(RAW_DIR, "users"), collect=True))
+    tables.update(transform_to_csv.normalize_interactions(snapshot_path(RAW_DIR, "interactions"),
+                                                          workers=workers, collect=True))
+    columnar.write_all()
+    rollups.write_all()
+    aggregates.refresh()
+    return tables
+
+
+def transform_outputs(_):
+    paths = csv_paths() + [rollups.HOURLY_PATH, rollups.DAILY_PATH, aggregates.STORE_PATH]
+    if columnar.available():
+        paths += [columnar.table_path(name) for name in columnar.SCHEMAS]
+    return paths
+
+
+def run_load(results):
+    handed = results.get("transform")
+    tables = {}
+    for table, name in TABLES.items():
+        typed = columnar.from_strings(name, handed[table]) if handed else None
+        tables[table] = typed if typed is not None else analytics.load_table(name)
+    return tables
+
+
+def run_validate(results):
+    handed = results.get("transform")
+    report = validator.validate_frames(handed) if handed else validator.validate_all()
+    validator.write_report(report)
+    print(f"Validation: {report['total_invalid']} invalid rows, report in {validator.REPORT_PATH}")
+    return report
+
+
+def run_metrics(results):
+    recipe_metrics, user_metrics = aggregates.load_metrics()
+    return {"recipe": recipe_metrics, "user": user_metrics, "trends": rollups.load()}
+
+
+def run_similarity(results):
+    return similarity.sample_matrix(similarity.ensure_index(results["load"]["ingredients"]))
+
+
+def run_ingredient_index(results):
+    return ingredient_index.ensure_index(results["load"]["ingredients"])
+
+
+def run_charts(results, workers=1, force=False):
+    tables, metrics = results["load"], results["metrics"]
+    tasks = analytics.chart_tasks(tables["recipes"], tables["ingredients"], metrics["recipe"],
+                                  metrics["user"], metrics["trends"], results["similarity"],
+                                  results["ingredient_index"])
+    timings, skipped = analytics.render_charts(tasks, workers, force)
+    return sorted(list(timings) + skipped)
+
+
+def run_insights(results):
+    tables, metrics = results["load"], results["metrics"]
+    sections = insights.compute_insights(tables["recipes"], tables["ingredients"],
+                                         metrics["recipe"], metrics["user"], metrics["trends"],
+                                         index=results["ingredient_index"])
+    md_path = insights.write_report(sections)
+    return [md_path, os.path.join(insights.OUT_DIR, "insights.json")]
+
+
+def build_stages(seed=False, offline=False, incremental=False, chart_workers=1, transform_workers=1,
+                 force=False):
+    stages = []
+    upstream = ()
+    if seed:
+        def run_seed(results):
+            import seed_firestore
+            return seed_firestore.seed(bulk=True)
+        stages.append(Stage("seed", run_seed))
+        upstream = ("seed",)
+    if not offline:
+        def run_export(results):
+            import export_firestore
+            return export_firestore.export(incremental=incremental)
+        stages.append(Stage("export", run_export, deps=upstream))
+        upstream = ("export",)
+
+    stages += [
+        Stage("transform", lambda results: run_transform(results, transform_workers), deps=upstream,
+              inputs=lambda: [snapshot_path(RAW_DIR, c) for c in COLLECTIONS]
+                             + code("transform_to_csv", "columnar", "rollups", "aggregates", "id_dictionary", "utils"),
+              outputs=transform_outputs),
+        Stage("load", run_load, deps=("transform",), lazy=True),
+        Stage("validate", run_validate, deps=("transform",),
+              inputs=lambda: csv_paths() + code("validator"),
+              outputs=lambda _: [validator.REPORT_PATH]),
+        Stage("metrics", run_metrics, deps=("load",), lazy=True),
+        Stage("similarity", run_similarity, deps=("load",), lazy=True),
+        Stage("ingredient_index", run_ingredient_index, deps=("load",), lazy=True),
+        # --force also bypasses the per-chart fingerprints, not just the stage's
+        Stage("charts", lambda results: run_charts(results, chart_workers, force),
+              deps=("load", "metrics", "similarity", "ingredient_index"),
+              inputs=lambda: csv_paths() + code("analytics", "aggregates", "id_dictionary", "ingredient_index",
+                                                "rollups", "similarity"),
+              outputs=lambda names: [analytics.chart_path(n) for n in names]),
+        Stage("insights", run_insights, deps=("load", "metrics", "ingredient_index"),
+              inputs=lambda: csv_paths() + code("insights", "analytics", "aggregates", "id_dictionary",
+                                                "ingredient_index", "rollups"),
+              outputs=lambda paths: paths),
+    ]
+    return stages
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run seed/export/transform/validate/analytics as one pipeline.")
+    parser.add_argument("--seed", action="store_true",
+                        help="seed Firestore first (bulk mode, default sizes)")
+    parser.add_argument("--offline", action="store_true",
+                        help="skip the Firestore export and use the snapshots in outputs/raw_json")
+    parser.add_argument("--incremental", action="store_true",
+                        help="export incrementally (see export_firestore.py --incremental)")
+    parser.add_argument("--force", action="store_true",
+                        help="run every stage even if its inputs are unchanged")
+    parser.add_argument("--workers", type=int, default=3,
+                        help="stages run concurrently when their dependencies allow")
+    parser.add_argument("--chart-workers", type=int, default=1,
+                        help="processes used to render charts")
+    parser.add_argument("--transform-workers", type=int, default=1,
+                        help="processes used to normalize the interactions snapshot")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    pipeline = Pipeline(build_stages(seed=args.seed, offline=args.offline, incremental=args.incremental,
+                                     chart_workers=args.chart_workers, transform_workers=args.transform_workers,
+                                     force=args.force),
+                        force=args.force, workers=args.workers)
+    pipeline.run()
+    print(pipeline.summary())
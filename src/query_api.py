@@ -0,0 +1,357 @@
+# query_api.py
+"""
+Query layer over the transformed data, for dashboards that need single
+answers in milliseconds rather than a re-run of analytics.py:
+
+    api = QueryAPI()
+    api.top("recipe", metric="likes", n=10)     # top-N recipes (or users) by any counter
+    api.recipe("synthetic_013")                 # one recipe's stats
+    api.user_history("user_004", limit=20)      # a user's interactions, newest first
+    api.window_counts(seconds=86400, by="type") # counts over the last 24h (hour buckets)
+
+Answers come from indexed local storage: the recipe/user counters and the
+per-user history (indexed by user and time) in the aggregates store, kept in
+step by aggregates.refresh(), and the hourly rollup, binary-searched by
+bucket. Results are memoized in an LRU cache bounded by entry count and
+bytes. The cache is dropped, and the counters re-read, whenever a new
+transform run lands (interactions.csv, recipe.csv or the rollup changes).
+
+Served over HTTP (JSON) with:
+
+    python src/query_api.py serve --port 8765
+    GET /top?of=recipe&metric=likes&n=10
+    GET /recipe/<recipe_id>
+    GET /user/<user_id>/history?limit=50&since=<epoch>
+    GET /window?seconds=86400&by=type[&recipe_id=...][&end=<epoch>]
+    GET /stats
+
+or one-off from the shell: python src/query_api.py top --metric likes
+"""
+import os
+import json
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+import numpy as np
+import pandas as pd
+import aggregates
+import rollups
+
+CSV_DIR = os.path.join("outputs", "csv")
+CACHE_ENTRIES = 1024
+CACHE_BYTES = 16 * 2**20
+MAX_LIMIT = 1000  # history rows per answer
+METRICS = aggregates.COUNTERS + ["avg_rating", "first_seen", "last_seen"]
+RECIPE_FIELDS = ["title", "difficulty", "prep_minutes", "cook_minutes", "total_minutes", "servings", "tags"]
+
+
+class LRUCache:
+    """
+    Least-recently-used results, bounded by entries and by their JSON size in
+    bytes. Values are kept serialized, so callers get a fresh copy each time
+    and mutating an answer cannot change what later callers see.
+    """
+
+    def __init__(self, max_entries=CACHE_ENTRIES, max_bytes=CACHE_BYTES):
+        self.max_entries, self.max_bytes = max_entries, max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            encoded = self.entries[key][0]
+        return True, json.loads(encoded)
+
+    def put(self, key, value):
+        """Stores `value` and returns its serialized form."""
+        encoded = json.dumps(value)
+        size = len(encoded)
+        with self.lock:
+            if size > self.max_bytes:
+                return encoded
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (encoded, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self.bytes -= self.entries.popitem(last=False)[1][1]
+        return encoded
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {"entries": len(self.entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+def _iso(epoch):
+    if epoch is None or pd.isna(epoch):
+        return None
+    return datetime.fromtimestamp(int(epoch), tz=timezone.utc).isoformat()
+
+
+def _plain(value):
+    # numpy/pandas scalars -> JSON-friendly Python values
+    if isinstance(value, (np.integer,)):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else float(value)
+    return value
+
+
+class QueryAPI:
+    def __init__(self, csv_dir=CSV_DIR, store_path=aggregates.STORE_PATH,
+                 cache_entries=CACHE_ENTRIES, cache_bytes=CACHE_BYTES):
+        self.csv_dir, self.store_path = csv_dir, store_path
+        self.cache = LRUCache(cache_entries, cache_bytes)
+        self.generation = None
+        self.sync_lock = threading.Lock()
+        self.local = threading.local()
+
+    # ----- freshness -----
+
+    def _sources(self):
+        return [os.path.join(self.csv_dir, "interactions.csv"), os.path.join(self.csv_dir, "recipe.csv"),
+                rollups.HOURLY_PATH]
+
+    def current_generation(self):
+        """Size and mtime of the transform outputs the answers depend on."""
+        stamp = []
+        for path in self._sources():
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _ensure_fresh(self):
+        generation = self.current_generation()
+        if generation == self.generation:
+            return
+        with self.sync_lock:
+            if generation == self.generation:
+                return
+            # Brings the store up to date (only the new interactions) and
+            # reloads the small in-memory views
+            aggregates.refresh(self.csv_dir, self.store_path)
+            self.counters = {table: aggregates.load(table, self.store_path) for table in aggregates.KEYS}
+            recipes = pd.read_csv(os.path.join(self.csv_dir, "recipe.csv"), dtype={"recipe_id": str})
+            self.recipes = recipes.drop_duplicates("recipe_id").set_index("recipe_id")
+            self.hourly, _ = rollups.load(self.csv_dir)
+            self.buckets = self.hourly["bucket"].to_numpy()
+            self.cache.clear()
+            self.generation = self.current_generation()
+
+    def _connection(self):
+        # sqlite connections are per thread; the HTTP server answers from several
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.store_path)
+        return conn
+
+    def _cached(self, key, compute):
+        self._ensure_fresh()
+        # Keyed by generation too, so a result computed while a new run lands is never served after it
+        key = (self.generation, key)
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        # Decoded like a hit, so the caller never holds the cached object
+        return json.loads(self.cache.put(key, compute()))
+
+    # ----- queries -----
+
+    def top(self, of="recipe", metric="engagement", n=10):
+        """The `n` recipes (or users) with the highest `metric`, as [{id, metric}, ...]."""
+        if of not in aggregates.KEYS:
+            raise ValueError(f"unknown entity {of!r}; expected one of {sorted(aggregates.KEYS)}")
+        if metric not in METRICS:
+            raise ValueError(f"unknown metric {metric!r}; expected one of {METRICS}")
+        n = int(n)
+        if n < 1:
+            raise ValueError("n must be at least 1")
+
+        def compute():
+            values = self.counters[of][metric].dropna()
+            if len(values) > n:
+                # argpartition for the top n, then only those are sorted
+                part = np.argpartition(-values.to_numpy(), n - 1)[:n]
+                values = values.iloc[part]
+            values = values.sort_values(ascending=False, kind="stable").head(n)
+            return [{aggregates.KEYS[of]: key, metric: _plain(value)} for key, value in values.items()]
+        return self._cached(("top", of, metric, n), compute)
+
+    def recipe(self, recipe_id):
+        """Counters and metadata of one recipe, or None when it is unknown."""
+        def compute():
+            counters = self.counters["recipe"]
+            if recipe_id not in counters.index and recipe_id not in self.recipes.index:
+                return None
+            stats = {"recipe_id": recipe_id}
+            if recipe_id in self.recipes.index:
+                meta = self.recipes.loc[recipe_id]
+                stats.update({f: _plain(meta[f]) for f in RECIPE_FIELDS if f in meta.index})
+            if recipe_id in counters.index:
+                # Column by column: a whole row would upcast the int counters to float
+                stats.update({m: _plain(counters.at[recipe_id, m]) for m in aggregates.COUNTERS + ["avg_rating"]})
+                stats["first_seen"] = _iso(counters.at[recipe_id, "first_seen"])
+                stats["last_seen"] = _iso(counters.at[recipe_id, "last_seen"])
+            else:
+                stats.update({m: 0 for m in aggregates.COUNTERS})
+            return stats
+        return self._cached(("recipe", recipe_id), compute)
+
+    def user_history(self, user_id, limit=50, since=None):
+        """A user's interactions (newest first), answered from the (user_id, ts_epoch) index."""
+        limit = int(limit)
+        if not 1 <= limit <= MAX_LIMIT:
+            # SQLite reads a negative LIMIT as "no limit"
+            raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+        since = None if since is None else int(since)
+
+        def compute():
+            sql = ("SELECT interaction_id, recipe_id, type, rating, ts_epoch FROM history "
+                   "WHERE user_id = ?" + (" AND ts_epoch >= ?" if since is not None else "")
+                   + " ORDER BY ts_epoch DESC LIMIT ?")
+            params = [user_id] + ([since] if since is not None else []) + [limit]
+            rows = self._connection().execute(sql, params).fetchall()
+            return [{"interaction_id": i, "recipe_id": r, "type": t, "rating": rating,
+                     "ts_epoch": ts, "timestamp": _iso(ts)} for i, r, t, rating, ts in rows]
+        return self._cached(("history", user_id, limit, since), compute)
+
+    def window_counts(self, seconds=rollups.DAY, end=None, by="type", recipe_id=None):
+        """
+        Interactions in the `seconds` before `end` (default: end of the latest
+        hour), grouped by "type" or "recipe_id", optionally for one recipe.
+        Windows are whole hours of the hourly rollup.
+        """
+        if by not in ("type", "recipe_id"):
+            raise ValueError(f"unknown grouping {by!r}; expected 'type' or 'recipe_id'")
+        seconds = int(seconds)
+        end = None if end is None else int(end)
+
+        def compute():
+            stop = rollups.latest(self.hourly) if end is None else end
+            start = stop - seconds
+            # hourly is sorted by bucket, so the window is one contiguous slice
+            lo, hi = np.searchsorted(self.buckets, [start, stop], side="left")
+            rows = self.hourly.iloc[lo:hi]
+            if recipe_id is not None:
+                rows = rows[rows["recipe_id"] == recipe_id]
+            counts = rows.groupby(by)["count"].sum().sort_values(ascending=False, kind="stable")
+            return {"start": start, "end": stop, "counts": {str(k): int(v) for k, v in counts.items()}}
+        return self._cached(("window", seconds, end, by, recipe_id), compute)
+
+    def stats(self):
+        self._ensure_fresh()
+        return {"generation": [list(s) if s else None for s in self.generation], "cache": self.cache.stats()}
+
+
+# ---------------------------------------------------
+# HTTP
+# ---------------------------------------------------
+
+def _handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                if parts == ["top"]:
+                    body = api.top(query.get("of", "recipe"), query.get("metric", "engagement"),
+                                   query.get("n", 10))
+                elif len(parts) == 2 and parts[0] == "recipe":
+                    body = api.recipe(parts[1])
+                elif len(parts) == 3 and parts[0] == "user" and parts[2] == "history":
+                    body = api.user_history(parts[1], query.get("limit", 50), query.get("since"))
+                elif parts == ["window"]:
+                    body = api.window_counts(query.get("seconds", rollups.DAY), query.get("end"),
+                                             query.get("by", "type"), query.get("recipe_id"))
+                elif parts == ["stats"]:
+                    body = api.stats()
+                else:
+                    return self._send(404, {"error": f"unknown path {url.path}"})
+            except ValueError as e:
+                return self._send(400, {"error": str(e)})
+            except Exception as e:
+                return self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            if body is None:
+                return self._send(404, {"error": "not found"})
+            self._send(200, body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(api, host="127.0.0.1", port=8765):
+    server = ThreadingHTTPServer((host, port), _handler(api))
+    print(f"Serving analytics queries on http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query the transformed data, or serve the queries over HTTP.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("serve", help="serve the queries as JSON over HTTP")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p = sub.add_parser("top", help="top-N recipes or users by a metric")
+    p.add_argument("--of", choices=sorted(aggregates.KEYS), default="recipe")
+    p.add_argument("--metric", choices=METRICS, default="engagement")
+    p.add_argument("-n", type=int, default=10)
+    p = sub.add_parser("recipe", help="stats of one recipe")
+    p.add_argument("recipe_id")
+    p = sub.add_parser("user", help="a user's interaction history")
+    p.add_argument("user_id")
+    p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--since", type=int, default=None, help="epoch seconds")
+    p = sub.add_parser("window", help="interaction counts over a recent window")
+    p.add_argument("--seconds", type=int, default=rollups.DAY)
+    p.add_argument("--by", choices=["type", "recipe_id"], default="type")
+    p.add_argument("--recipe-id", default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    api = QueryAPI()
+    if args.command == "serve":
+        serve(api, args.host, args.port)
+    else:
+        result = {
+            "top": lambda: api.top(args.of, args.metric, args.n),
+            "recipe": lambda: api.recipe(args.recipe_id),
+            "user": lambda: api.user_history(args.user_id, args.limit, args.since),
+            "window": lambda: api.window_counts(args.seconds, by=args.by, recipe_id=args.recipe_id),
+        }[args.command]()
+        print(json.dumps(result, indent=2))
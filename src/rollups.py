@@ -0,0 +1,153 @@
+# rollups.py
+"""
+Materialized interaction rollups, built once per transform:
+ - outputs/rollups/interactions_hourly.csv  (bucket, recipe_id, type, count)
+ - outputs/rollups/interactions_daily.csv   (bucket, recipe_id, type, count)
+
+`bucket` is the epoch second the hour/day starts at (UTC; naive timestamps,
+as written by the seed, are taken as UTC). They are built from the
+`ts_epoch` column transform_to_csv.py parses once per event, streaming
+interactions.csv in chunks, so the raw events are never parsed again.
+
+Windows (last 7 days, a rolling 24h, ...) and daily/weekly series are then
+answered from the rollups alone. "Now" defaults to the end of the latest
+bucket, so reports describe the data rather than the wall clock.
+"""
+import os
+import calendar
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+CSV_DIR = os.path.join("outputs", "csv")
+OUT_DIR = os.path.join("outputs", "rollups")
+HOURLY_PATH = os.path.join(OUT_DIR, "interactions_hourly.csv")
+DAILY_PATH = os.path.join(OUT_DIR, "interactions_daily.csv")
+HOUR = 3600
+DAY = 86400
+CHUNK_SIZE = 1_000_000
+KEYS = ["bucket", "recipe_id", "type"]
+
+
+def to_epoch(ts):
+    """Epoch seconds of an ISO timestamp string, or "" when it does not parse."""
+    if not ts:
+        return ""
+    try:
+        dt = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+    except ValueError:
+        return ""
+    return calendar.timegm(dt.utctimetuple())
+
+
+def epoch_column(interactions):
+    # ts_epoch when the transform wrote it, otherwise parsed from timestamp
+    if "ts_epoch" in interactions.columns:
+        return pd.to_numeric(interactions["ts_epoch"], errors="coerce")
+    parsed = pd.to_datetime(interactions["timestamp"], format="ISO8601", utc=True, errors="coerce")
+    return (parsed - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+
+
+def _aggregate(frame, width):
+    epoch = epoch_column(frame)
+    keep = epoch.notna().to_numpy()
+    buckets = pd.DataFrame({
+        "bucket": (epoch[keep].to_numpy(dtype=np.int64) // width) * width,
+        "recipe_id": frame["recipe_id"][keep].to_numpy(),
+        "type": frame["type"][keep].to_numpy(),
+    })
+    return buckets.groupby(KEYS, sort=False).size().rename("count").reset_index()
+
+
+def _combine(parts):
+    if not parts:
+        return pd.DataFrame({"bucket": pd.Series(dtype="int64"), "recipe_id": pd.Series(dtype=str),
+                             "type": pd.Series(dtype=str), "count": pd.Series(dtype="int64")})
+    combined = pd.concat(parts, ignore_index=True).groupby(KEYS)["count"].sum().reset_index()
+    return combined.sort_values(KEYS, kind="stable").reset_index(drop=True)
+
+
+def build(interactions):
+    """(hourly, daily) rollups of an interactions frame."""
+    hourly = _combine([_aggregate(interactions, HOUR)])
+    return hourly, to_daily(hourly)
+
+
+def to_daily(hourly):
+    daily = hourly.assign(bucket=hourly["bucket"] // DAY * DAY)
+    return _combine([daily])
+
+
+def write_all(csv_dir=CSV_DIR, chunk_size=CHUNK_SIZE):
+    """Streams interactions.csv into the materialized rollups; returns (hourly, daily)."""
+    path = os.path.join(csv_dir, "interactions.csv")
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = ["recipe_id", "type", "ts_epoch" if "ts_epoch" in header else "timestamp"]
+    parts = [_aggregate(chunk, HOUR)
+             for chunk in pd.read_csv(path, usecols=usecols, dtype={"recipe_id": str, "type": str},
+                                      keep_default_na=False, chunksize=chunk_size)]
+    hourly = _combine(parts)
+    daily = to_daily(hourly)
+    os.makedirs(OUT_DIR, exist_ok=True)
+    hourly.to_csv(HOURLY_PATH, index=False)
+    daily.to_csv(DAILY_PATH, index=False)
+    print(f"Wrote {HOURLY_PATH} ({len(hourly)} rows), {DAILY_PATH} ({len(daily)} rows)")
+    return hourly, daily
+
+
+def load(csv_dir=CSV_DIR):
+    """The materialized (hourly, daily) rollups, rebuilt if missing or older than interactions.csv."""
+    source = os.path.join(csv_dir, "interactions.csv")
+    fresh = all(os.path.exists(p) and os.path.getmtime(p) >= os.path.getmtime(source)
+                for p in (HOURLY_PATH, DAILY_PATH))
+    if not fresh:
+        return write_all(csv_dir)
+    dtypes = {"bucket": "int64", "recipe_id": str, "type": str, "count": "int64"}
+    return (pd.read_csv(HOURLY_PATH, dtype=dtypes, keep_default_na=False),
+            pd.read_csv(DAILY_PATH, dtype=dtypes, keep_default_na=False))
+
+
+# ---------------------------------------------------
+# QUERIES
+# ---------------------------------------------------
+
+def latest(rollup, width=HOUR):
+    """End of the newest bucket (epoch seconds), the default "now" for windows."""
+    return int(rollup["bucket"].max()) + width if len(rollup) else 0
+
+
+def window(rollup, start, end, by=("recipe_id", "type")):
+    """Counts summed over buckets starting in [start, end), grouped by `by`."""
+    rows = rollup[(rollup["bucket"] >= start) & (rollup["bucket"] < end)]
+    if not by:
+        return int(rows["count"].sum())
+    return rows.groupby(list(by))["count"].sum()
+
+
+def last(rollup, seconds, now=None, by=("recipe_id", "type"), width=HOUR):
+    """window() over the `seconds` before `now`, e.g. last(daily, 7 * DAY, width=DAY)."""
+    now = latest(rollup, width) if now is None else now
+    return window(rollup, now - seconds, now, by)
+
+
+def series(rollup, freq="D", by="type"):
+    """Counts over time, one column per `by` value: freq "H", "D" or "W" (weeks from Monday)."""
+    totals = rollup.groupby(["bucket", by])["count"].sum().unstack(by, fill_value=0)
+    totals.index = pd.to_datetime(totals.index, unit="s")
+    if freq == "W":
+        totals = totals.resample("W-MON", label="left", closed="left").sum()
+    elif freq in ("D", "H"):
+        totals = totals.asfreq("D" if freq == "D" else "h", fill_value=0)
+    return totals.rename_axis(None, axis=1).rename_axis("period")
+
+
+def rolling(hourly, hours=24):
+    """Rolling `hours` total of all interactions, per hour."""
+    totals = series(hourly, "H").sum(axis=1)
+    return totals.rolling(hours, min_periods=1).sum().rename(f"rolling_{hours}h")
+
+
+def hour_of_day(hourly):
+    """Interactions per hour of day (0-23)."""
+    hours = (hourly["bucket"] % DAY) // HOUR
+    return hourly["count"].groupby(hours.rename("hour")).sum().sort_index()
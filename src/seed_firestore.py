@@ -142,26 +142,62 @@
 """
 Seeds Firestore *EMULATOR* with:
  - candidate recipe (seed_data/candidate_recipe.json)
- - 16 synthetic recipes
- - 10 users
- - interactions (views, likes, attempts)
+ - N synthetic recipes (default 16)
+ - N users (default 10)
+ - interactions (views, likes, attempts) per recipe
+
+Run with --bulk to group writes into batched commits sent concurrently,
+which is what makes load-test volumes (1M+ interactions) practical.
 """
 
 import os
 import json
+import time
 import random
+import argparse
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from google.cloud import firestore
+from google.api_core import exceptions as gexc
+from utils import get_firestore_client
+import metrics
 
 # ============================================================
-# 🔥 FORCE PYTHON TO USE FIRESTORE EMULATOR ONLY
+# 🔥 EMULATOR BY DEFAULT, NEVER REAL FIRESTORE
+# ============================================================
+# FIRESTORE_BACKEND=memory or file:<path> swaps in the local stand-in (see
+# utils.get_firestore_client); otherwise the emulator is used, at
+# 127.0.0.1:8080 unless FIRESTORE_EMULATOR_HOST says otherwise.
+# Only connect() touches the environment, so importing this module for
+# its generators (see benchmark.py) has no side effects.
+
+def connect():
+    if os.environ.get("FIRESTORE_BACKEND", "emulator") == "emulator":
+        os.environ.setdefault("FIRESTORE_EMULATOR_HOST", "127.0.0.1:8080")
+        os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "demo-firestore")
+    return get_firestore_client(project="demo-firestore")
+
 # ============================================================
-os.environ["FIRESTORE_EMULATOR_HOST"] = "127.0.0.1:8080"
-os.environ["GOOGLE_CLOUD_PROJECT"] = "demo-firestore"
+# SCALE DEFAULTS (override from the command line)
+# ============================================================
+
+DEFAULT_SYNTHETIC_RECIPES = 16
+DEFAULT_USERS = 10
+DEFAULT_VIEWS = (10, 200)
+DEFAULT_LIKES = (0, 40)
+DEFAULT_ATTEMPTS = (0, 20)
 
-# Connect to Emulator (NOT real Firestore)
-client = firestore.Client(project="demo-firestore")
+# Firestore rejects batches with more than 500 writes
+MAX_BATCH_SIZE = 500
+
+RETRYABLE_ERRORS = (
+    gexc.Aborted,
+    gexc.DeadlineExceeded,
+    gexc.InternalServerError,
+    gexc.ResourceExhausted,
+    gexc.ServiceUnavailable,
+)
 
 # ============================================================
 # UTILITIES
@@ -216,90 +252,245 @@ def create_user(uid, name):
     }
 
 
+def gen_interactions(rid, user_ids, now, views=DEFAULT_VIEWS, likes=DEFAULT_LIKES,
+                     attempts=DEFAULT_ATTEMPTS):
+    """Yields (doc_id, doc) pairs of views, likes and attempts for one recipe."""
+
+    # views
+    for _ in range(random.randint(*views)):
+        t = now - timedelta(days=random.randint(0, 30), hours=random.randint(0, 23))
+        yield str(uuid.uuid4()), {
+            "recipe_id": rid,
+            "user_id": random.choice(user_ids),
+            "type": "view",
+            "timestamp": t.isoformat()
+        }
+
+    # likes
+    for _ in range(random.randint(*likes)):
+        t = now - timedelta(days=random.randint(0, 30))
+        yield str(uuid.uuid4()), {
+            "recipe_id": rid,
+            "user_id": random.choice(user_ids),
+            "type": "like",
+            "timestamp": t.isoformat()
+        }
+
+    # attempts + ratings
+    for _ in range(random.randint(*attempts)):
+        user = random.choice(user_ids)
+        rating = random.choice([None, 1, 2, 3, 4, 5])
+        t = now - timedelta(days=random.randint(0, 30))
+
+        doc = {
+            "recipe_id": rid,
+            "user_id": user,
+            "type": "attempt",
+            "difficulty_used": random.choice(["easy", "medium", "hard"]),
+            "timestamp": t.isoformat()
+        }
+
+        if rating is not None:
+            doc["rating"] = rating
+
+        yield str(uuid.uuid4()), doc
+
+
+# ============================================================
+# WRITERS
+# ============================================================
+
+class DirectWriter:
+    """One blocking set() round trip per document."""
+
+    def __init__(self):
+        self.written = 0
+
+    def set(self, ref, data):
+        ref.set(data)
+        self.written += 1
+
+    def close(self):
+        pass
+
+
+class BatchedWriter:
+    """
+    Groups writes into WriteBatch commits and sends them from a thread pool.
+
+    At most `concurrency` commits run at once and at most `concurrency`
+    more may be queued; beyond that set() blocks the producer, so memory
+    stays bounded however many documents are generated. Commits failing
+    with a transient error are retried with exponential backoff.
+    """
+
+    def __init__(self, client, batch_size=MAX_BATCH_SIZE, concurrency=8,
+                 max_retries=5, backoff_seconds=0.5):
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+        self.client = client
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.written = 0
+        self.retries = 0
+        self._pending = []
+        self._errors = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(concurrency * 2)
+        self._pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    def set(self, ref, data):
+        self._pending.append((ref, data))
+        if len(self._pending) >= self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        ops, self._pending = self._pending, []
+        self._slots.acquire()
+        if self._errors:
+            self._slots.release()
+            raise self._errors[0]
+        future = self._pool.submit(self._commit, ops)
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        if future.exception() is not None:
+            self._errors.append(future.exception())
+        self._slots.release()
+
+    def _commit(self, ops):
+        for attempt in range(self.max_retries + 1):
+            batch = self.client.batch()
+            for ref, data in ops:
+                batch.set(ref, data)
+            try:
+                batch.commit()
+                break
+            except RETRYABLE_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.backoff_seconds * 2 ** attempt * (1 + random.random()))
+        with self._lock:
+            self.written += len(ops)
+
+    def close(self):
+        try:
+            if self._pending:
+                self._submit()
+        finally:
+            # Always drain in-flight commits, even when the last submit raised
+            self._pool.shutdown(wait=True)
+        if self._errors:
+            raise self._errors[0]
+
+
 # ============================================================
 # MAIN SEED FUNCTION
 # ============================================================
 
-def seed():
+@metrics.instrument(rows=lambda written: written)
+def seed(synthetic_count=DEFAULT_SYNTHETIC_RECIPES, user_count=DEFAULT_USERS,
+         views=DEFAULT_VIEWS, likes=DEFAULT_LIKES, attempts=DEFAULT_ATTEMPTS,
+         bulk=False, batch_size=MAX_BATCH_SIZE, concurrency=8, max_retries=5):
 
+    client = connect()
     recipes_col = client.collection("recipes")
     users_col = client.collection("users")
     interactions_col = client.collection("interactions")
 
+    if bulk:
+        writer = BatchedWriter(client, batch_size=batch_size, concurrency=concurrency,
+                               max_retries=max_retries)
+    else:
+        writer = DirectWriter()
+    started = time.perf_counter()
+
     # ---------- Candidate Recipe ----------
     cand = load_candidate_recipe()
     cand["total_minutes"] = cand["prep_minutes"] + cand["cook_minutes"]
-    recipes_col.document(cand["id"]).set(cand)
+    writer.set(recipes_col.document(cand["id"]), cand)
+    recipe_ids = [cand["id"]]
     print(f"✔ Seeded candidate recipe: {cand['id']}")
 
     # ---------- Synthetic Recipes ----------
-    synthetic_count = 16
     for i in range(1, synthetic_count + 1):
         r = gen_synthetic_recipe(i)
         r["total_minutes"] = r["prep_minutes"] + r["cook_minutes"]
-        recipes_col.document(r["id"]).set(r)
+        writer.set(recipes_col.document(r["id"]), r)
+        recipe_ids.append(r["id"])
     print(f"✔ Seeded {synthetic_count} synthetic recipes")
 
     # ---------- Users ----------
     user_ids = []
-    for i in range(1, 11):
+    for i in range(1, user_count + 1):
         uid = f"user_{i:03d}"
-        users_col.document(uid).set(create_user(uid, f"User {i}"))
+        writer.set(users_col.document(uid), create_user(uid, f"User {i}"))
         user_ids.append(uid)
-    print("✔ Seeded 10 users")
+    print(f"✔ Seeded {user_count} users")
 
     # ---------- Interactions ----------
-    recipe_ids = [doc.id for doc in recipes_col.list_documents()]
     now = datetime.now()
-
     for rid in recipe_ids:
+        for doc_id, doc in gen_interactions(rid, user_ids, now, views, likes, attempts):
+            writer.set(interactions_col.document(doc_id), doc)
 
-        # views
-        for _ in range(random.randint(10, 200)):
-            user = random.choice(user_ids)
-            t = now - timedelta(days=random.randint(0, 30), hours=random.randint(0, 23))
-            interactions_col.document(str(uuid.uuid4())).set({
-                "recipe_id": rid,
-                "user_id": user,
-                "type": "view",
-                "timestamp": t.isoformat()
-            })
-
-        # likes
-        for _ in range(random.randint(0, 40)):
-            user = random.choice(user_ids)
-            t = now - timedelta(days=random.randint(0, 30))
-            interactions_col.document(str(uuid.uuid4())).set({
-                "recipe_id": rid,
-                "user_id": user,
-                "type": "like",
-                "timestamp": t.isoformat()
-            })
-
-        # attempts + ratings
-        for _ in range(random.randint(0, 20)):
-            user = random.choice(user_ids)
-            rating = random.choice([None, 1, 2, 3, 4, 5])
-            t = now - timedelta(days=random.randint(0, 30))
-
-            doc = {
-                "recipe_id": rid,
-                "user_id": user,
-                "type": "attempt",
-                "difficulty_used": random.choice(["easy", "medium", "hard"]),
-                "timestamp": t.isoformat()
-            }
-
-            if rating is not None:
-                doc["rating"] = rating
-
-            interactions_col.document(str(uuid.uuid4())).set(doc)
-
+    writer.close()
+    elapsed = time.perf_counter() - started
     print("✔ Seeded interactions for all recipes")
 
+    rate = writer.written / elapsed if elapsed else 0.0
+    print(f"✔ Wrote {writer.written} docs in {elapsed:.1f}s ({rate:,.0f} docs/sec)")
+    if bulk and writer.retries:
+        print(f"  {writer.retries} batch commits were retried")
+    if hasattr(client, "stats"):
+        stats = client.stats()
+        print(f"  local backend: {stats['rpcs']} round trips, {stats['simulated_latency_s']}s simulated latency")
+    return writer.written
+
 
 # ============================================================
 # RUN
 # ============================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed the Firestore emulator with recipe data.")
+    parser.add_argument("--recipes", type=int, default=DEFAULT_SYNTHETIC_RECIPES,
+                        help="number of synthetic recipes (the candidate recipe is always added)")
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS, help="number of users")
+    parser.add_argument("--views", type=int, nargs=2, default=DEFAULT_VIEWS, metavar=("MIN", "MAX"),
+                        help="views per recipe")
+    parser.add_argument("--likes", type=int, nargs=2, default=DEFAULT_LIKES, metavar=("MIN", "MAX"),
+                        help="likes per recipe")
+    parser.add_argument("--attempts", type=int, nargs=2, default=DEFAULT_ATTEMPTS, metavar=("MIN", "MAX"),
+                        help="cook attempts per recipe")
+    parser.add_argument("--bulk", action="store_true",
+                        help="group writes into batched commits sent concurrently")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE,
+                        help=f"writes per batch commit in --bulk mode (max {MAX_BATCH_SIZE})")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="batch commits in flight at once in --bulk mode")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="retries per failed batch commit in --bulk mode")
+    parser.add_argument("--random-seed", type=int, default=None,
+                        help="seed the random generator for reproducible data")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    seed()
+    args = parse_args()
+    if args.random_seed is not None:
+        random.seed(args.random_seed)
+    seed(
+        synthetic_count=args.recipes,
+        user_count=args.users,
+        views=tuple(args.views),
+        likes=tuple(args.likes),
+        attempts=tuple(args.attempts),
+        bulk=args.bulk,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        max_retries=args.max_retries,
+    )
@@ -0,0 +1,136 @@
+# similarity.py
+"""
+Recipe-to-recipe similarity from shared ingredients, kept as a top-k
+neighbour index in outputs/analytics/recipe_similarity_index.csv
+(recipe_id, neighbor_id, rank, score).
+
+Recipes are sparse ingredient sets (CSR arrays of ingredient codes), and
+candidates for a recipe come from the posting lists of its ingredients, so
+no recipe x recipe matrix is ever built. Overlap with each candidate is then
+counted exactly and scored as binary cosine or Jaccard.
+
+Posting lists longer than `max_posting` (staples such as salt) contribute a
+window of `max_posting` recipes that rotates with the querying recipe
+instead of the whole list. The index is exact whenever no posting list
+exceeds the cap and approximate otherwise; this is what keeps 100k recipes
+tractable.
+"""
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+OUT_DIR = os.path.join("outputs", "analytics")
+INDEX_PATH = os.path.join(OUT_DIR, "recipe_similarity_index.csv")
+TOP_K = 10
+MAX_POSTING = 1000
+
+
+def _csr(rows, cols, n_rows):
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order]
+
+
+def build_index(ingredients, k=TOP_K, metric="cosine", max_posting=MAX_POSTING):
+    """Returns the top-k neighbours of every recipe as a DataFrame."""
+    pairs = ingredients[["recipe_id", "name"]].dropna().astype(str).drop_duplicates()
+    recipe_codes, recipe_ids = pd.factorize(pairs["recipe_id"], sort=True)
+    ing_codes, _ = pd.factorize(pairs["name"], sort=True)
+    n_recipes, n_ings = len(recipe_ids), int(ing_codes.max()) + 1 if len(ing_codes) else 0
+
+    # recipe -> ingredients and ingredient -> recipes (posting lists)
+    r_ptr, r_ings = _csr(recipe_codes, ing_codes, n_recipes)
+    p_ptr, postings = _csr(ing_codes, recipe_codes, n_ings)
+    sizes = np.diff(r_ptr)
+
+    out_recipe, out_neighbor, out_rank, out_score = [], [], [], []
+    for r in range(n_recipes):
+        mine = r_ings[r_ptr[r]:r_ptr[r + 1]]
+        chunks = []
+        for ing in mine:
+            posting = postings[p_ptr[ing]:p_ptr[ing + 1]]
+            if len(posting) > max_posting:
+                start = (r * 7919) % len(posting)
+                posting = np.take(posting, np.arange(start, start + max_posting), mode="wrap")
+            chunks.append(posting)
+        if not chunks:
+            continue
+        candidates = np.unique(np.concatenate(chunks))
+        candidates = candidates[candidates != r]
+        if not len(candidates):
+            continue
+
+        # Exact overlap: which of each candidate's ingredients are also mine
+        starts, lengths = r_ptr[candidates], sizes[candidates]
+        offsets = np.cumsum(lengths) - lengths
+        flat = r_ings[np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())]
+        hits = np.isin(flat, mine).astype(np.int64)
+        inter = np.add.reduceat(hits, offsets)
+
+        if metric == "jaccard":
+            score = inter / (sizes[r] + sizes[candidates] - inter)
+        else:
+            score = inter / np.sqrt(sizes[r] * sizes[candidates])
+
+        top = min(k, len(candidates))
+        best = np.argpartition(-score, top - 1)[:top]
+        best = best[np.lexsort((candidates[best], -score[best]))]
+        out_recipe.append(np.full(top, r))
+        out_neighbor.append(candidates[best])
+        out_rank.append(np.arange(1, top + 1))
+        out_score.append(score[best])
+
+    if not out_recipe:
+        return pd.DataFrame(columns=["recipe_id", "neighbor_id", "rank", "score"])
+    return pd.DataFrame({
+        "recipe_id": recipe_ids[np.concatenate(out_recipe)],
+        "neighbor_id": recipe_ids[np.concatenate(out_neighbor)],
+        "rank": np.concatenate(out_rank),
+        "score": np.round(np.concatenate(out_score), 6),
+    })
+
+
+def _fingerprint(ingredients, k, metric, max_posting):
+    pairs = ingredients[["recipe_id", "name"]].astype(str)
+    h = hashlib.sha256(repr((k, metric, max_posting)).encode())
+    h.update(pd.util.hash_pandas_object(pairs, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def ensure_index(ingredients, path=INDEX_PATH, k=TOP_K, metric="cosine", max_posting=MAX_POSTING):
+    """Loads the persisted index, rebuilding it only when the ingredients changed."""
+    fingerprint = _fingerprint(ingredients, k, metric, max_posting)
+    sidecar = path + ".fingerprint"
+    if os.path.exists(path) and os.path.exists(sidecar):
+        with open(sidecar, encoding="utf-8") as f:
+            if f.read().strip() == fingerprint:
+                return load_index(path)
+
+    index = build_index(ingredients, k, metric, max_posting)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    index.to_csv(path, index=False)
+    with open(sidecar, "w", encoding="utf-8") as f:
+        f.write(fingerprint + "\n")
+    return index
+
+
+def load_index(path=INDEX_PATH):
+    return pd.read_csv(path, dtype={"recipe_id": str, "neighbor_id": str})
+
+
+def neighbours(index, recipe_id, k=TOP_K):
+    """Top-k most similar recipes to `recipe_id` as (neighbor_id, score) rows."""
+    hits = index[index["recipe_id"] == recipe_id]
+    return hits.sort_values("rank").head(k)[["neighbor_id", "score"]].reset_index(drop=True)
+
+
+def sample_matrix(index, n=30):
+    """Dense similarity block for the first `n` recipes, for plotting only."""
+    ids = sorted(index["recipe_id"].unique())[:n]
+    block = index[index["recipe_id"].isin(ids) & index["neighbor_id"].isin(ids)]
+    matrix = block.pivot_table(index="recipe_id", columns="neighbor_id", values="score", fill_value=0.0)
+    values = matrix.reindex(index=ids, columns=ids, fill_value=0.0).to_numpy(copy=True)
+    np.fill_diagonal(values, 1.0)
+    return pd.DataFrame(values, index=ids, columns=ids)
@@ -1,88 +1,443 @@
 # transform_to_csv.py
 """
-Transforms outputs/raw_json/*.json into normalized CSVs:
+Transforms outputs/raw_json/*.jsonl (or legacy *.json) into normalized CSVs:
  - outputs/csv/recipe.csv
  - outputs/csv/ingredients.csv
  - outputs/csv/steps.csv
- - outputs/csv/interactions.csv
+ - outputs/csv/interactions.csv (with `ts_epoch`, the timestamp parsed once to epoch seconds)
+ - outputs/csv/users.csv
+Every table also carries the dense integer codes of its recipe/user/type ids
+(recipe_code, user_code, type_code; see id_dictionary.py),
+plus typed Parquet copies in outputs/columnar/ (see columnar.py) and the
+hourly/daily interaction rollups in outputs/rollups/ (see rollups.py); the
+new interactions are then applied to the counter store (see aggregates.py,
+whose consistency digests are recorded as interactions.csv is written)
+
+With --validate the validator rules run inline on batches of rows as they are
+written: failing rows go to outputs/quarantine/<same file>.csv with a
+`problems` column instead of the clean CSVs, and
+outputs/validation_report.json is written in the same pass, so no CSV has to
+be read back for validation.
+
+With --workers N a .jsonl interactions snapshot is split into N line-aligned
+byte ranges normalized (and validated) in a process pool; the parts are merged
+in order into the same interactions.csv a single process writes (see
+SHARDED INTERACTIONS below). --keep-shards also leaves the parts on disk.
 """
 
-import os, csv, json, uuid
-from utils import read_json_file, write_json_file
+import os, io, csv, json, uuid, shutil, argparse
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from utils import iter_json_records, snapshot_path
+import aggregates
+import columnar
+import id_dictionary
+import metrics
+import rollups
+import validator
 
 CSV_DIR = os.path.join("outputs","csv")
+QUARANTINE_DIR = os.path.join("outputs","quarantine")
 os.makedirs(CSV_DIR, exist_ok=True)
 
-def normalize_recipes(recipes_json_path):
-    recipes = read_json_file(recipes_json_path)
-    recipes_rows = []
-    ingredients_rows = []
-    steps_rows = []
-    for r in recipes:
-        r_id = r.get("id") or r.get("_id") or str(uuid.uuid4())
-        recipes_rows.append({
-            "recipe_id": r_id,
-            "title": r.get("title"),
-            "description": r.get("description"),
-            "servings": r.get("servings"),
-            "prep_minutes": r.get("prep_minutes"),
-            "cook_minutes": r.get("cook_minutes"),
-            "total_minutes": r.get("total_minutes"),
-            "difficulty": r.get("difficulty"),
-            "tags": "|".join(r.get("tags", []))
-        })
-        for idx, ing in enumerate(r.get("ingredients", [])):
-            ingredients_rows.append({
-                "ingredient_id": f"{r_id}_ing_{idx+1}",
-                "recipe_id": r_id,
-                "name": ing.get("name"),
-                "quantity": ing.get("quantity"),
-                "unit": ing.get("unit"),
-                "notes": ing.get("notes", "")
+RECIPE_HEADERS = ["recipe_id","title","description","servings","prep_minutes","cook_minutes","total_minutes","difficulty","tags","recipe_code"]
+INGREDIENT_HEADERS = ["ingredient_id","recipe_id","name","quantity","unit","notes","recipe_code"]
+STEP_HEADERS = ["step_id","recipe_id","step_number","instruction","recipe_code"]
+USER_HEADERS = ["user_id","name","joined_at","user_code"]
+INTERACTION_HEADERS = ["interaction_id","recipe_id","type","user_id","timestamp","rating","difficulty_used","ts_epoch",
+                       "recipe_code","user_code","type_code"]
+
+def open_csv(stack, path, headers, header=True):
+    f = stack.enter_context(open(path, "w", newline="", encoding="utf-8"))
+    writer = csv.DictWriter(f, fieldnames=headers)
+    if header:
+        writer.writeheader()
+    return writer
+
+def _as_csv_frame(rows, headers):
+    # The strings these rows become once written, i.e. exactly what validator.py
+    # would read back from the CSV
+    return pd.DataFrame([["" if r.get(h) is None else str(r.get(h)) for h in headers] for r in rows],
+                        columns=headers)
+
+COLLECT_BATCH = 100_000
+
+class TableSink:
+    """
+    CSV output for one table. Without a ValidationRun rows are written straight
+    through; with one they are buffered, checked batch-wise with the validator
+    rules on flush(), and failing rows are written to the quarantine CSV.
+
+    With collect=True the rows written to the clean CSV are also kept, in
+    their CSV string form, and frame() returns them as one DataFrame (how the
+    pipeline hands the tables to the next stages without reading them back).
+    """
+    def __init__(self, stack, filename, headers, table, run=None,
+                 csv_dir=CSV_DIR, quarantine_dir=QUARANTINE_DIR, header=True, collect=False):
+        self.headers, self.table, self.run = headers, table, run
+        self.writer = open_csv(stack, os.path.join(csv_dir, filename), headers, header)
+        self.rows = []
+        self.collect = collect
+        self.collected, self.frames = [], []
+        if run is not None:
+            os.makedirs(quarantine_dir, exist_ok=True)
+            self.quarantine = open_csv(stack, os.path.join(quarantine_dir, filename), headers + ["problems"], header)
+
+    def _write(self, row):
+        self.writer.writerow(row)
+        if self.collect:
+            self.collected.append(row)
+            if len(self.collected) >= COLLECT_BATCH:
+                # Strings in columns hold far less than the row dicts
+                self.frames.append(_as_csv_frame(self.collected, self.headers))
+                self.collected = []
+
+    def frame(self):
+        """The rows written to the clean CSV so far (collect=True), as CSV strings."""
+        frames = self.frames + [_as_csv_frame(self.collected, self.headers)]
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    def writerow(self, row):
+        if self.run is None:
+            self._write(row)
+        else:
+            self.rows.append(row)
+
+    def pending(self):
+        return len(self.rows)
+
+    def ids(self, column):
+        return pd.Index([str(r.get(column) or "") for r in self.rows]).unique()
+
+    def flush(self, ctx):
+        """Validates and writes the buffered rows; returns the ids of the valid ones."""
+        if not self.rows:
+            return []
+        id_column = validator.RULES[self.table][1]
+        df = _as_csv_frame(self.rows, self.headers)
+        invalid, results = validator.check_batch(self.table, df, ctx)
+        self.run.add_batch(self.table, df, id_column, invalid, results)
+        problems = iter(validator.row_problems(df, id_column, results))
+        valid_ids = []
+        for row, bad, row_id in zip(self.rows, invalid, df[id_column]):
+            if bad:
+                self.quarantine.writerow({**row, "problems": "; ".join(next(problems)["problems"])})
+            else:
+                self._write(row)
+                valid_ids.append(row_id)
+        self.rows = []
+        return valid_ids
+
+# Both normalizers stream: records are parsed from the snapshot one at a time
+# and their rows written straight away, so memory does not grow with input size.
+# When validating, at most `batch_size` rows per table are buffered, and `ctx`
+# collects the valid recipe/user ids the interaction foreign keys are checked
+# against.
+
+def normalize_recipes(recipes_json_path, run=None, ctx=None, batch_size=validator.BATCH_SIZE, collect=False):
+    ctx = ctx if ctx is not None else {}
+    valid_recipes = []
+    recipe_ids = id_dictionary.load("recipe")
+    with ExitStack() as stack:
+        span = stack.enter_context(metrics.span("normalize_recipes"))
+        recipe_out = TableSink(stack, "recipe.csv", RECIPE_HEADERS, "recipes", run, collect=collect)
+        ingredient_out = TableSink(stack, "ingredients.csv", INGREDIENT_HEADERS, "ingredients", run, collect=collect)
+        step_out = TableSink(stack, "steps.csv", STEP_HEADERS, "steps", run, collect=collect)
+
+        def flush():
+            # Children of a batch arrive with their recipes, so each batch
+            # carries its own parent/child indexes
+            batch_ids = recipe_out.flush({
+                "recipe_ingredients": ingredient_out.ids("recipe_id"),
+                "recipe_steps": step_out.ids("recipe_id"),
             })
-        for idx, step in enumerate(r.get("steps", [])):
-            steps_rows.append({
-                "step_id": f"{r_id}_step_{idx+1}",
+            valid_recipes.extend(batch_ids)
+            parents = {"recipes": pd.Index(batch_ids)}
+            ingredient_out.flush(parents)
+            step_out.flush(parents)
+
+        for r in iter_json_records(recipes_json_path):
+            span.rows += 1
+            r_id = r.get("id") or r.get("_id") or str(uuid.uuid4())
+            r_code = recipe_ids.code(r_id)
+            recipe_out.writerow({
                 "recipe_id": r_id,
-                "step_number": idx+1,
-                "instruction": step
+                "title": r.get("title"),
+                "description": r.get("description"),
+                "servings": r.get("servings"),
+                "prep_minutes": r.get("prep_minutes"),
+                "cook_minutes": r.get("cook_minutes"),
+                "total_minutes": r.get("total_minutes"),
+                "difficulty": r.get("difficulty"),
+                "tags": "|".join(r.get("tags", [])),
+                "recipe_code": r_code
             })
-    # write CSVs
-    def write_csv(path, rows, headers):
-        with open(path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=headers)
-            writer.writeheader()
-            for row in rows:
-                writer.writerow(row)
-    write_csv(os.path.join(CSV_DIR,"recipe.csv"), recipes_rows,
-              ["recipe_id","title","description","servings","prep_minutes","cook_minutes","total_minutes","difficulty","tags"])
-    write_csv(os.path.join(CSV_DIR,"ingredients.csv"), ingredients_rows,
-              ["ingredient_id","recipe_id","name","quantity","unit","notes"])
-    write_csv(os.path.join(CSV_DIR,"steps.csv"), steps_rows,
-              ["step_id","recipe_id","step_number","instruction"])
+            for idx, ing in enumerate(r.get("ingredients", [])):
+                ingredient_out.writerow({
+                    "ingredient_id": f"{r_id}_ing_{idx+1}",
+                    "recipe_id": r_id,
+                    "name": ing.get("name"),
+                    "quantity": ing.get("quantity"),
+                    "unit": ing.get("unit"),
+                    "notes": ing.get("notes", ""),
+                    "recipe_code": r_code
+                })
+            for idx, step in enumerate(r.get("steps", [])):
+                step_out.writerow({
+                    "step_id": f"{r_id}_step_{idx+1}",
+                    "recipe_id": r_id,
+                    "step_number": idx+1,
+                    "instruction": step,
+                    "recipe_code": r_code
+                })
+            if run is not None and max(recipe_out.pending(), ingredient_out.pending(), step_out.pending()) >= batch_size:
+                flush()
+        if run is not None:
+            flush()
+            ctx["recipes"] = pd.Index(valid_recipes)
+    recipe_ids.save()
     print("Wrote recipe.csv, ingredients.csv, steps.csv")
+    if collect:
+        return {out.table: out.frame() for out in (recipe_out, ingredient_out, step_out)}
 
-def normalize_interactions(interactions_json_path):
-    interactions = read_json_file(interactions_json_path)
-    rows = []
-    for d in interactions:
-        rows.append({
-            "interaction_id": d.get("_id") or d.get("id") or str(uuid.uuid4()),
-            "recipe_id": d.get("recipe_id"),
-            "type": d.get("type"),
-            "user_id": d.get("user_id"),
-            "timestamp": d.get("timestamp"),
-            "rating": d.get("rating",""),
-            "difficulty_used": d.get("difficulty_used","")
-        })
-    import csv
-    with open(os.path.join(CSV_DIR,"interactions.csv"), "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["interaction_id","recipe_id","type","user_id","timestamp","rating","difficulty_used"])
-        writer.writeheader()
-        for r in rows:
-            writer.writerow(r)
+def normalize_users(users_json_path, run=None, ctx=None, batch_size=validator.BATCH_SIZE, collect=False):
+    ctx = ctx if ctx is not None else {}
+    valid_users = []
+    user_ids = id_dictionary.load("user")
+    with ExitStack() as stack:
+        span = stack.enter_context(metrics.span("normalize_users"))
+        out = TableSink(stack, "users.csv", USER_HEADERS, "users", run, collect=collect)
+        for u in iter_json_records(users_json_path):
+            span.rows += 1
+            u_id = u.get("uid") or u.get("_id")
+            out.writerow({
+                "user_id": u_id,
+                "name": u.get("name"),
+                "joined_at": u.get("joined_at"),
+                "user_code": user_ids.code(u_id)
+            })
+            if run is not None and out.pending() >= batch_size:
+                valid_users.extend(out.flush(ctx))
+        if run is not None:
+            valid_users.extend(out.flush(ctx))
+            ctx["users"] = pd.Index(valid_users)
+    user_ids.save()
+    print("Wrote users.csv")
+    if collect:
+        return {out.table: out.frame()}
+
+def _interaction_row(d, recipe_ids, user_ids, type_ids, new_types=None):
+    kind = d.get("type")
+    if new_types is None:
+        type_code = type_ids.code(kind)
+    else:
+        # Shard workers only look types up; new ones are interned by the parent
+        type_code = type_ids.lookup(kind)
+        if type_code == id_dictionary.MISSING and kind:
+            new_types.setdefault(str(kind), None)
+            type_code = ""
+    return {
+        "interaction_id": d.get("_id") or d.get("id") or str(uuid.uuid4()),
+        "recipe_id": d.get("recipe_id"),
+        "type": kind,
+        "user_id": d.get("user_id"),
+        "timestamp": d.get("timestamp"),
+        "rating": d.get("rating",""),
+        "difficulty_used": d.get("difficulty_used",""),
+        "ts_epoch": rollups.to_epoch(d.get("timestamp")),
+        "recipe_code": recipe_ids.lookup(d.get("recipe_id")),
+        "user_code": user_ids.lookup(d.get("user_id")),
+        "type_code": type_code
+    }
+
+def normalize_interactions(interactions_json_path, run=None, ctx=None, batch_size=validator.BATCH_SIZE,
+                           workers=1, keep_shards=False, collect=False):
+    if run is not None and not {"recipes", "users"} <= set(ctx or {}):
+        # Validating on its own: check against the parents already on disk
+        ctx = {**validator.load_context(CSV_DIR), **(ctx or {})}
+    if workers > 1 and not interactions_json_path.endswith(".jsonl"):
+        # A JSON array cannot be split at line boundaries like a .jsonl snapshot
+        print(f"Warning: {workers} workers requested, but {interactions_json_path} is a JSON array: "
+              "only .jsonl snapshots can be sharded, normalizing in a single process")
+    elif workers > 1:
+        normalize_interactions_sharded(interactions_json_path, workers, run, ctx, batch_size, keep_shards)
+        aggregates.mark_digests(CSV_DIR)
+        if collect:
+            # The rows were written by the worker processes; the merged file is the one copy of them
+            return {"interactions": pd.read_csv(os.path.join(CSV_DIR, "interactions.csv"), dtype=str,
+                                                keep_default_na=False)}
+        return None
+    # Recipes and users are only looked up (unknown ones get -1); types are interned
+    recipe_ids, user_ids, type_ids = (id_dictionary.load(kind) for kind in id_dictionary.KINDS)
+    with ExitStack() as stack:
+        span = stack.enter_context(metrics.span("normalize_interactions"))
+        out = TableSink(stack, "interactions.csv", INTERACTION_HEADERS, "interactions", run, collect=collect)
+        for d in iter_json_records(interactions_json_path):
+            span.rows += 1
+            out.writerow(_interaction_row(d, recipe_ids, user_ids, type_ids))
+            if run is not None and out.pending() >= batch_size:
+                out.flush(ctx)
+        if run is not None:
+            out.flush(ctx)
+    type_ids.save()
+    # Lets the counter store check the file's history without reading it again
+    aggregates.mark_digests(CSV_DIR)
     print("Wrote interactions.csv")
+    if collect:
+        return {out.table: out.frame()}
+
+# ---------------------------------------------------
+# SHARDED INTERACTIONS
+# ---------------------------------------------------
+# The .jsonl snapshot is split into `workers` byte ranges aligned to line
+# starts; each is normalized (and validated) in its own process into
+# outputs/csv/interactions.shards/part-NNNNN.csv, without a header. The parts
+# are then concatenated in range order behind one header, so interactions.csv
+# has exactly the rows, order and interaction_ids of the sequential run.
+# Types not yet in the dictionary are interned afterwards in shard order
+# (= order of first appearance, as sequentially) and patched into the parts
+# that had them.
+
+SHARD_DIR = os.path.join(CSV_DIR, "interactions.shards")
+QUARANTINE_SHARD_DIR = os.path.join(QUARANTINE_DIR, "interactions.shards")
+
+def shard_ranges(path, shards):
+    """`shards` (start, end) byte ranges of `path`, each starting at the beginning of a line."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, shards):
+            target = max(size * i // shards, bounds[-1])
+            if target >= size:
+                break
+            f.seek(target - 1 if target else 0)
+            f.readline()  # finish the line `target` falls in
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+def _normalize_shard(task):
+    path, shard, start, end, ctx, batch_size, validate, with_problems = task
+    recipe_ids, user_ids, type_ids = (id_dictionary.load(kind) for kind in id_dictionary.KINDS)
+    log = validator.BatchLog(with_problems) if validate else None
+    new_types = {}
+    filename = f"part-{shard:05d}.csv"
+    with ExitStack() as stack:
+        span = stack.enter_context(metrics.span("normalize_interactions.shard", shard=shard))
+        out = TableSink(stack, filename, INTERACTION_HEADERS, "interactions", log,
+                        csv_dir=SHARD_DIR, quarantine_dir=QUARANTINE_SHARD_DIR, header=False)
+        f = stack.enter_context(open(path, "rb"))
+        f.seek(start)
+        position = start
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            if not line.strip():
+                continue
+            span.rows += 1
+            out.writerow(_interaction_row(json.loads(line), recipe_ids, user_ids, type_ids, new_types))
+            if validate and out.pending() >= batch_size:
+                out.flush(ctx)
+        if validate:
+            out.flush(ctx)
+    return {"shard": shard, "rows": span.rows, "new_types": list(new_types),
+            "summaries": log.summaries if validate else []}
+
+def _append_part(dest, part_path, type_ids, patch):
+    if not patch:
+        with open(part_path, "rb") as src:
+            shutil.copyfileobj(src, dest, 1 << 20)
+        return
+    # Fill in the type codes the worker could not know yet
+    type_col, code_col = INTERACTION_HEADERS.index("type"), INTERACTION_HEADERS.index("type_code")
+    text = io.TextIOWrapper(dest, encoding="utf-8", newline="", write_through=True)
+    writer = csv.writer(text)
+    with open(part_path, newline="", encoding="utf-8") as src:
+        for row in csv.reader(src):
+            if row[code_col] == "" and row[type_col]:
+                row[code_col] = type_ids.code(row[type_col])
+            writer.writerow(row)
+    text.detach()
+
+def _merge_parts(out_path, headers, parts, type_ids, patched):
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as dest:
+        header = io.StringIO()
+        csv.writer(header).writerow(headers)
+        dest.write(header.getvalue().encode("utf-8"))
+        for shard, part_path in parts:
+            if os.path.exists(part_path):
+                _append_part(dest, part_path, type_ids, shard in patched)
+    os.replace(tmp_path, out_path)
+
+def normalize_interactions_sharded(interactions_json_path, workers, run=None, ctx=None,
+                                   batch_size=validator.BATCH_SIZE, keep_shards=False):
+    ranges = shard_ranges(interactions_json_path, workers)
+    validate = run is not None
+    with_problems = validate and run.failures_path is not None
+    for d in (SHARD_DIR,) + ((QUARANTINE_SHARD_DIR,) if validate else ()):
+        shutil.rmtree(d, ignore_errors=True)
+        os.makedirs(d, exist_ok=True)
+
+    tasks = [(interactions_json_path, shard, start, end, ctx if validate else None, batch_size, validate, with_problems)
+             for shard, (start, end) in enumerate(ranges)]
+    with metrics.span("normalize_interactions", workers=workers, shards=len(tasks)) as span:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_normalize_shard, tasks))  # in shard order
+
+        type_ids = id_dictionary.load("type")
+        patched = set()
+        for result in results:
+            span.rows += result["rows"]
+            for kind in result["new_types"]:
+                type_ids.code(kind)
+            if result["new_types"]:
+                patched.add(result["shard"])
+            for table, summary in result["summaries"]:
+                run.add_summary(table, summary)
+
+        names = [(shard, f"part-{shard:05d}.csv") for shard in range(len(tasks))]
+        _merge_parts(os.path.join(CSV_DIR, "interactions.csv"), INTERACTION_HEADERS,
+                     [(shard, os.path.join(SHARD_DIR, name)) for shard, name in names], type_ids, patched)
+        if validate:
+            _merge_parts(os.path.join(QUARANTINE_DIR, "interactions.csv"), INTERACTION_HEADERS + ["problems"],
+                         [(shard, os.path.join(QUARANTINE_SHARD_DIR, name)) for shard, name in names],
+                         type_ids, patched)
+        type_ids.save()
+    if not keep_shards:
+        shutil.rmtree(SHARD_DIR, ignore_errors=True)
+        shutil.rmtree(QUARANTINE_SHARD_DIR, ignore_errors=True)
+    print(f"Wrote interactions.csv from {len(tasks)} shards"
+          + (f" (parts kept in {SHARD_DIR})" if keep_shards else ""))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Normalize the raw Firestore snapshots into CSVs.")
+    parser.add_argument("--validate", action="store_true",
+                        help="run the validator rules inline and quarantine failing rows")
+    parser.add_argument("--sample-size", type=int, default=validator.SAMPLE_SIZE,
+                        help="offending ids kept per rule in the validation report")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="normalize the interactions snapshot in this many processes (.jsonl only)")
+    parser.add_argument("--keep-shards", action="store_true",
+                        help=f"keep the per-shard interaction CSVs in {SHARD_DIR} next to the merged file")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    normalize_recipes(os.path.join("outputs","raw_json","recipes.json"))
-    normalize_interactions(os.path.join("outputs","raw_json","interactions.json"))
+    args = parse_args()
+    raw_dir = os.path.join("outputs","raw_json")
+    run = validator.ValidationRun(args.sample_size) if args.validate else None
+    ctx = {}
+    normalize_recipes(snapshot_path(raw_dir, "recipes"), run, ctx)
+    normalize_users(snapshot_path(raw_dir, "users"), run, ctx)
+    normalize_interactions(snapshot_path(raw_dir, "interactions"), run, ctx,
+                           workers=args.workers, keep_shards=args.keep_shards)
+    if run is not None:
+        run.close()
+        validator.write_report(run.report())
+        print("Validation report:", validator.REPORT_PATH, "— invalid rows quarantined in", QUARANTINE_DIR)
+    columnar.write_all()
+    rollups.write_all()
+    print(f"Applied {aggregates.refresh()} new interactions to {aggregates.STORE_PATH}")
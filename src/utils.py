@@ -1,12 +1,29 @@
 # utils.py
-import json, os
-from google.cloud import firestore
-from datetime import datetime
-from typing import Dict, Any
+import json, os, re
 
-def get_firestore_client():
-    # Uses emulator if FIRESTORE_EMULATOR_HOST is set
-    return firestore.Client()
+def get_firestore_client(project=None):
+    """
+    Client for the backend named by FIRESTORE_BACKEND:
+     - unset or "emulator": firestore.Client (the emulator if FIRESTORE_EMULATOR_HOST is set)
+     - "memory": in-process stand-in (firestore_local), shared within the process
+     - "file:<path>": the same stand-in persisted to <path>, shared across processes
+    FIRESTORE_LATENCY_MS adds simulated round-trip latency to the local backends.
+    """
+    backend = os.environ.get("FIRESTORE_BACKEND", "emulator")
+    if backend == "emulator":
+        from google.cloud import firestore
+        return firestore.Client(project=project)
+
+    import firestore_local
+    if backend == "memory":
+        path = None
+    elif backend.startswith("file:"):
+        path = os.path.abspath(backend[len("file:"):])
+    else:
+        raise ValueError(f"Unknown FIRESTORE_BACKEND {backend!r} (expected emulator, memory or file:<path>)")
+    latency_ms = float(os.environ.get("FIRESTORE_LATENCY_MS", "0"))
+    return firestore_local.LocalClient(firestore_local.shared_store(path), latency_ms,
+                                       project or "local")
 
 def write_json_file(path, data):
     os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -16,3 +33,76 @@ def write_json_file(path, data):
 def read_json_file(path):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_NUMBER_START = "-0123456789"
+_NUMBER_CHARS = "0123456789.eE+-"
+
+def iter_json_array(f, chunk_size=1 << 16):
+    # Decodes a top-level JSON array one element at a time, reading the file in
+    # chunks so only the current element (plus one chunk) is ever in memory
+    decoder = json.JSONDecoder()
+    buf, pos = "", 0
+    read_size, eof = chunk_size, False
+    started, expect_comma, after_comma = False, False, False
+
+    def refill():
+        # Each refill for the same element reads twice as much as the last, so
+        # an element spanning many chunks is re-decoded O(log n) times, not O(n)
+        nonlocal buf, pos, read_size, eof
+        more = f.read(read_size)
+        eof = not more
+        buf, pos = buf[pos:] + more, 0
+        read_size *= 2
+
+    while True:
+        pos = _WHITESPACE.match(buf, pos).end()
+        if pos == len(buf):
+            if eof:
+                raise ValueError("unexpected end of JSON array")
+            refill()
+            continue
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("expected a JSON array")
+            started, pos = True, pos + 1
+            continue
+        if buf[pos] == "]":
+            if after_comma:
+                raise ValueError("trailing ',' in JSON array")
+            return
+        if expect_comma:
+            if buf[pos] != ",":
+                raise ValueError(f"expected ',' in JSON array, got {buf[pos]!r}")
+            expect_comma, after_comma, pos = False, True, pos + 1
+            continue
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            refill()
+            continue
+        if not eof and (end == len(buf) or (buf[pos] in _NUMBER_START and buf[end] in _NUMBER_CHARS)):
+            # A number cut at the chunk boundary decodes as its prefix ("123" of
+            # "123456", "1.5" of "1.5e-7"); decode it again with more input
+            refill()
+            continue
+        yield obj
+        pos, expect_comma, after_comma = end, True, False
+        read_size = chunk_size
+
+def iter_json_records(path):
+    # Yields records from a line-delimited .jsonl snapshot, or a .json array
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(f)
+
+def snapshot_path(raw_dir, name):
+    # Prefers the line-delimited export, falling back to the legacy .json array
+    jsonl = os.path.join(raw_dir, f"{name}.jsonl")
+    return jsonl if os.path.exists(jsonl) else os.path.join(raw_dir, f"{name}.json")
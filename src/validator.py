@@ -1,118 +1,451 @@
 # validator.py
 """
-Validates CSVs according to rules:
- - Required fields present (recipe_id, title, ingredients non-empty, steps non-empty)
- - Numeric fields non-negative (prep_minutes, cook_minutes, total_minutes, servings)
- - difficulty is one of allowed set
-Generates outputs/validation_report.json
+Validates CSVs according to declarative rules (see RULES):
+ - Required fields present (recipe_id, title, ingredient name, instruction, ...)
+ - Recipes have at least one ingredient and one step
+ - Numeric fields numeric and non-negative (prep/cook/total minutes, servings, quantity)
+ - total_minutes == prep_minutes + cook_minutes
+ - difficulty and interaction type in their allowed sets, rating in 1-5
+ - Foreign keys: ingredient/step/interaction recipe_id exists in recipe.csv,
+   interaction user_id exists in users.csv
+
+Tables are read in batches and every rule is evaluated column-wise on a whole
+batch. Parent ids are held in a pandas Index, so foreign-key checks are hash
+lookups rather than scans.
+Generates outputs/validation_report.json with exact per-rule counts and a
+bounded sample of offending ids (see ValidationRun).
 """
-import csv, json, os
-from collections import defaultdict
+import json, os, sys, argparse
+import numpy as np
+import pandas as pd
+import metrics
 
 CSV_DIR = os.path.join("outputs","csv")
 REPORT_PATH = os.path.join("outputs","validation_report.json")
 ALLOWED_DIFFICULTIES = {"easy","medium","hard"}
+ALLOWED_INTERACTION_TYPES = {"view","like","attempt"}
+ISO_TIMESTAMP = r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?([+-]\d{2}:\d{2}|Z)?"
+BATCH_SIZE = 100_000
+SAMPLE_SIZE = 20
 
-def validate_recipes():
-    problems = []
-    valid_count = 0
-    path = os.path.join(CSV_DIR,"recipe.csv")
-    with open(path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rid = row.get("recipe_id")
-            row_problems = []
-            if not rid:
-                row_problems.append("missing recipe_id")
-            if not row.get("title"):
-                row_problems.append("missing title")
-            # numeric checks
-            try:
-                if row.get("prep_minutes"):
-                    if float(row["prep_minutes"]) < 0: row_problems.append("prep_minutes negative")
-            except:
-                row_problems.append("prep_minutes not numeric")
-            try:
-                if row.get("cook_minutes"):
-                    if float(row["cook_minutes"]) < 0: row_problems.append("cook_minutes negative")
-            except:
-                row_problems.append("cook_minutes not numeric")
-            try:
-                if row.get("total_minutes"):
-                    if float(row["total_minutes"]) < 0: row_problems.append("total_minutes negative")
-            except:
-                row_problems.append("total_minutes not numeric")
-            diff = (row.get("difficulty") or "").lower()
-            if diff and diff not in ALLOWED_DIFFICULTIES:
-                row_problems.append(f"invalid difficulty: {diff}")
-            if row_problems:
-                problems.append({"recipe_id": rid, "problems": row_problems})
-            else:
-                valid_count += 1
-    return valid_count, problems
-
-def validate_ingredients():
-    problems = []
-    valid = 0
-    path = os.path.join(CSV_DIR,"ingredients.csv")
-    with open(path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            row_problems = []
-            if not row.get("recipe_id"): row_problems.append("missing recipe_id")
-            if not row.get("name"): row_problems.append("missing ingredient name")
-            if row_problems:
-                problems.append({"ingredient_id": row.get("ingredient_id"), "problems": row_problems})
-            else:
-                valid += 1
-    return valid, problems
-
-def validate_steps():
-    problems = []
-    valid = 0
-    path = os.path.join(CSV_DIR,"steps.csv")
-    with open(path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rp = []
-            if not row.get("recipe_id"): rp.append("missing recipe_id")
-            if not row.get("instruction"): rp.append("missing instruction")
-            if rp:
-                problems.append({"step_id": row.get("step_id"), "problems": rp})
-            else:
-                valid += 1
-    return valid, problems
-
-def validate_interactions():
-    problems=[]
-    valid=0
-    path=os.path.join(CSV_DIR,"interactions.csv")
-    with open(path, newline='', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rp=[]
-            if not row.get("recipe_id"): rp.append("missing recipe_id")
-            if not row.get("type"): rp.append("missing type")
-            if rp:
-                problems.append({"interaction_id": row.get("interaction_id"), "problems": rp})
-            else:
-                valid += 1
-    return valid, problems
 
-if __name__ == "__main__":
-    report = {}
-    v_r, p_r = validate_recipes()
-    v_i, p_i = validate_ingredients()
-    v_s, p_s = validate_steps()
-    v_in, p_in = validate_interactions()
-    report["recipes_valid_count"] = v_r
-    report["recipes_invalid"] = p_r
-    report["ingredients_valid_count"] = v_i
-    report["ingredients_invalid"] = p_i
-    report["steps_valid_count"] = v_s
-    report["steps_invalid"] = p_s
-    report["interactions_valid_count"] = v_in
-    report["interactions_invalid"] = p_in
-    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+def _blank(col):
+    return col.isna() | (col.astype(str).str.strip() == "")
+
+
+# ---------------------------------------------------
+# RULES
+# ---------------------------------------------------
+# Each rule yields (rule_id, violation_mask, message) for a batch; message is a
+# string or a function of the failing rows returning one message per row.
+
+class Required:
+    def __init__(self, column, label=None):
+        self.column, self.label = column, label or column
+
+    def violations(self, df, ctx):
+        yield f"{self.column}.required", _blank(df[self.column]), f"missing {self.label}"
+
+
+class NonNegative:
+    def __init__(self, column):
+        self.column = column
+
+    def violations(self, df, ctx):
+        present = ~_blank(df[self.column])
+        num = pd.to_numeric(df[self.column].where(present), errors="coerce")
+        yield f"{self.column}.numeric", present & num.isna(), f"{self.column} not numeric"
+        yield f"{self.column}.non_negative", num < 0, f"{self.column} negative"
+
+
+class InRange:
+    def __init__(self, column, low, high):
+        self.column, self.low, self.high = column, low, high
+
+    def violations(self, df, ctx):
+        present = ~_blank(df[self.column])
+        num = pd.to_numeric(df[self.column].where(present), errors="coerce")
+        bad = present & ~num.between(self.low, self.high)
+        yield f"{self.column}.range", bad, f"{self.column} not between {self.low} and {self.high}"
+
+
+class OneOf:
+    def __init__(self, column, allowed, label=None):
+        self.column, self.allowed, self.label = column, allowed, label or column
+
+    def violations(self, df, ctx):
+        values = df[self.column].astype(str).str.lower()
+        bad = ~_blank(df[self.column]) & ~values.isin(self.allowed)
+        yield f"{self.column}.allowed", bad, lambda rows: f"invalid {self.label}: " + values[rows]
+
+
+class Matches:
+    def __init__(self, column, pattern):
+        self.column, self.pattern = column, pattern
+
+    def violations(self, df, ctx):
+        values = df[self.column].astype(str)
+        bad = ~_blank(df[self.column]) & ~values.str.fullmatch(self.pattern)
+        yield f"{self.column}.format", bad, f"{self.column} malformed"
+
+
+class SumEquals:
+    def __init__(self, total, parts):
+        self.total, self.parts = total, parts
+
+    def violations(self, df, ctx):
+        total = pd.to_numeric(df[self.total], errors="coerce")
+        parts = [pd.to_numeric(df[p], errors="coerce") for p in self.parts]
+        known = total.notna()
+        for p in parts:
+            known &= p.notna()
+        bad = known & (total != sum(parts))
+        yield f"{self.total}.sum", bad, f"{self.total} != {' + '.join(self.parts)}"
+
+
+class ForeignKey:
+    def __init__(self, column, parent):
+        self.column, self.parent = column, parent
+
+    def violations(self, df, ctx):
+        parent_ids = ctx.get(self.parent)
+        if parent_ids is None:
+            return
+        values = df[self.column]
+        bad = ~_blank(values) & (parent_ids.get_indexer(values.astype(str)) == -1)
+        yield f"{self.column}.foreign_key", bad, lambda rows: f"unknown {self.column}: " + values[rows].astype(str)
+
+
+class HasChildren:
+    def __init__(self, column, child, label):
+        self.column, self.child, self.label = column, child, label
+
+    def violations(self, df, ctx):
+        child_ids = ctx.get(self.child)
+        if child_ids is None:
+            return
+        bad = child_ids.get_indexer(df[self.column].astype(str)) == -1
+        yield f"{self.child}.non_empty", bad, f"no {self.label}"
+
+
+# table -> (csv file, id column reported for offenders, rules)
+RULES = {
+    "recipes": ("recipe.csv", "recipe_id", [
+        Required("recipe_id"),
+        Required("title"),
+        HasChildren("recipe_id", "recipe_ingredients", "ingredients"),
+        HasChildren("recipe_id", "recipe_steps", "steps"),
+        NonNegative("servings"),
+        NonNegative("prep_minutes"),
+        NonNegative("cook_minutes"),
+        NonNegative("total_minutes"),
+        SumEquals("total_minutes", ["prep_minutes", "cook_minutes"]),
+        OneOf("difficulty", ALLOWED_DIFFICULTIES, "difficulty"),
+    ]),
+    "ingredients": ("ingredients.csv", "ingredient_id", [
+        Required("recipe_id"),
+        Required("name", "ingredient name"),
+        NonNegative("quantity"),
+        ForeignKey("recipe_id", "recipes"),
+    ]),
+    "steps": ("steps.csv", "step_id", [
+        Required("recipe_id"),
+        Required("instruction"),
+        ForeignKey("recipe_id", "recipes"),
+    ]),
+    "users": ("users.csv", "user_id", [
+        Required("user_id"),
+    ]),
+    "interactions": ("interactions.csv", "interaction_id", [
+        Required("recipe_id"),
+        Required("type"),
+        OneOf("type", ALLOWED_INTERACTION_TYPES, "type"),
+        Required("user_id"),
+        Matches("timestamp", ISO_TIMESTAMP),
+        InRange("rating", 1, 5),
+        ForeignKey("recipe_id", "recipes"),
+        ForeignKey("user_id", "users"),
+    ]),
+}
+
+
+# ---------------------------------------------------
+# ENGINE
+# ---------------------------------------------------
+
+def _id_index(path, column):
+    if not os.path.exists(path):
+        return None
+    ids = pd.read_csv(path, usecols=[column], dtype=str, keep_default_na=False)[column]
+    return pd.Index(ids.unique())
+
+
+def load_context(csv_dir=CSV_DIR):
+    """Hash indexes of the parent ids the foreign-key rules look up."""
+    return {
+        "recipes": _id_index(os.path.join(csv_dir, "recipe.csv"), "recipe_id"),
+        "users": _id_index(os.path.join(csv_dir, "users.csv"), "user_id"),
+        "recipe_ingredients": _id_index(os.path.join(csv_dir, "ingredients.csv"), "recipe_id"),
+        "recipe_steps": _id_index(os.path.join(csv_dir, "steps.csv"), "recipe_id"),
+    }
+
+
+def check_batch(table, df, ctx):
+    """
+    Evaluates every rule for `table` on the batch `df`.
+    Returns (invalid_mask, [(rule_id, violation_mask, message), ...]).
+    """
+    invalid = np.zeros(len(df), dtype=bool)
+    results = []
+    for rule in RULES[table][2]:
+        for rule_id, mask, message in rule.violations(df, ctx):
+            if isinstance(mask, pd.Series):
+                mask = mask.fillna(False).to_numpy(dtype=bool)
+            if mask.any():
+                invalid |= mask
+                results.append((rule_id, mask, message))
+    return invalid, results
+
+
+def row_problems(df, id_column, results):
+    # Per-row problem lists, in rule order, built for failing rows only
+    per_row = {}
+    for _, mask, message in results:
+        rows = df.index[mask]
+        texts = message(rows) if callable(message) else [message] * len(rows)
+        for row, text in zip(rows, texts):
+            per_row.setdefault(row, []).append(text)
+    return [{id_column: df.at[row, id_column] or None, "problems": per_row[row]} for row in sorted(per_row)]
+
+
+def iter_batches(path, batch_size=BATCH_SIZE):
+    yield from pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=batch_size)
+
+
+# ---------------------------------------------------
+# REPORT
+# ---------------------------------------------------
+# Memory is bounded no matter how many rows fail: the report keeps exact
+# counts per rule and a fixed-size reservoir sample of offending ids, and the
+# full list of failures is only ever streamed to an optional .jsonl file.
+
+def summarize_batch(df, id_column, invalid, results, with_problems=False):
+    """What a ValidationRun keeps of a checked batch: counts, offending ids per rule, row problems."""
+    ids = df[id_column].to_numpy()
+    return {
+        "rows": len(df),
+        "invalid": int(invalid.sum()),
+        "offenders": [(rule_id, ids[mask]) for rule_id, mask, _ in results],
+        "problems": row_problems(df, id_column, results) if with_problems and results else [],
+    }
+
+
+class BatchLog:
+    """
+    Collects batch summaries in place of a ValidationRun (same add_batch()),
+    for worker processes; the parent replays them with ValidationRun.add_summary().
+    """
+    def __init__(self, with_problems=False):
+        self.with_problems = with_problems
+        self.summaries = []
+
+    def add_batch(self, table, df, id_column, invalid, results):
+        self.summaries.append((table, summarize_batch(df, id_column, invalid, results, self.with_problems)))
+
+
+class ValidationRun:
+    def __init__(self, sample_size=SAMPLE_SIZE, failures_path=None, max_errors=None, seed=0):
+        self.sample_size = sample_size
+        self.max_errors = max_errors
+        self.failures_path = failures_path
+        self.tables = {}
+        self.total_invalid = 0
+        self.aborted = False
+        self._rng = np.random.default_rng(seed)
+        self._failures = None
+        if failures_path:
+            os.makedirs(os.path.dirname(failures_path) or ".", exist_ok=True)
+            self._failures = open(failures_path, "w", encoding="utf-8")
+
+    def table(self, name):
+        return self.tables.setdefault(name, {"rows": 0, "valid": 0, "invalid": 0, "violations": {}})
+
+    def add_batch(self, table, df, id_column, invalid, results):
+        self.add_summary(table, summarize_batch(df, id_column, invalid, results, self._failures is not None))
+
+    def add_summary(self, table, summary):
+        """Accounts for a batch from its summarize_batch() summary, e.g. one checked in a worker process."""
+        section = self.table(table)
+        n_invalid = summary["invalid"]
+        section["rows"] += summary["rows"]
+        section["invalid"] += n_invalid
+        section["valid"] += summary["rows"] - n_invalid
+        self.total_invalid += n_invalid
+
+        for rule_id, offenders in summary["offenders"]:
+            entry = section["violations"].setdefault(rule_id, {"count": 0, "sample": []})
+            self._reservoir(entry, offenders)
+        if self._failures is not None:
+            for problem in summary["problems"]:
+                self._failures.write(json.dumps({"table": table, **problem}, ensure_ascii=False) + "\n")
+
+        if self.max_errors is not None and self.total_invalid > self.max_errors:
+            self.aborted = True
+
+    def _reservoir(self, entry, offenders):
+        # Algorithm R, vectorised per batch: item i (0-based, across all batches)
+        # replaces a random slot with probability k / (i + 1)
+        seen, sample, k = entry["count"], entry["sample"], self.sample_size
+        entry["count"] += len(offenders)
+        fill = max(0, min(k - len(sample), len(offenders)))
+        sample.extend(str(x) for x in offenders[:fill])
+        rest = offenders[fill:]
+        if len(rest):
+            positions = np.arange(seen + fill, seen + fill + len(rest))
+            slots = (self._rng.random(len(rest)) * (positions + 1)).astype(np.int64)
+            for i in np.flatnonzero(slots < k):
+                sample[slots[i]] = str(rest[i])
+
+    def close(self):
+        if self._failures is not None:
+            self._failures.close()
+            self._failures = None
+
+    def report(self):
+        report = {}
+        for name, section in self.tables.items():
+            report[f"{name}_valid_count"] = section["valid"]
+            report[f"{name}_invalid_count"] = section["invalid"]
+        report["tables"] = self.tables
+        report["total_invalid"] = self.total_invalid
+        report["sample_size"] = self.sample_size
+        report["aborted"] = self.aborted
+        if self.max_errors is not None:
+            report["max_errors"] = self.max_errors
+        if self.failures_path:
+            report["failures_path"] = self.failures_path
+        return report
+
+
+def validate_table(table, ctx=None, run=None, csv_dir=CSV_DIR, batch_size=BATCH_SIZE):
+    """Validates one table into `run`; returns (valid_count, that table's report section)."""
+    ctx = ctx if ctx is not None else load_context(csv_dir)
+    run = run if run is not None else ValidationRun()
+    filename, id_column, _ = RULES[table]
+    section = run.table(table)
+    with metrics.span(f"validate_{table}") as span:
+        for df in iter_batches(os.path.join(csv_dir, filename), batch_size):
+            if run.aborted:
+                section["aborted"] = True
+                break
+            invalid, results = check_batch(table, df, ctx)
+            run.add_batch(table, df, id_column, invalid, results)
+            span.rows += len(df)
+    return section["valid"], section
+
+
+def as_strings(df):
+    """A typed frame (e.g. a Parquet load) in the all-string form the rules read from CSV."""
+    columns = {}
+    for name in df.columns:
+        col = df[name]
+        if pd.api.types.is_datetime64_any_dtype(col):
+            text = col.dt.strftime("%Y-%m-%dT%H:%M:%S.%f")
+        else:
+            text = col.astype(str)
+        columns[name] = text.where(col.notna(), "")
+    return pd.DataFrame(columns, index=df.index)
+
+
+def frames_context(frames):
+    """load_context() for string frames already in memory, keyed by RULES table name."""
+    def ids(table, column):
+        return pd.Index(frames[table][column].unique()) if table in frames else None
+    return {
+        "recipes": ids("recipes", "recipe_id"),
+        "users": ids("users", "user_id"),
+        "recipe_ingredients": ids("ingredients", "recipe_id"),
+        "recipe_steps": ids("steps", "recipe_id"),
+    }
+
+
+def validate_frames(tables, run=None, batch_size=BATCH_SIZE):
+    """
+    validate_all() for tables already loaded, {RULES table name: DataFrame}, so
+    a caller holding the data in memory does not re-read the CSVs. The frames
+    should hold the text as written: typed frames (a Parquet load) have
+    already turned malformed numbers and timestamps into nulls, which the
+    rules then read as blank rather than invalid.
+    """
+    frames = {name: as_strings(df).reset_index(drop=True) for name, df in tables.items()}
+    ctx = frames_context(frames)
+    run = run if run is not None else ValidationRun()
+    for table in RULES:
+        if table not in frames:
+            continue
+        id_column = RULES[table][1]
+        df = frames[table]
+        with metrics.span(f"validate_{table}", source="memory") as span:
+            for start in range(0, len(df), batch_size):
+                if run.aborted:
+                    run.table(table)["aborted"] = True
+                    break
+                batch = df.iloc[start:start + batch_size]
+                invalid, results = check_batch(table, batch, ctx)
+                run.add_batch(table, batch, id_column, invalid, results)
+                span.rows += len(batch)
+    run.close()
+    return run.report()
+
+
+def validate_recipes(ctx=None, run=None):
+    return validate_table("recipes", ctx, run)
+
+def validate_ingredients(ctx=None, run=None):
+    return validate_table("ingredients", ctx, run)
+
+def validate_steps(ctx=None, run=None):
+    return validate_table("steps", ctx, run)
+
+def validate_users(ctx=None, run=None):
+    return validate_table("users", ctx, run)
+
+def validate_interactions(ctx=None, run=None):
+    return validate_table("interactions", ctx, run)
+
+def validate_all(ctx=None, run=None):
+    ctx = ctx if ctx is not None else load_context()
+    run = run if run is not None else ValidationRun()
+    for validate in (validate_recipes, validate_ingredients, validate_steps,
+                     validate_users, validate_interactions):
+        if run.aborted:
+            break
+        validate(ctx, run)
+    run.close()
+    return run.report()
+
+def write_report(report, path=REPORT_PATH):
+    with open(path, "w", encoding="utf-8") as f:
         json.dump(report, f, indent=2)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Validate the transform CSVs.")
+    parser.add_argument("--sample-size", type=int, default=SAMPLE_SIZE,
+                        help="offending ids kept per rule in the report")
+    parser.add_argument("--failures-out", default=None,
+                        help="stream every failing row to this .jsonl file")
+    parser.add_argument("--max-errors", type=int, default=None,
+                        help="stop validating once more than this many rows are invalid")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    run = ValidationRun(args.sample_size, args.failures_out, args.max_errors)
+    report = validate_all(run=run)
+    write_report(report)
     print("Validation complete. Report:", REPORT_PATH)
+    for name, section in report["tables"].items():
+        print(f"  {name}: {section['valid']} valid, {section['invalid']} invalid")
+    if report["aborted"]:
+        print(f"Error budget of {args.max_errors} invalid rows exceeded — validation stopped early.")
+        sys.exit(1)
@@ -0,0 +1,20 @@
+# conftest.py
+"""
+Shared fixtures. The modules live flat in src/ and read and write
+outputs/... relative to the working directory, so every test runs in its
+own temporary directory. Firestore is the in-process stand-in, never the
+emulator.
+"""
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("FIRESTORE_BACKEND", "memory")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
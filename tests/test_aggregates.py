@@ -0,0 +1,169 @@
+import csv
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+import aggregates
+
+HEADER = ["interaction_id", "recipe_id", "type", "user_id", "timestamp", "rating", "ts_epoch"]
+SOURCE = os.path.join(aggregates.CSV_DIR, "interactions.csv")
+
+
+def rows(start, stop):
+    kinds = ["view", "like", "attempt"]
+    return [[f"i{n}", f"r{n % 7}", kinds[n % 3], f"u{n % 5}", "", str(1 + n % 5) if n % 3 == 2 else "",
+             str(1_700_000_000 + n)] for n in range(start, stop)]
+
+
+def write(rows_, mode="w"):
+    os.makedirs(aggregates.CSV_DIR, exist_ok=True)
+    with open(SOURCE, mode, newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if mode == "w":
+            writer.writerow(HEADER)
+        writer.writerows(rows_)
+
+
+def expected(rows_):
+    df = pd.DataFrame(rows_, columns=HEADER)
+    rating = pd.to_numeric(df["rating"], errors="coerce")
+    return pd.DataFrame({
+        "views": (df["type"] == "view").groupby(df["recipe_id"]).sum(),
+        "likes": (df["type"] == "like").groupby(df["recipe_id"]).sum(),
+        "rating_count": rating.notna().groupby(df["recipe_id"]).sum(),
+        "engagement": df.groupby("recipe_id").size(),
+        "first_seen": df["ts_epoch"].astype(int).groupby(df["recipe_id"]).min(),
+    })
+
+
+def counters():
+    frame = aggregates.load("recipe")
+    return frame[["views", "likes", "rating_count", "engagement", "first_seen"]]
+
+
+def check_counters(rows_):
+    pd.testing.assert_frame_equal(counters(), expected(rows_), check_dtype=False, check_names=False)
+
+
+def meta():
+    conn = aggregates.connect()
+    try:
+        return aggregates._meta(conn)
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    """Counts the bytes refresh() and mark_digests() hash."""
+    counts = {"bytes": 0}
+    hash_range = aggregates._hash_range
+
+    def counting(f, digest, start, end):
+        counts["bytes"] += end - start
+        return hash_range(f, digest, start, end)
+
+    monkeypatch.setattr(aggregates, "_hash_range", counting)
+    return counts
+
+
+def test_refresh_applies_only_appended_rows():
+    write(rows(0, 100))
+    assert aggregates.refresh(chunk_size=30) == 100
+    check_counters(rows(0, 100))
+    assert int(meta()["offset"]) == os.path.getsize(SOURCE)
+
+    assert aggregates.refresh() == 0
+    write(rows(100, 140), mode="a")
+    assert aggregates.refresh(chunk_size=30) == 40
+    check_counters(rows(0, 140))
+    assert int(meta()["offset"]) == os.path.getsize(SOURCE)
+
+
+def test_history_is_kept_per_user():
+    write(rows(0, 20))
+    aggregates.refresh()
+    conn = aggregates.connect()
+    try:
+        history = conn.execute("SELECT interaction_id, rating, ts_epoch FROM history WHERE user_id = 'u2'"
+                               " ORDER BY ts_epoch").fetchall()
+    finally:
+        conn.close()
+    assert history == [("i2", 3.0, 1_700_000_002), ("i7", None, 1_700_000_007),
+                       ("i12", None, 1_700_000_012), ("i17", 3.0, 1_700_000_017)]
+
+
+@pytest.mark.parametrize("change", ["same_length_edit", "truncate", "insert"])
+def test_rewritten_history_is_rebuilt(change):
+    write(rows(0, 50))
+    aggregates.refresh()
+    changed = rows(0, 60)
+    if change == "same_length_edit":
+        changed[10][2] = "like" if changed[10][2] != "like" else "view"
+        changed[10][5] = ""
+    elif change == "truncate":
+        changed = rows(0, 30)
+    else:
+        changed.insert(5, ["inserted", "r1", "view", "u1", "", "", "1700000999"])
+    write(changed)
+    assert aggregates.refresh() == len(changed)
+    check_counters(changed)
+
+
+def test_rebuild_flag():
+    write(rows(0, 50))
+    aggregates.refresh()
+    assert aggregates.refresh(rebuild=True) == 50
+    check_counters(rows(0, 50))
+
+
+def test_marked_file_is_checked_without_rehashing(hashed):
+    write(rows(0, 50))
+    aggregates.refresh()
+    write(rows(50, 80), mode="a")
+    aggregates.mark_digests()
+    hashed["bytes"] = 0
+    assert aggregates.refresh() == 30
+    assert hashed["bytes"] == 0
+    check_counters(rows(0, 80))
+
+
+def test_unmarked_append_falls_back_to_a_full_hash(hashed):
+    write(rows(0, 50))
+    aggregates.mark_digests()
+    aggregates.refresh()
+    offset = os.path.getsize(SOURCE)
+    # Appended after the marks were taken: they no longer describe the file
+    write(rows(50, 60), mode="a")
+    hashed["bytes"] = 0
+    assert aggregates.refresh() == 10
+    assert hashed["bytes"] == offset + os.path.getsize(SOURCE)
+    check_counters(rows(0, 60))
+
+
+def test_stale_marks_do_not_hide_a_rewrite():
+    write(rows(0, 50))
+    aggregates.refresh()
+    aggregates.mark_digests()
+    changed = rows(0, 50)
+    changed[3][2] = "like" if changed[3][2] != "like" else "view"
+    write(changed)
+    assert aggregates.refresh() == 50
+    check_counters(changed)
+
+
+def test_concurrent_refreshes_apply_rows_once():
+    write(rows(0, 200))
+    aggregates.refresh()
+    write(rows(200, 1200), mode="a")
+    applied = []
+    threads = [threading.Thread(target=lambda: applied.append(aggregates.refresh(chunk_size=100)))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(applied) == [0, 0, 0, 1000]
+    check_counters(rows(0, 1200))
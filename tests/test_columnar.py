@@ -0,0 +1,77 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+import columnar  # noqa: E402
+
+RECIPE_CSV = """recipe_id,title,description,servings,prep_minutes,cook_minutes,total_minutes,difficulty,tags,recipe_code
+r1,Soup,,2,10,20,30,easy,,0
+r2,Cake,"sweet, rich",four,5,5,10,medium,dessert,1
+r3,Bread,,,12.5,30,42,hard,,2
+r4,Tea,,1,2,3,5,easy,,
+"""
+USERS_CSV = """user_id,name,joined_at,user_code
+u1,Ann,2024-01-01T10:00:00,0
+u2,Bob,2024-01-01T10:00:00+02:00,1
+u3,Cy,2024-01-01T10:00:00.5Z,2
+u4,Di,last tuesday,3
+u5,Ed,,4
+"""
+
+
+def write_csv(name, text):
+    os.makedirs(columnar.CSV_DIR, exist_ok=True)
+    with open(os.path.join(columnar.CSV_DIR, f"{name}.csv"), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_malformed_numbers_become_null():
+    write_csv("recipe", RECIPE_CSV)
+    # A tiny block size puts the bad cells in some batches only
+    assert columnar.write_table("recipe", block_size=160) == 4
+    frame = columnar.read_table("recipe")
+    assert frame["servings"][0] == 2 and frame["servings"][1:3].isna().all()
+    assert frame["prep_minutes"].tolist() == [10, 5, 12, 2]
+    assert pd.isna(frame["recipe_code"][3])
+    assert frame["description"][1] == "sweet, rich"
+    assert isinstance(frame["difficulty"].dtype, pd.CategoricalDtype)
+
+
+def test_timestamps_are_parsed_to_utc():
+    write_csv("users", USERS_CSV)
+    columnar.write_table("users")
+    joined = columnar.read_table("users")["joined_at"]
+    assert joined[:3].tolist() == [pd.Timestamp("2024-01-01 10:00:00"), pd.Timestamp("2024-01-01 08:00:00"),
+                                   pd.Timestamp("2024-01-01 10:00:00.5")]
+    assert joined[3:].isna().all()
+
+
+@pytest.mark.parametrize("name", ["recipe", "users"])
+def test_from_strings_matches_the_parquet_copy(name):
+    write_csv(name, {"recipe": RECIPE_CSV, "users": USERS_CSV}[name])
+    columnar.write_table(name)
+    strings = pd.read_csv(os.path.join(columnar.CSV_DIR, f"{name}.csv"), dtype=str, keep_default_na=False)
+    pd.testing.assert_frame_equal(columnar.from_strings(name, strings), columnar.read_table(name))
+
+
+def test_write_all_skips_a_table_it_cannot_write(capsys):
+    write_csv("recipe", RECIPE_CSV)
+    write_csv("users", USERS_CSV)
+    columnar.write_all()
+    out = capsys.readouterr().out
+    assert "Warning: skipping" in out and "steps.parquet" in out
+    assert columnar.read_table("recipe") is not None
+    assert not os.path.exists(columnar.table_path("steps") + ".tmp")
+
+
+def test_stale_copy_is_ignored():
+    write_csv("recipe", RECIPE_CSV)
+    columnar.write_table("recipe")
+    assert columnar.read_table("recipe") is not None
+    later = time.time() + 5
+    os.utime(os.path.join(columnar.CSV_DIR, "recipe.csv"), (later, later))
+    assert columnar.read_table("recipe") is None
@@ -0,0 +1,37 @@
+import pytest
+
+import count_docs
+import firestore_local
+
+
+@pytest.fixture
+def client():
+    client = firestore_local.LocalClient(firestore_local.LocalStore())
+    client.collection("recipes").document("r1").set({"title": "Soup"})
+    client.collection("recipes").document("r2").set({"title": "Cake"})
+    client.collection("users").document("u1").set({"name": "Ann"})
+    interactions = client.collection("interactions")
+    for i, (kind, recipe) in enumerate([("view", "r1"), ("view", "r2"), ("like", "r1"), ("share", "r1")]):
+        interactions.document(f"i{i}").set({"type": kind, "recipe_id": recipe, "user_id": "u1"})
+    return client
+
+
+def test_collection_stats(client):
+    stats = count_docs.collection_stats(client, per_recipe=True, profile=True)
+    assert (stats["recipes"], stats["users"], stats["interactions"]) == (2, 1, 4)
+    assert stats["interactions_by_type"] == {"view": 2, "like": 1, "attempt": 0}
+    assert stats["interactions_by_recipe"] == {"r1": 3, "r2": 1}
+    assert stats["profile"]["unexpected_types"] == ["share"]
+    assert "errors" not in stats
+
+
+def test_a_failing_count_is_reported_not_raised(client, monkeypatch, capsys):
+    def broken(client, types=count_docs.INTERACTION_TYPES):
+        raise RuntimeError("aggregation unavailable")
+
+    monkeypatch.setattr(count_docs, "count_by_type", broken)
+    stats = count_docs.collection_stats(client)
+    assert stats["errors"] == {"interactions_by_type": "aggregation unavailable"}
+    assert stats["interactions"] == 4
+    assert "interactions_by_type" not in stats
+    assert "Error reading interactions_by_type" in capsys.readouterr().out
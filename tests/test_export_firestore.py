@@ -0,0 +1,180 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import export_firestore
+import firestore_local
+from export_firestore import WatermarkTracker
+
+LOOKBACK = timedelta(hours=24)
+START = datetime(2024, 1, 1)
+
+
+def doc_id(i):
+    # Spread over the key space like the uuid4 hex ids of real interactions
+    return hashlib.md5(str(i).encode()).hexdigest()
+
+
+def at(hours):
+    return (START + timedelta(hours=hours)).isoformat()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = firestore_local.LocalClient(firestore_local.LocalStore())
+    monkeypatch.setattr(export_firestore, "client", client)
+    return client
+
+
+def add_interactions(client, ids_and_hours):
+    col = client.collection("interactions")
+    for i, hours in ids_and_hours:
+        col.document(doc_id(i)).set({"recipe_id": "r1", "type": "view", "timestamp": at(hours)})
+
+
+def snapshot_ids(name="interactions"):
+    with open(os.path.join(export_firestore.RAW_DIR, f"{name}.jsonl"), encoding="utf-8") as f:
+        return [json.loads(line)["_id"] for line in f]
+
+
+# ---------------------------------------------------
+# WATERMARKS
+# ---------------------------------------------------
+
+def test_tracker_keeps_the_highest_watermark_and_the_window_below_it():
+    tracker = WatermarkTracker(LOOKBACK)
+    tracker.observe("old", at(0))
+    tracker.observe("new", at(48))
+    tracker.observe("recent", at(30))
+    tracker.observe("no_timestamp", None)
+    assert tracker.state() == {"watermark": at(48), "recent": {"new": at(48), "recent": at(30)}}
+
+
+def test_tracker_merge():
+    a, b = WatermarkTracker(LOOKBACK), WatermarkTracker(LOOKBACK)
+    a.observe("x", at(10))
+    b.observe("y", at(20))
+    a.merge(b)
+    assert a.watermark == at(20)
+    assert set(a.recent) == {"x", "y"}
+    a.merge(WatermarkTracker(LOOKBACK))
+    assert a.watermark == at(20)
+
+
+def test_tracker_prunes_as_it_grows():
+    tracker = WatermarkTracker(LOOKBACK)
+    for i in range(5000):
+        tracker.observe(str(i), at(i))
+    # Only the ids at or after the watermark minus the lookback need to be remembered
+    assert len(tracker.recent) < 2100
+    assert set(tracker.state()["recent"]) == {str(i) for i in range(5000 - 25, 5000)}
+
+
+# ---------------------------------------------------
+# INCREMENTAL EXPORT
+# ---------------------------------------------------
+
+def test_incremental_appends_only_unseen_documents(client):
+    add_interactions(client, [(i, i) for i in range(50)])
+    state = {}
+    export_firestore.dump_incremental("interactions", state, LOOKBACK, page_size=7)
+    assert sorted(snapshot_ids()) == sorted(doc_id(i) for i in range(50))
+    assert state["interactions"]["watermark"] == at(49)
+
+    # Nothing new: the lookback window is re-read but every document in it was already exported
+    export_firestore.dump_incremental("interactions", state, LOOKBACK, page_size=7)
+    assert len(snapshot_ids()) == 50
+
+    # A new event and a late one inside the window are appended once, older ones are not
+    add_interactions(client, [(100, 60), (101, 40), (102, 10)])
+    export_firestore.dump_incremental("interactions", state, LOOKBACK, page_size=7)
+    ids = snapshot_ids()
+    assert ids[50:] == [doc_id(101), doc_id(100)]
+    assert state["interactions"]["watermark"] == at(60)
+
+
+def test_incremental_without_state_runs_a_full_refresh(client):
+    add_interactions(client, [(i, i) for i in range(5)])
+    os.makedirs(export_firestore.RAW_DIR)
+    with open(os.path.join(export_firestore.RAW_DIR, "interactions.jsonl"), "w") as f:
+        f.write('{"_id": "stale"}\n')
+    state = {}
+    export_firestore.dump_incremental("interactions", state, LOOKBACK)
+    assert sorted(snapshot_ids()) == sorted(doc_id(i) for i in range(5))
+
+
+# ---------------------------------------------------
+# KEY RANGES
+# ---------------------------------------------------
+
+@pytest.mark.parametrize("partitions", [1, 2, 3, 7, 16, 300])
+def test_key_ranges_cover_the_key_space_in_order(partitions):
+    ranges = export_firestore.key_ranges(partitions)
+    assert ranges[0][0] is None and ranges[-1][1] is None
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    bounds = [end for _, end in ranges[:-1]]
+    assert bounds == sorted(set(bounds))
+    assert len(ranges) == partitions if partitions <= 16 else len(ranges) <= partitions
+
+
+def test_key_ranges_are_evenly_sized():
+    ids = [doc_id(i) for i in range(4000)]
+    counts = [sum(1 for x in ids if (start is None or x >= start) and (end is None or x < end))
+              for start, end in export_firestore.key_ranges(4)]
+    assert sum(counts) == 4000
+    assert min(counts) > 800
+
+
+def test_partitioned_export_matches_the_serial_one(client):
+    add_interactions(client, [(i, i % 100) for i in range(300)])
+    serial = export_firestore.export(incremental=True, page_size=16)
+    serial_ids = snapshot_ids()
+    recipes = snapshot_ids("recipes")
+    partitioned = export_firestore.export(full_refresh=True, page_size=16, workers=3, partitions=5)
+    assert snapshot_ids() == serial_ids
+    assert snapshot_ids("recipes") == recipes
+    assert partitioned == serial
+
+
+def test_partitioned_incremental_matches_the_serial_one(client):
+    add_interactions(client, [(i, i % 100) for i in range(300)])
+    state = export_firestore.export(incremental=True)
+    add_interactions(client, [(i, 80 + i % 50) for i in range(300, 400)])
+
+    serial_state = json.loads(json.dumps(state))
+    export_firestore.dump_incremental("interactions", serial_state, LOOKBACK, page_size=16)
+    serial_ids = snapshot_ids()
+
+    export_firestore.export(full_refresh=True)
+    export_firestore.export(incremental=True, page_size=16, workers=3, partitions=4)
+    partitioned_state = export_firestore.load_state()
+    assert sorted(snapshot_ids()) == sorted(serial_ids)
+    assert partitioned_state["interactions"] == serial_state["interactions"]
+
+    # Everything in the window has been seen: a second run appends nothing
+    export_firestore.export(incremental=True, page_size=16, workers=3, partitions=4)
+    assert len(snapshot_ids()) == 400
+
+
+def test_failed_range_appends_nothing(client, monkeypatch):
+    add_interactions(client, [(i, i % 100) for i in range(300)])
+    export_firestore.export(incremental=True)
+    add_interactions(client, [(i, 120) for i in range(300, 340)])
+    before = snapshot_ids()
+
+    dump_range = export_firestore._dump_incremental_range
+
+    def flaky(name, since, previous, seen, path, lookback, page_size, mode="w", start=None, end=None):
+        result = dump_range(name, since, previous, seen, path, lookback, page_size, mode, start, end)
+        if end is None:
+            raise RuntimeError("range failed")
+        return result
+
+    monkeypatch.setattr(export_firestore, "_dump_incremental_range", flaky)
+    with pytest.raises(RuntimeError):
+        export_firestore.export(incremental=True, workers=2, partitions=3)
+    assert snapshot_ids() == before
+    assert not [p for p in os.listdir(export_firestore.RAW_DIR) if ".part" in p]
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import id_dictionary
+from id_dictionary import MISSING
+
+
+def test_codes_are_dense_in_order_of_first_appearance():
+    ids = id_dictionary.load("recipe")
+    assert [ids.code(v) for v in ["b", "a", "b", 7, "c"]] == [0, 1, 0, 2, 3]
+    assert ids.code(None) == ids.code("") == MISSING
+    assert ids.lookup("a") == 1 and ids.lookup("zzz") == MISSING and ids.lookup(7) == 2
+    assert len(ids) == 4
+    assert ids.codes(["c", "nope", "b"]).tolist() == [3, MISSING, 0]
+    assert ids.decode([3, 0]).tolist() == ["c", "b"]
+
+
+def test_codes_survive_a_reload_and_files_are_only_appended():
+    ids = id_dictionary.load("user")
+    for value in ["u1", "u2"]:
+        ids.code(value)
+    ids.save()
+    again = id_dictionary.load("user")
+    assert again.lookup("u2") == 1
+    again.code("u3")
+    again.code("u1")
+    again.save()
+    again.save()
+    with open(again.path, encoding="utf-8") as f:
+        assert f.read().split() == ["id", "u1", "u2", "u3"]
+    assert id_dictionary.load("user").ids == ["u1", "u2", "u3"]
+
+
+def test_ids_are_kept_as_text():
+    ids = id_dictionary.load("recipe")
+    for value in ["007", "7", "nan", "NA"]:
+        ids.code(value)
+    ids.save()
+    assert id_dictionary.load("recipe").ids == ["007", "7", "nan", "NA"]
+
+
+@pytest.fixture
+def coded():
+    """Rows with codes, one without (-1) and one with a code the dictionary no longer has."""
+    ids = id_dictionary.load("recipe")
+    for value in ["r0", "r1", "r2"]:
+        ids.code(value)
+    frame = pd.DataFrame({
+        "recipe_id": ["r1", "r0", "r1", "r9", "r2", "", "r0"],
+        "recipe_code": ["1", "0", "1", "-1", "7", "", "0"],
+    })
+    return frame, ids
+
+
+def test_reduce_by_codes_matches_grouping_by_id(coded):
+    frame, ids = coded
+    values = np.array([1, 2, 3, 4, 5, 6, 7])
+    seen = np.array([10.0, np.nan, 30.0, 40.0, 50.0, 60.0, 5.0])
+    columns = {"count": (values, "sum"), "first": (seen, "min"), "last": (seen, "max")}
+    by_code = id_dictionary.reduce_by(frame, "recipe", columns, ids)
+    by_id = id_dictionary.reduce_by(frame.drop(columns="recipe_code"), "recipe", columns)
+    pd.testing.assert_frame_equal(by_code.sort_index(), by_id.sort_index(), check_dtype=False)
+    assert by_code.loc["r1", "count"] == 4 and by_code.loc["r0", "first"] == 5.0
+    assert "" not in by_code.index
+
+
+def test_join_matches_mapping_by_id(coded):
+    frame, ids = coded
+    values = pd.Series({"r0": 1.5, "r2": 3.0, "r9": 9.0})
+    joined = id_dictionary.join(frame, "recipe", values, fill=0.0, dictionary=ids)
+    by_id = id_dictionary.join(frame.drop(columns="recipe_code"), "recipe", values, fill=0.0)
+    assert joined.tolist() == by_id.tolist() == [0.0, 1.5, 0.0, 9.0, 3.0, 0.0, 1.5]
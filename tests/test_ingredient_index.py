@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingredient_index
+
+INGREDIENTS = pd.DataFrame({
+    "recipe_id": ["r1", "r1", "r1", "r2", "r2", "r3", "r3", "r3", "r4"],
+    "name": ["Eggs", "Flour", "milk", "egg", "Tomatoes", "eggs ", "flour", "Flour", "Tomato"],
+    "quantity": ["2", "200", "1", "3", "2", "1", "0.5", "100", "1"],
+    "unit": ["", "g", "cup", "pcs", "", "", "kg", "g", "whole"],
+})
+
+
+@pytest.fixture
+def index():
+    return ingredient_index.build_index(INGREDIENTS)
+
+
+def test_canonical_names():
+    names = ["Eggs", "  Green   Beans", "Tomatoes", "berries", "asparagus", "Leaves", "glass", "Swiss"]
+    assert ingredient_index.canonical_names(names).tolist() == [
+        "egg", "green bean", "tomato", "berry", "asparagus", "leaf", "glass", "swiss"]
+
+
+def test_canonical_quantities():
+    quantity, unit = ingredient_index.canonical_quantities(["2", "1", "3", "x", "4"], ["tbsp", "Kg.", "handful", "g", None])
+    assert unit.tolist() == ["ml", "g", "", "g", "pcs"]
+    np.testing.assert_allclose(quantity[[0, 1, 4]], [29.5736, 1000.0, 4.0])
+    assert np.isnan(quantity[2]) and np.isnan(quantity[3])
+
+
+def test_posting_lists(index):
+    assert index.recipes("egg").tolist() == ["r1", "r2", "r3"]
+    assert index.all_of("eggs", "flour").tolist() == ["r1", "r3"]
+    assert index.all_of("egg", "caviar").tolist() == []
+    assert index.any_of("milk", "tomato").tolist() == ["r1", "r2", "r4"]
+
+
+def test_quantities_are_summed_per_recipe_in_canonical_units(index):
+    flour = index.quantity("flour")
+    assert flour.name == "g"
+    assert flour.to_dict() == {"r1": 200.0, "r3": 600.0}
+
+
+def test_frequency_and_cooccurrence(index):
+    frequency = index.frequency()
+    assert frequency.to_dict() == {"egg": 3, "flour": 2, "tomato": 2, "milk": 1}
+    pairs = index.cooccurrence(top=3)
+    assert list(pairs.index) == ["egg", "flour", "tomato"]
+    assert np.diag(pairs).tolist() == [3, 2, 2]
+    assert (pairs.to_numpy() == pairs.to_numpy().T).all()
+    assert pairs.loc["egg", "flour"] == 2 and pairs.loc["flour", "tomato"] == 0
+
+
+def test_engagement(index):
+    engagement = index.engagement(pd.Series({"r1": 10.0, "r2": 20.0, "r4": 40.0}))
+    assert engagement.to_dict() == {"egg": 15.0, "flour": 10.0, "milk": 10.0, "tomato": 30.0}
+
+
+def test_index_is_rebuilt_only_when_the_ingredients_change():
+    first = ingredient_index.ensure_index(INGREDIENTS)
+    mtime = os.path.getmtime(ingredient_index.INDEX_PATH)
+    again = ingredient_index.ensure_index(INGREDIENTS)
+    assert os.path.getmtime(ingredient_index.INDEX_PATH) == mtime
+    assert again.frequency().equals(first.frequency())
+    changed = pd.concat([INGREDIENTS, pd.DataFrame([{"recipe_id": "r4", "name": "salt"}])], ignore_index=True)
+    assert "salt" in ingredient_index.ensure_index(changed).frequency().index
+
+
+def test_popularity_and_cooccurrence_charts(index):
+    # The popularity heatmap stays fed from the frequencies; co-occurrence is its own chart
+    analytics = pytest.importorskip("analytics")
+    os.makedirs(analytics.OUTPUT_CHARTS_DIR, exist_ok=True)
+    analytics.chart_ingredient_heatmap(index.frequency())
+    analytics.chart_ingredient_cooccurrence(index.cooccurrence())
+    for name in ("ingredient_heatmap", "ingredient_cooccurrence"):
+        assert os.path.getsize(analytics.chart_path(name)) > 0
@@ -0,0 +1,101 @@
+import threading
+import tracemalloc
+
+import pytest
+
+import metrics
+
+MB = 2**20
+
+
+@pytest.fixture
+def traced(monkeypatch):
+    monkeypatch.setenv("PIPELINE_TRACEMALLOC", "1")
+    monkeypatch.delenv("PIPELINE_METRICS_PATH", raising=False)
+    monkeypatch.delenv("PIPELINE_PROFILE", raising=False)
+    yield
+    assert not metrics._traced
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def records_by_span():
+    return {r["span"]: r for r in metrics.load_records()}
+
+
+def test_span_record(monkeypatch):
+    monkeypatch.delenv("PIPELINE_METRICS_PATH", raising=False)
+    with metrics.span("outer", stage="test"):
+        with metrics.span("inner") as s:
+            s.rows = 10
+    records = records_by_span()
+    assert records["inner"]["parent"] == "outer"
+    assert records["inner"]["rows"] == 10
+    assert records["outer"]["stage"] == "test"
+    assert records["outer"]["status"] == "ok"
+
+
+def test_failed_span_is_recorded(monkeypatch):
+    monkeypatch.delenv("PIPELINE_METRICS_PATH", raising=False)
+    with pytest.raises(RuntimeError):
+        with metrics.span("broken"):
+            raise RuntimeError("boom")
+    assert records_by_span()["broken"]["status"] == "error"
+
+
+def test_tracing_stops_after_the_last_span_in_any_thread(traced):
+    # A span closing in one thread must not stop tracemalloc under a span still open in another
+    opened, closed = threading.Event(), threading.Event()
+
+    def other():
+        with metrics.span("other"):
+            opened.set()
+            closed.wait(5)
+
+    with metrics.span("main"):
+        worker = threading.Thread(target=other)
+        worker.start()
+        opened.wait(5)
+        assert tracemalloc.is_tracing()
+        closed.set()
+        worker.join()
+        assert tracemalloc.is_tracing()
+        blob = bytearray(4 * MB)
+        del blob
+    assert not tracemalloc.is_tracing()
+    assert records_by_span()["main"]["tracemalloc_peak_mb"] >= 3.9
+
+
+def test_peak_survives_a_reset_from_another_thread(traced):
+    # Another thread's span resets the peak when it opens and closes; the
+    # outer span must still report the allocation it made before that
+    with metrics.span("outer"):
+        blob = bytearray(8 * MB)
+        del blob
+
+        def other():
+            with metrics.span("other"):
+                pass
+
+        worker = threading.Thread(target=other)
+        worker.start()
+        worker.join()
+    records = records_by_span()
+    assert records["outer"]["tracemalloc_peak_mb"] >= 7.9
+    assert records["other"]["tracemalloc_peak_mb"] < 1
+
+
+def test_tracing_started_elsewhere_is_left_running(traced):
+    tracemalloc.start()
+    with metrics.span("inside"):
+        pass
+    assert tracemalloc.is_tracing()
+
+
+def test_regressions_flags_slower_spans():
+    runs = {
+        "r1": {"transform": 1.0, "charts": 2.0},
+        "r2": {"transform": 1.1, "charts": 2.0},
+        "r3": {"transform": 1.6, "charts": 2.01, "new": 5.0},
+    }
+    assert metrics.regressions(runs) == [("transform", 1.1, 1.6)]
@@ -0,0 +1,49 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import benchmark
+import pipeline
+import transform_to_csv
+import validator
+
+MALFORMED_RECIPE = {"_id": "broken", "id": "broken", "title": "Broken", "servings": "four", "prep_minutes": "12x",
+                    "cook_minutes": 5, "total_minutes": 17, "difficulty": "easy",
+                    "ingredients": [{"name": "salt", "quantity": "a pinch", "unit": "tsp"}], "steps": ["Mix"]}
+MALFORMED_INTERACTION = {"_id": "late", "recipe_id": "broken", "user_id": "user_001", "type": "attempt",
+                         "rating": "five", "timestamp": "yesterday"}
+
+
+@pytest.fixture
+def transformed(workdir):
+    """A small dataset with malformed cells, through run_transform; returns the tables it handed over."""
+    benchmark.generate_dataset(str(workdir), 500)
+    for name, doc in (("recipes", MALFORMED_RECIPE), ("interactions", MALFORMED_INTERACTION)):
+        with open(os.path.join(pipeline.RAW_DIR, f"{name}.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(doc) + "\n")
+    os.makedirs(transform_to_csv.CSV_DIR, exist_ok=True)
+    return pipeline.run_transform({})
+
+
+def test_transform_hands_over_the_csv_text(transformed):
+    assert set(transformed) == set(pipeline.TABLES)
+    for table, name in pipeline.TABLES.items():
+        written = pd.read_csv(os.path.join(pipeline.CSV_DIR, f"{name}.csv"), dtype=str, keep_default_na=False)
+        pd.testing.assert_frame_equal(transformed[table].reset_index(drop=True), written, check_dtype=False)
+
+
+def test_validate_on_the_handed_tables_matches_the_csvs(transformed):
+    # The typed (Parquet) frames would read "12x" and "five" as blank, not invalid
+    report = pipeline.run_validate({"transform": transformed})
+    assert report == validator.validate_all()
+    violations = {rule for section in report["tables"].values() for rule in section["violations"]}
+    assert {"prep_minutes.numeric", "servings.numeric", "rating.range", "timestamp.format"} <= violations
+
+
+def test_load_types_the_handed_tables_like_the_parquet_copies(transformed):
+    handed = pipeline.run_load({"transform": transformed})
+    read_back = pipeline.run_load({})
+    for table in pipeline.TABLES:
+        pd.testing.assert_frame_equal(handed[table], read_back[table])
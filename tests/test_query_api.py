@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import benchmark
+import pipeline
+import query_api
+import transform_to_csv
+from query_api import LRUCache, QueryAPI
+
+
+# ---------------------------------------------------
+# CACHE
+# ---------------------------------------------------
+
+def test_cache_evicts_the_least_recently_used_entry():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.put("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.get("c") == (True, 3)
+    assert cache.stats() == {"entries": 2, "bytes": 2, "hits": 3, "misses": 1}
+
+
+def test_cache_is_bounded_by_bytes():
+    cache = LRUCache(max_entries=100, max_bytes=20)
+    cache.put("a", "x" * 8)   # 10 bytes as JSON
+    cache.put("b", "y" * 8)
+    cache.put("c", "z" * 8)
+    assert cache.stats()["bytes"] == 20
+    assert cache.get("a") == (False, None)
+    # Replacing an entry accounts for its old size
+    cache.put("b", "y")
+    assert cache.stats()["bytes"] == 13
+
+
+def test_values_larger_than_the_cache_are_not_stored():
+    cache = LRUCache(max_bytes=10)
+    cache.put("small", 1)
+    assert json.loads(cache.put("big", "x" * 100)) == "x" * 100
+    assert cache.get("big") == (False, None)
+    assert cache.get("small") == (True, 1)
+
+
+def test_cached_values_cannot_be_mutated_by_callers():
+    cache = LRUCache()
+    value = {"ids": [1, 2]}
+    cache.put("k", value)
+    value["ids"].append(3)
+    _, hit = cache.get("k")
+    hit["ids"].append(4)
+    assert cache.get("k") == (True, {"ids": [1, 2]})
+
+
+# ---------------------------------------------------
+# QUERIES
+# ---------------------------------------------------
+
+@pytest.fixture
+def api(workdir):
+    benchmark.generate_dataset(str(workdir), 1000)
+    os.makedirs(transform_to_csv.CSV_DIR, exist_ok=True)
+    pipeline.run_transform({})
+    return QueryAPI()
+
+
+def test_top_matches_the_counters(api):
+    top = api.top("recipe", "engagement", 3)
+    counters = api.counters["recipe"]["engagement"].sort_values(ascending=False, kind="stable")
+    assert [row["engagement"] for row in top] == counters.head(3).tolist()
+    with pytest.raises(ValueError):
+        api.top("recipe", "nope")
+
+
+def test_answers_are_fresh_copies(api):
+    first = api.top("user", "views", 5)
+    first.clear()
+    assert len(api.top("user", "views", 5)) == 5
+    assert api.cache.hits == 1
+
+
+@pytest.mark.parametrize("limit", [0, -1, query_api.MAX_LIMIT + 1])
+def test_history_limit_is_bounded(api, limit):
+    with pytest.raises(ValueError, match="limit"):
+        api.user_history("user_001", limit=limit)
+
+
+def test_history_is_newest_first(api):
+    history = api.user_history("user_001", limit=20)
+    assert 0 < len(history) <= 20
+    stamps = [row["ts_epoch"] for row in history]
+    assert stamps == sorted(stamps, reverse=True)
+
+
+def test_new_transform_output_invalidates_the_cache(api):
+    before = api.recipe("synthetic_001")["engagement"]
+    with open(os.path.join(transform_to_csv.CSV_DIR, "interactions.csv"), "a", encoding="utf-8") as f:
+        f.write("extra,synthetic_001,view,user_001,,,,,,,\n")
+    assert api.recipe("synthetic_001")["engagement"] == before + 1
+
+
+# ---------------------------------------------------
+# HTTP
+# ---------------------------------------------------
+
+@pytest.fixture
+def server(api):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), query_api._handler(api))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_http_status_codes(api, server, monkeypatch):
+    assert get(f"{server}/top?n=2")[0] == 200
+    assert get(f"{server}/recipe/unknown")[0] == 404
+    assert get(f"{server}/nowhere")[0] == 404
+    assert get(f"{server}/user/user_001/history?limit=-1")[0] == 400
+
+    def broken():
+        raise RuntimeError("store unavailable")
+
+    monkeypatch.setattr(api, "stats", broken)
+    assert get(f"{server}/stats") == (500, {"error": "RuntimeError: store unavailable"})
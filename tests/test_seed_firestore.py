@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+from google.api_core import exceptions as gexc
+
+import firestore_local
+import seed_firestore
+from seed_firestore import BatchedWriter
+
+
+class FlakyClient:
+    """A LocalClient whose commits fail with a transient error the first `failures` times."""
+
+    def __init__(self, failures=0, error=gexc.ServiceUnavailable):
+        self.local = firestore_local.LocalClient(firestore_local.LocalStore())
+        self.failures, self.error = failures, error
+        self.lock = threading.Lock()
+
+    def collection(self, name):
+        return self.local.collection(name)
+
+    def batch(self):
+        batch = self.local.batch()
+        commit = batch.commit
+
+        def flaky_commit():
+            with self.lock:
+                failing = self.failures > 0
+                self.failures -= failing
+            if failing:
+                raise self.error("try again")
+            return commit()
+
+        batch.commit = flaky_commit
+        return batch
+
+
+def write_docs(writer, client, count):
+    col = client.collection("docs")
+    for i in range(count):
+        writer.set(col.document(f"d{i:04d}"), {"n": i})
+
+
+def test_batched_writes_retry_transient_errors():
+    client = FlakyClient(failures=3)
+    writer = BatchedWriter(client, batch_size=10, concurrency=2, backoff_seconds=0)
+    write_docs(writer, client, 95)
+    writer.close()
+    assert writer.written == 95
+    assert writer.retries == 3
+    assert len(list(client.collection("docs").stream())) == 95
+
+
+def test_close_shuts_the_pool_down_when_the_last_flush_fails():
+    client = FlakyClient(failures=100)
+    writer = BatchedWriter(client, batch_size=2, concurrency=1, max_retries=0, backoff_seconds=0)
+    write_docs(writer, client, 2)
+    deadline = time.time() + 5
+    while not writer._errors and time.time() < deadline:
+        time.sleep(0.01)
+    # The final flush finds the earlier error and raises it; the pool must still be shut down
+    write_docs(writer, client, 1)
+    with pytest.raises(gexc.ServiceUnavailable):
+        writer.close()
+    assert writer._pool._shutdown
+
+
+def test_batch_size_is_bounded():
+    with pytest.raises(ValueError):
+        BatchedWriter(FlakyClient(), batch_size=seed_firestore.MAX_BATCH_SIZE + 1)
+
+
+def test_import_leaves_the_environment_alone():
+    # benchmark.py imports the generators; that must not point the process at the emulator
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("FIRESTORE_BACKEND", "FIRESTORE_EMULATOR_HOST", "GOOGLE_CLOUD_PROJECT")}
+    src = os.path.dirname(seed_firestore.__file__)
+    code = "import os, seed_firestore; print(os.environ.get('FIRESTORE_EMULATOR_HOST'))"
+    out = subprocess.run([sys.executable, "-c", code], cwd=src, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "None"
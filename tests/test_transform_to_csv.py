@@ -0,0 +1,127 @@
+import json
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import benchmark
+import transform_to_csv
+import validator
+from utils import snapshot_path
+
+RAW_DIR = os.path.join("outputs", "raw_json")
+BAD_INTERACTIONS = [
+    {"_id": "bad-type", "recipe_id": "synthetic_001", "user_id": "user_001", "type": "share",
+     "timestamp": "2024-01-01T00:00:00"},
+    {"_id": "bad-rating", "recipe_id": "synthetic_001", "user_id": "user_001", "type": "attempt",
+     "rating": 9, "timestamp": "2024-01-01T00:00:00"},
+    {"_id": "unknown-recipe", "recipe_id": "nope", "user_id": "user_001", "type": "view",
+     "timestamp": "2024-01-01T00:00:00"},
+]
+
+
+def make_dataset(path, interactions=2000, copies=()):
+    """
+    A seeded snapshot in `path`/outputs/raw_json, with a few invalid
+    interactions mixed in, copied to each of `copies` (the generated ids
+    and timestamps differ between calls).
+    """
+    benchmark.generate_dataset(str(path), interactions)
+    snapshot = path / RAW_DIR / "interactions.jsonl"
+    lines = snapshot.read_text(encoding="utf-8").splitlines(keepends=True)
+    for i, doc in enumerate(BAD_INTERACTIONS, 1):
+        lines.insert(i * len(lines) // 4, json.dumps(doc) + "\n")
+    snapshot.write_text("".join(lines), encoding="utf-8")
+    for copy in copies:
+        shutil.copytree(path / RAW_DIR, copy / RAW_DIR)
+
+
+def transform(workers=1, validate=False, interactions_name="interactions"):
+    # The module creates outputs/csv on import, in whichever directory that was
+    os.makedirs(transform_to_csv.CSV_DIR, exist_ok=True)
+    run = validator.ValidationRun() if validate else None
+    ctx = {}
+    transform_to_csv.normalize_recipes(snapshot_path(RAW_DIR, "recipes"), run, ctx)
+    transform_to_csv.normalize_users(snapshot_path(RAW_DIR, "users"), run, ctx)
+    transform_to_csv.normalize_interactions(snapshot_path(RAW_DIR, interactions_name), run, ctx, workers=workers)
+    return run.report() if run is not None else None
+
+
+def read(path, name):
+    return (path / name).read_bytes()
+
+
+# ---------------------------------------------------
+# SHARD RANGES
+# ---------------------------------------------------
+
+@pytest.mark.parametrize("shards", [1, 2, 3, 7, 50])
+def test_shard_ranges_split_at_line_starts(workdir, shards):
+    lines = [json.dumps({"_id": str(i), "pad": "x" * (i % 13)}) + "\n" for i in range(40)]
+    (workdir / "part.jsonl").write_text("".join(lines), encoding="utf-8")
+    data = (workdir / "part.jsonl").read_bytes()
+    ranges = transform_to_csv.shard_ranges("part.jsonl", shards)
+
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    assert all(start == 0 or data[start - 1:start] == b"\n" for start, _ in ranges)
+    assert 1 <= len(ranges) <= min(shards, len(lines))
+    assert b"".join(data[start:end] for start, end in ranges) == data
+
+
+def test_shard_ranges_of_an_empty_file(workdir):
+    (workdir / "empty.jsonl").write_bytes(b"")
+    assert transform_to_csv.shard_ranges("empty.jsonl", 4) == []
+
+
+# ---------------------------------------------------
+# SHARDED INTERACTIONS
+# ---------------------------------------------------
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_sharded_output_is_identical_to_sequential(workdir, monkeypatch, workers):
+    make_dataset(workdir / "sequential", copies=[workdir / "sharded"])
+    monkeypatch.chdir(workdir / "sequential")
+    expected = transform(validate=True)
+    monkeypatch.chdir(workdir / "sharded")
+    report = transform(workers=workers, validate=True)
+
+    sequential, sharded = workdir / "sequential" / "outputs", workdir / "sharded" / "outputs"
+    # Types are first seen in the workers, so their codes are patched in at the merge
+    for name in ("csv/interactions.csv", "quarantine/interactions.csv", "ids/type.csv"):
+        assert read(sharded, name) == read(sequential, name), name
+    assert report["tables"]["interactions"] == expected["tables"]["interactions"]
+    assert report["interactions_invalid_count"] == len(BAD_INTERACTIONS)
+    assert not os.path.exists(transform_to_csv.SHARD_DIR)
+
+
+def test_sharded_collect_returns_the_merged_rows(workdir):
+    make_dataset(workdir)
+    os.makedirs(transform_to_csv.CSV_DIR)
+    transform_to_csv.normalize_recipes(snapshot_path(RAW_DIR, "recipes"))
+    transform_to_csv.normalize_users(snapshot_path(RAW_DIR, "users"))
+    tables = transform_to_csv.normalize_interactions(snapshot_path(RAW_DIR, "interactions"),
+                                                     workers=2, collect=True)
+    frame = tables["interactions"]
+    assert len(frame) == 2000 + len(BAD_INTERACTIONS)
+    assert list(frame.columns) == transform_to_csv.INTERACTION_HEADERS
+    assert all(pd.api.types.is_string_dtype(dtype) for dtype in frame.dtypes)
+
+
+def test_legacy_json_snapshot_is_not_sharded(workdir, monkeypatch, capsys):
+    make_dataset(workdir / "sequential", copies=[workdir / "legacy"])
+    legacy = workdir / "legacy" / RAW_DIR
+    docs = [json.loads(line) for line in (legacy / "interactions.jsonl").read_text(encoding="utf-8").splitlines()]
+    (legacy / "interactions.jsonl").unlink()
+    (legacy / "interactions.json").write_text(json.dumps(docs), encoding="utf-8")
+
+    monkeypatch.chdir(workdir / "sequential")
+    transform()
+    monkeypatch.chdir(workdir / "legacy")
+    capsys.readouterr()
+    transform(workers=2)
+
+    assert "only .jsonl snapshots can be sharded" in capsys.readouterr().out
+    assert read(workdir / "legacy" / "outputs", "csv/interactions.csv") == \
+        read(workdir / "sequential" / "outputs", "csv/interactions.csv")
@@ -0,0 +1,93 @@
+import io
+import json
+
+import pytest
+
+from utils import iter_json_array, iter_json_records, snapshot_path
+
+DOCS = [
+    {"_id": "a", "title": "Pancakes [v2], \"fluffy\"", "servings": 4, "tags": ["breakfast", "quick"]},
+    {"_id": "b", "rating": 4.5, "views": 123456, "ratio": 1.5e-7, "big": -12345678901234567890},
+    {"_id": "c", "nested": {"steps": [{"n": 1}, {"n": 2}]}, "note": "crème brûlée ☕", "empty": []},
+    0,
+    -0.25,
+    "text",
+    None,
+    True,
+]
+
+
+class CountingReader(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def decode(text, chunk_size):
+    return list(iter_json_array(io.StringIO(text), chunk_size=chunk_size))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 16, 1 << 16])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_matches_json_load_at_every_chunk_size(chunk_size, indent):
+    text = json.dumps(DOCS, indent=indent, ensure_ascii=False)
+    assert decode(text, chunk_size) == DOCS
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 12))
+@pytest.mark.parametrize("number", ["123456", "1.5e-7", "-0.125", "2E+10", "98765432109876543210"])
+def test_number_cut_at_a_chunk_boundary(chunk_size, number):
+    # A number split across reads used to decode as its prefix ("123" of "123456")
+    text = f"[{number}, {number}]"
+    assert decode(text, chunk_size) == [json.loads(number)] * 2
+
+
+def test_empty_array():
+    assert decode("  [ ]\n", 1) == []
+
+
+@pytest.mark.parametrize("text", ["[1, 2,]", "[1,\n]", '[{"a": 1} , ]'])
+def test_trailing_comma_is_rejected(text):
+    with pytest.raises(ValueError, match="trailing"):
+        decode(text, 2)
+
+
+@pytest.mark.parametrize("text, message", [
+    ("[1 2]", "expected ','"),
+    ('{"a": 1}', "expected a JSON array"),
+    ("[1, 2", "unexpected end"),
+    ("", "unexpected end"),
+])
+def test_malformed_arrays_are_rejected(text, message):
+    with pytest.raises(ValueError, match=message):
+        decode(text, 3)
+
+
+def test_truncated_element_is_rejected():
+    with pytest.raises(ValueError):
+        decode('[{"a": 1}, {"b": ', 4)
+
+
+def test_large_element_is_read_in_growing_chunks():
+    # An element spanning many chunks must not cost one read (and re-decode) per chunk
+    element = {"steps": ["x" * 100] * 1000}
+    f = CountingReader(json.dumps([element, element]))
+    assert list(iter_json_array(f, chunk_size=16)) == [element, element]
+    assert f.reads < 40
+
+
+def test_iter_json_records_reads_both_snapshot_formats(workdir):
+    (workdir / "docs.jsonl").write_text("\n".join(json.dumps(d) for d in DOCS[:3]) + "\n\n", encoding="utf-8")
+    (workdir / "docs.json").write_text(json.dumps(DOCS[:3]), encoding="utf-8")
+    assert list(iter_json_records("docs.jsonl")) == DOCS[:3]
+    assert list(iter_json_records("docs.json")) == DOCS[:3]
+
+
+def test_snapshot_path_prefers_jsonl(workdir):
+    assert snapshot_path(str(workdir), "recipes").endswith("recipes.json")
+    (workdir / "recipes.jsonl").write_text("", encoding="utf-8")
+    assert snapshot_path(str(workdir), "recipes").endswith("recipes.jsonl")
@@ -0,0 +1,188 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import validator
+
+RECIPES = pd.DataFrame({
+    "recipe_id": ["r1", "r2", "", "r4"],
+    "title": ["Soup", "", "Cake", "Bread"],
+    "description": ["", "", "", ""],
+    "servings": ["2", "-1", "4", "x"],
+    "prep_minutes": ["10", "5", "5", "5"],
+    "cook_minutes": ["20", "5", "5", "5"],
+    "total_minutes": ["30", "10", "11", "10"],
+    "difficulty": ["Easy", "medium", "extreme", ""],
+    "tags": ["", "", "", ""],
+})
+INGREDIENTS = pd.DataFrame({
+    "ingredient_id": ["i1", "i2", "i3"],
+    "recipe_id": ["r1", "r2", "ghost"],
+    "name": ["salt", "", "flour"],
+    "quantity": ["1", "2.5", "-3"],
+})
+STEPS = pd.DataFrame({
+    "step_id": ["s1", "s2"],
+    "recipe_id": ["r1", "r4"],
+    "instruction": ["Boil", "Bake"],
+})
+USERS = pd.DataFrame({"user_id": ["u1", "u2"]})
+INTERACTIONS = pd.DataFrame({
+    "interaction_id": ["a", "b", "c", "d", "e"],
+    "recipe_id": ["r1", "r1", "nope", "r2", "r1"],
+    "type": ["view", "LIKE", "share", "attempt", ""],
+    "user_id": ["u1", "u2", "u1", "ghost", "u1"],
+    "timestamp": ["2024-01-01T10:00:00", "2024-01-01T10:00:00.123+02:00", "yesterday", "", "2024-01-01T10:00:00Z"],
+    "rating": ["", "", "", "6", "5"],
+})
+TABLES = {"recipes": RECIPES, "ingredients": INGREDIENTS, "steps": STEPS, "users": USERS,
+          "interactions": INTERACTIONS}
+
+
+def failures(table):
+    """{rule_id: [offending ids]} of `table` against the other tables as parents."""
+    df = TABLES[table]
+    ctx = validator.frames_context(TABLES)
+    invalid, results = validator.check_batch(table, df, ctx)
+    id_column = validator.RULES[table][1]
+    found = {rule_id: df[id_column][mask].tolist() for rule_id, mask, _ in results}
+    assert invalid.tolist() == [any(mask[i] for _, mask, _ in results) for i in range(len(df))]
+    return found
+
+
+# ---------------------------------------------------
+# RULES
+# ---------------------------------------------------
+
+def test_recipe_rules():
+    assert failures("recipes") == {
+        "recipe_id.required": [""],
+        "title.required": ["r2"],
+        "recipe_ingredients.non_empty": ["", "r4"],
+        "recipe_steps.non_empty": ["r2", ""],
+        "servings.numeric": ["r4"],
+        "servings.non_negative": ["r2"],
+        "total_minutes.sum": [""],
+        "difficulty.allowed": [""],
+    }
+
+
+def test_ingredient_rules():
+    assert failures("ingredients") == {
+        "name.required": ["i2"],
+        "quantity.non_negative": ["i3"],
+        "recipe_id.foreign_key": ["i3"],
+    }
+
+
+def test_interaction_rules():
+    assert failures("interactions") == {
+        "type.required": ["e"],
+        "type.allowed": ["c"],
+        "timestamp.format": ["c"],
+        "rating.range": ["d"],
+        "recipe_id.foreign_key": ["c"],
+        "user_id.foreign_key": ["d"],
+    }
+
+
+def test_steps_and_users_pass():
+    assert failures("steps") == {}
+    assert failures("users") == {}
+
+
+def test_foreign_keys_are_skipped_without_parents():
+    invalid, results = validator.check_batch("interactions", INTERACTIONS, {})
+    assert "recipe_id.foreign_key" not in {rule_id for rule_id, _, _ in results}
+
+
+def test_row_problems_lists_every_failed_rule():
+    ctx = validator.frames_context(TABLES)
+    _, results = validator.check_batch("interactions", INTERACTIONS, ctx)
+    problems = validator.row_problems(INTERACTIONS, "interaction_id", results)
+    assert problems[0] == {"interaction_id": "c", "problems": [
+        "invalid type: share", "timestamp malformed", "unknown recipe_id: nope"]}
+    assert [p["interaction_id"] for p in problems] == ["c", "d", "e"]
+
+
+def test_validate_all_reads_the_csvs_in_batches():
+    os.makedirs(validator.CSV_DIR)
+    for table, (filename, _, _) in validator.RULES.items():
+        TABLES[table].to_csv(os.path.join(validator.CSV_DIR, filename), index=False)
+    run = validator.ValidationRun()
+    for table in validator.RULES:
+        validator.validate_table(table, validator.load_context(), run, batch_size=2)
+    report = run.report()
+    assert report["recipes_invalid_count"] == 3
+    assert report["interactions_valid_count"] == 2
+    assert report["tables"]["interactions"]["violations"]["type.allowed"] == {"count": 1, "sample": ["c"]}
+    assert report["total_invalid"] == 3 + 2 + 0 + 0 + 3
+
+
+# ---------------------------------------------------
+# REPORT
+# ---------------------------------------------------
+
+def add_offenders(run, batches):
+    for batch in batches:
+        ids = np.asarray(batch, dtype=object)
+        run.add_summary("t", {"rows": len(ids), "invalid": len(ids), "offenders": [("rule", ids)], "problems": []})
+    return run.tables["t"]["violations"]["rule"]
+
+
+def test_reservoir_keeps_exact_counts_and_a_bounded_sample():
+    entry = add_offenders(validator.ValidationRun(sample_size=5), [["a", "b"], ["c"]])
+    assert entry == {"count": 3, "sample": ["a", "b", "c"]}
+
+    ids = [str(i) for i in range(1000)]
+    entry = add_offenders(validator.ValidationRun(sample_size=5), [ids[:3], ids[3:400], ids[400:]])
+    assert entry["count"] == 1000
+    assert len(entry["sample"]) == 5 and len(set(entry["sample"])) == 5
+    assert set(entry["sample"]) <= set(ids)
+
+
+def test_reservoir_sample_is_uniform_across_batches():
+    ids = [str(i) for i in range(50)]
+    batches = [ids[:7], ids[7:8], ids[8:30], ids[30:]]
+    picks = pd.Series(0, index=ids)
+    for seed in range(2000):
+        entry = add_offenders(validator.ValidationRun(sample_size=5, seed=seed), batches)
+        picks[entry["sample"]] += 1
+    # Each id is kept with probability 5/50: 200 times out of 2000 on average
+    assert picks.between(140, 260).all(), picks[~picks.between(140, 260)]
+
+
+def test_reservoir_is_reproducible_for_a_seed():
+    ids = [str(i) for i in range(300)]
+    first = add_offenders(validator.ValidationRun(sample_size=4, seed=7), [ids[:100], ids[100:]])
+    again = add_offenders(validator.ValidationRun(sample_size=4, seed=7), [ids[:100], ids[100:]])
+    assert first == again
+
+
+def test_worker_summaries_replay_into_the_same_report():
+    ctx = validator.frames_context(TABLES)
+    direct, log = validator.ValidationRun(), validator.BatchLog()
+    for start in range(0, len(INTERACTIONS), 2):
+        batch = INTERACTIONS.iloc[start:start + 2]
+        invalid, results = validator.check_batch("interactions", batch, ctx)
+        direct.add_batch("interactions", batch, "interaction_id", invalid, results)
+        log.add_batch("interactions", batch, "interaction_id", invalid, results)
+    replayed = validator.ValidationRun()
+    for table, summary in log.summaries:
+        replayed.add_summary(table, summary)
+    assert replayed.report() == direct.report()
+
+
+def test_failures_file_and_max_errors():
+    run = validator.ValidationRun(failures_path=os.path.join("outputs", "failures.jsonl"), max_errors=2)
+    validator.validate_frames({"interactions": INTERACTIONS, "recipes": RECIPES, "users": USERS}, run, batch_size=2)
+    report = run.report()
+    # Recipes come first; their second batch takes the total past max_errors
+    assert report["aborted"] and report["total_invalid"] == 3
+    assert report["tables"]["interactions"]["aborted"] and report["tables"]["interactions"]["rows"] == 0
+    with open(report["failures_path"], encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f]
+    assert len(lines) == 3
+    assert {"table", "problems"} <= set(lines[0])